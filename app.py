@@ -1,5 +1,6 @@
 import os
-from flask import Flask, jsonify
+import threading
+from flask import Flask, g, jsonify, request
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
@@ -7,11 +8,16 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 from prometheus_client import make_wsgi_app
 from werkzeug.middleware.dispatcher import DispatcherMiddleware
 
-from routes.download_routes import download_bp
+from routes.download_routes import download_bp, init_app as init_downloads
 from routes.info_routes import info_bp
 from routes.analytics_routes import analytics_bp
 from utils.logger import setup_logging
-from utils.metrics import setup_metrics, record_metrics
+from utils.extractor import cache, extraction_flight, warm_up_player_cache
+from utils.extraction_service import extraction_service
+from utils.download_scheduler import download_scheduler
+from utils.cache_manager import CacheableError
+from utils.metrics import setup_metrics, setup_cache_metrics, record_metrics, record_deadline_exceeded
+from utils.deadline import start_request_deadline, end_request_deadline
 from config import config
 
 def create_app(config_name=None):
@@ -28,6 +34,22 @@ def create_app(config_name=None):
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
     
+    # Seleciona o backend de cache (disco, Redis ou memória) conforme CACHE_TYPE
+    cache.init_app(app)
+    extraction_flight.init_app(app)
+    extraction_service.init_app(app)
+    download_scheduler.init_app(app)
+    # Registro de downloads compartilhado entre workers; retoma os interrompidos
+    init_downloads(app)
+    
+    # Carrega o player atual no cache do yt-dlp sem atrasar a inicialização
+    if app.config.get('YTDL_WARMUP'):
+        threading.Thread(
+            target=warm_up_player_cache,
+            args=(app.config['YTDL_WARMUP_VIDEO_ID'],),
+            daemon=True
+        ).start()
+    
     # Configura CORS
     CORS(app, 
          resources={r"/api/*": {"origins": app.config['CORS_ORIGINS']}},
@@ -52,6 +74,7 @@ def create_app(config_name=None):
             '/metrics': make_wsgi_app()
         })
         setup_metrics(app)
+        setup_cache_metrics(cache)
     
     # Registra as blueprints
     app.register_blueprint(download_bp, url_prefix='/api')
@@ -71,11 +94,33 @@ def create_app(config_name=None):
     def ratelimit_handler(e):
         return jsonify({'error': 'Rate limit exceeded'}), 429
     
+    # Falhas de extração (inclusive do cache negativo) com o status da sua classe
+    @app.errorhandler(CacheableError)
+    def cacheable_error_handler(e):
+        return jsonify(e.to_dict()), e.status_code
+    
     # Middleware para métricas
     @app.before_request
     def before_request():
         record_metrics()
     
+    # Prazo da requisição (REQUEST_TIMEOUT), propagado até as extrações
+    @app.before_request
+    def start_deadline():
+        g.deadline_token = start_request_deadline(app.config.get('REQUEST_TIMEOUT'))
+    
+    @app.after_request
+    def count_deadline_exceeded(response):
+        if response.status_code == 504:
+            record_deadline_exceeded(request.endpoint or 'unknown')
+        return response
+    
+    @app.teardown_request
+    def end_deadline(exc):
+        token = g.pop('deadline_token', None)
+        if token is not None:
+            end_request_deadline(token)
+    
     return app
 
 if __name__ == '__main__':
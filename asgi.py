@@ -0,0 +1,34 @@
+"""
+Modo de serviço assíncrono (ASGI)
+
+As conexões ficam no event loop. As extrações das rotas de informação são
+aguardadas no próprio loop, sem ocupar thread; depois a rota roda em um
+pool de threads limitado (ASGI_MAX_IN_FLIGHT), com fila (ASGI_MAX_QUEUE) e
+tempo limite (REQUEST_TIMEOUT). Exemplo:
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000 --workers 2
+"""
+from urllib.parse import parse_qsl
+
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
+
+from app import create_app
+from routes.info_routes import prefetch_request
+from utils.asgi_bridge import AsyncWSGIBridge
+
+app = create_app()
+url_adapter = app.url_map.bind('localhost')
+
+async def prefetch(scope):
+    """Extração de que a rota GET vai precisar, feita antes de ela ocupar uma thread"""
+    if scope['method'] != 'GET':
+        return
+    try:
+        endpoint, view_args = url_adapter.match(scope['path'], method='GET')
+    except HTTPException:
+        return
+    args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+    await prefetch_request(endpoint, view_args, args)
+
+application = AsyncWSGIBridge.from_app(app, prefetch=prefetch)
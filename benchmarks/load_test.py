@@ -0,0 +1,81 @@
+"""
+Teste de carga: requisições lentas concorrentes contra o servidor
+
+Sobe o servidor em cada modo com o mesmo orçamento de concorrência (16
+rotas rodando ao mesmo tempo: 2 workers x 8) e o mesmo motor de extração,
+e dispara o mesmo teste contra ele (gunicorn e uvicorn estão em
+requirements.txt):
+
+    export EXTRACTION_BACKEND=process EXTRACTION_WORKERS=4
+
+    # WSGI: cada requisição ocupa uma das 8 threads do worker do início ao
+    # fim, inclusive enquanto espera pelo yt-dlp
+    gunicorn -w 2 --threads 8 -b 0.0.0.0:5000 'app:create_app()'
+
+    # ASGI: as mesmas 8 threads por worker, mas a espera pelo yt-dlp fica no
+    # event loop e a thread só é ocupada para montar a resposta
+    ASGI_MAX_IN_FLIGHT=8 uvicorn asgi:application --host 0.0.0.0 --port 5000 --workers 2
+
+    python benchmarks/load_test.py -c 100 -n 400 \\
+        --path '/api/info?url=https://www.youtube.com/watch?v={id}&profile=full'
+
+Nos dois modos as extrações simultâneas são limitadas pelo mesmo pool
+(EXTRACTION_WORKERS por worker); o que muda é quantas requisições podem
+esperar por ele sem ocupar uma thread. Para medir a espera pelo upstream e
+não o cache, use vídeos diferentes (--ids) ou CACHE_TYPE=null. Compare a
+vazão e a latência p95 entre os modos; no modo ASGI o excesso recebe
+503/504 rápido em vez de esperar indefinidamente por uma thread.
+"""
+import argparse
+import statistics
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+def fetch(url, timeout):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 'erro'
+    return status, time.perf_counter() - start
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base', default='http://localhost:5000', help='URL base do servidor')
+    parser.add_argument('--path', default='/api/info?url=https://www.youtube.com/watch?v={id}',
+                        help='Caminho da requisição; {id} é trocado por um ID de --ids')
+    parser.add_argument('--ids', default='dQw4w9WgXcQ,jNQXAC9IVRw,9bZkp7q19f0,kJQP7kiw5Fk',
+                        help='IDs de vídeo separados por vírgula, usados em rodízio')
+    parser.add_argument('-c', '--concurrency', type=int, default=50, help='Clientes simultâneos')
+    parser.add_argument('-n', '--requests', type=int, default=200, help='Total de requisições')
+    parser.add_argument('--timeout', type=float, default=120, help='Tempo limite do cliente (segundos)')
+    args = parser.parse_args()
+
+    ids = [i for i in args.ids.split(',') if i]
+    urls = [args.base + args.path.format(id=ids[i % len(ids)]) for i in range(args.requests)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda url: fetch(url, args.timeout), urls))
+    elapsed = time.perf_counter() - start
+
+    statuses = Counter(status for status, _ in results)
+    latencies = sorted(latency for _, latency in results)
+    print(f"requisições: {len(results)}  concorrência: {args.concurrency}  tempo total: {elapsed:.2f}s")
+    print(f"vazão: {len(results) / elapsed:.2f} req/s")
+    print(f"latência: média={statistics.mean(latencies):.3f}s  p50={percentile(latencies, 0.5):.3f}s  "
+          f"p95={percentile(latencies, 0.95):.3f}s  máx={latencies[-1]:.3f}s")
+    print("status: " + ", ".join(f"{status}={count}" for status, count in sorted(statuses.items(), key=str)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Compara a construção de um YoutubeDL por requisição com o reuso via pool
+
+Uso:
+    python benchmarks/ydl_pool_benchmark.py -n 200
+    python benchmarks/ydl_pool_benchmark.py -n 10 --url https://www.youtube.com/watch?v=dQw4w9WgXcQ
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+from config import Config
+from utils.ydl_pool import YoutubeDLPool
+
+def _options():
+    opts = Config.YTDL_OPTIONS.copy()
+    opts.update({'extract_flat': False, 'ignoreerrors': False})
+    return opts
+
+def run_fresh(iterations, url=None):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        with yt_dlp.YoutubeDL(_options()) as ydl:
+            if url:
+                ydl.extract_info(url, download=False)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def run_pooled(iterations, url=None):
+    pool = YoutubeDLPool(max_idle_per_profile=1, max_total=1, max_uses=iterations + 1)
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        with pool.acquire('benchmark', _options()) as ydl:
+            if url:
+                ydl.extract_info(url, download=False)
+        timings.append(time.perf_counter() - start)
+    pool.clear()
+    return timings
+
+def report(name, timings):
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{name:<8} total={sum(timings):8.3f}s  "
+          f"média={statistics.mean(timings) * 1000:8.2f}ms  "
+          f"mediana={statistics.median(timings) * 1000:8.2f}ms  "
+          f"p95={p95 * 1000:8.2f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--iterations', type=int, default=100, help='Requisições simuladas por modo')
+    parser.add_argument('--url', help='Faz uma extração real por requisição (inclui rede)')
+    args = parser.parse_args()
+
+    report('fresh', run_fresh(args.iterations, args.url))
+    report('pooled', run_pooled(args.iterations, args.url))
+
+if __name__ == '__main__':
+    main()
@@ -33,13 +33,99 @@ class Config:
     CACHE_TYPE = 'filesystem'
     CACHE_DIR = 'cache'
     CACHE_DEFAULT_TIMEOUT = 300
-    CACHE_THRESHOLD = 1000
+    CACHE_THRESHOLD = 1000  # Máximo de entradas no cache em memória
+    CACHE_MEMORY_MAX_BYTES = 64 * 1024 * 1024  # 64MB
+    CACHE_COMPRESS_LEVEL = 6  # zlib (0 desabilita a compressão)
+    CACHE_FSYNC = False  # fsync antes do rename nas escritas em disco
+    CACHE_SWEEP_INTERVAL = 300  # Limpeza periódica em segundo plano (0 desabilita)
+    CACHE_SWEEP_BUDGET = 2.0  # Tempo máximo (segundos) de cada limpeza
+    
+    # Stale-while-revalidate: tempo extra em que o valor velho é servido
+    CACHE_INFO_STALE_TTL = 3600  # 1 hora além do TTL de 1 hora
+    CACHE_CHANNEL_STALE_TTL = 21600  # 6 horas além do TTL de 6 horas
+    CACHE_REFRESH_WORKERS = 4
+    CACHE_REFRESH_MAX_PENDING = 32
+    
+    # Cache negativo: TTL (segundos) das falhas de extração por tipo de erro
+    NEGATIVE_CACHE_TTLS = {
+        'unavailable': 3600,
+        'private': 1800,
+        'geo_blocked': 3600,
+        'age_restricted': 3600,
+        'transient': 30
+    }
+    
+    # Configurações de Single-flight (agrupamento de extrações concorrentes)
+    SINGLEFLIGHT_PROCESS_LOCK = False  # Lock entre processos no backend do cache
+    SINGLEFLIGHT_LOCK_TIMEOUT = 60
     
     # Configurações de Download
     DOWNLOAD_DIR = os.path.join(os.getcwd(), 'downloads')
     MAX_DOWNLOAD_SIZE = 1024 * 1024 * 1024  # 1GB
     SUPPORTED_FORMATS = ['mp4', 'webm', 'mp3', 'm4a']
     DEFAULT_FORMAT = 'mp4'
+    # Fila de downloads: workers e tamanho da fila
+    MAX_DOWNLOADS = int(os.getenv('MAX_DOWNLOADS', 5))
+    DOWNLOAD_QUEUE_SIZE = 100
+    # Downloads simultâneos por host de origem (None: só MAX_DOWNLOADS). Todas
+    # as URLs aceitas são do YouTube: um valor aqui limita todos os downloads
+    DOWNLOAD_PER_HOST_LIMIT = None
+    # Registro dos downloads (SQLite); padrão: DOWNLOAD_DIR/tasks.sqlite3
+    DOWNLOAD_TASK_DB = os.getenv('DOWNLOAD_TASK_DB')
+    # Intervalo de gravação do progresso e tempo sem heartbeat para retomar os jobs de um worker
+    DOWNLOAD_PROGRESS_FLUSH_INTERVAL = 1.0
+    DOWNLOAD_ORPHAN_TIMEOUT = 30
+    # Entrega dos arquivos: prefixo do location internal do nginx (X-Accel-Redirect)
+    # apontando para DOWNLOAD_DIR/store; sem ele, o Flask serve o arquivo (via
+    # sendfile só com wsgi.file_wrapper; no modo ASGI os bytes passam pelo Python)
+    DOWNLOAD_ACCEL_REDIRECT = os.getenv('DOWNLOAD_ACCEL_REDIRECT')
+    DOWNLOAD_MAX_RANGES = 16
+    DOWNLOAD_RETRY_AFTER = 30  # Retry-After (segundos) quando a fila está cheia
+    # Prioridade máxima por chave de API (X-API-Key): 'high', 'normal' ou 'low'
+    DOWNLOAD_PRIORITY_API_KEYS = {}
+    # Validade mínima (segundos) das URLs assinadas para baixar a partir da extração em cache
+    DOWNLOAD_URL_EXPIRY_MARGIN = 300
+    
+    # Cache do yt-dlp (funções de assinatura/nsig do player). Pode ficar em um
+    # volume compartilhado entre workers e nós: o yt-dlp grava cada entrada em
+    # um arquivo temporário e renomeia, então escritas concorrentes são seguras
+    YTDL_CACHE_DIR = os.getenv('YTDL_CACHE_DIR', os.path.join(os.getcwd(), 'cache', 'yt-dlp'))
+    # Extração feita na inicialização para carregar o player atual no cache
+    YTDL_WARMUP = True
+    YTDL_WARMUP_VIDEO_ID = os.getenv('YTDL_WARMUP_VIDEO_ID', 'jNQXAC9IVRw')
+    
+    # Opções base do yt-dlp (compartilhadas por todas as extrações)
+    YTDL_OPTIONS = {
+        'quiet': True,
+        'no_warnings': True,
+        'cachedir': YTDL_CACHE_DIR,
+        'http_headers': {
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        }
+    }
+    
+    # Pool de instâncias YoutubeDL reutilizáveis
+    YTDL_POOL_MAX_IDLE = 4  # Instâncias ociosas por perfil
+    YTDL_POOL_MAX_TOTAL = 32  # Instâncias vivas no pool
+    YTDL_POOL_MAX_USES = 200  # Usos antes de reconstruir a instância
+    
+    # Comentários paginados (GET /api/comments)
+    COMMENTS_PAGE_SIZE = 20
+    COMMENTS_MAX_PAGE_SIZE = 100
+    COMMENTS_FETCH_CHUNK = 100  # Primeiro bloco extraído; os seguintes dobram
+    COMMENTS_MAX_TOTAL = 2000  # Máximo de comentários extraídos por vídeo e ordem
+    COMMENTS_CACHE_TTL = 1800
+    
+    # Endpoint em lote (POST /api/info/batch)
+    BATCH_MAX_ITEMS = 100  # Itens por requisição
+    BATCH_CONCURRENCY = 8  # Extrações simultâneas por requisição
+    
+    # Motor de extração: 'thread' (na thread da requisição) ou 'process'
+    # (pool de processos, fora do GIL); o tempo limite é o REQUEST_TIMEOUT
+    EXTRACTION_BACKEND = os.getenv('EXTRACTION_BACKEND', 'thread')
+    EXTRACTION_WORKERS = int(os.getenv('EXTRACTION_WORKERS', 0)) or None  # Padrão: número de CPUs
+    EXTRACTION_MAX_PENDING = 64  # Trabalhos aguardando na fila
+    EXTRACTION_MAX_JOBS_PER_WORKER = 100  # Trabalhos antes de reciclar o processo
     
     # Configurações de Logging
     LOG_LEVEL = 'INFO'
@@ -52,17 +138,29 @@ class Config:
     ENABLE_METRICS = True
     METRICS_PORT = 9090
     
+    # Modo ASGI (asgi.py): rotas rodando em threads ao mesmo tempo, fila e
+    # espera por uma vaga. As extrações são aguardadas no event loop antes
+    # da rota e não contam aqui
+    ASGI_MAX_IN_FLIGHT = int(os.getenv('ASGI_MAX_IN_FLIGHT', 64))
+    ASGI_MAX_QUEUE = 256
+    ASGI_QUEUE_TIMEOUT = 10
+    # Folga sobre REQUEST_TIMEOUT antes do 504 do próprio bridge
+    ASGI_TIMEOUT_GRACE = 5
+    
     # Configurações de Timeout
     REQUEST_TIMEOUT = 30
     DOWNLOAD_TIMEOUT = 3600  # 1 hora
+    # Arquivos sem tarefas que os referenciem são removidos após esse tempo sem acesso
+    DOWNLOAD_STORE_MAX_AGE = 3600
     
     @staticmethod
     def init_app(app):
         """Inicializa a aplicação com configurações base"""
         # Criar diretórios necessários
-        os.makedirs(Config.DOWNLOAD_DIR, exist_ok=True)
-        os.makedirs(Config.CACHE_DIR, exist_ok=True)
-        os.makedirs(Config.LOG_DIR, exist_ok=True)
+        os.makedirs(app.config['DOWNLOAD_DIR'], exist_ok=True)
+        os.makedirs(app.config['CACHE_DIR'], exist_ok=True)
+        os.makedirs(app.config['YTDL_CACHE_DIR'], exist_ok=True)
+        os.makedirs(app.config['LOG_DIR'], exist_ok=True)
 
 class DevelopmentConfig(Config):
     """Configuração de desenvolvimento"""
@@ -100,6 +198,9 @@ class TestingConfig(Config):
     CACHE_DIR = '/tmp/cache'
     LOG_DIR = '/tmp/logs'
     
+    # Sem extração de aquecimento (acesso à rede)
+    YTDL_WARMUP = False
+    
     # Logging mínimo
     LOG_LEVEL = 'ERROR'
     
@@ -124,6 +225,8 @@ class ProductionConfig(Config):
     # Cache distribuído
     CACHE_TYPE = 'redis'
     CACHE_REDIS_URL = os.getenv('REDIS_URL')
+    SINGLEFLIGHT_PROCESS_LOCK = True
+    EXTRACTION_BACKEND = os.getenv('EXTRACTION_BACKEND', 'process')
     
     # Logging mais restrito
     LOG_LEVEL = 'WARNING'
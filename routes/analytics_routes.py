@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request
 from utils.analytics import YouTubeAnalytics
-from utils.validators import validate_url
+from utils.validators import validate_url, validate_video_id
+from utils.cache_manager import CacheableError
 
 analytics_bp = Blueprint('analytics', __name__)
 youtube_analytics = YouTubeAnalytics()
@@ -31,6 +32,8 @@ def get_channel_info():
     try:
         info = youtube_analytics.get_channel_info(channel_url)
         return jsonify(info)
+    except CacheableError as e:
+        return jsonify(e.to_dict()), e.status_code
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -68,6 +71,8 @@ def get_channel_videos():
     try:
         videos = youtube_analytics.get_channel_videos(channel_url, limit)
         return jsonify(videos)
+    except CacheableError as e:
+        return jsonify(e.to_dict()), e.status_code
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -87,15 +92,23 @@ def get_video_metrics(video_id):
         description: Métricas do vídeo obtidas com sucesso
       400:
         description: ID do vídeo inválido
+      403:
+        description: Vídeo privado ou com restrição de idade
+      404:
+        description: Vídeo indisponível
+      451:
+        description: Vídeo bloqueado na região do servidor
       500:
         description: Erro interno do servidor
     """
-    if not video_id:
+    if not validate_video_id(video_id):
         return jsonify({'error': 'ID do vídeo inválido'}), 400
 
     try:
         metrics = youtube_analytics.get_video_metrics(video_id)
         return jsonify(metrics)
+    except CacheableError as e:
+        return jsonify(e.to_dict()), e.status_code
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1,16 +1,34 @@
-from flask import Blueprint, jsonify, request
-from utils.validators import validate_url
+from flask import Blueprint, current_app, jsonify, request, send_file
 import yt_dlp
+from config import Config
+from utils.validators import validate_url, extract_video_id
+from utils.ydl_pool import ydl_pool
+from utils.extractor import get_cached_raw_info
+from utils.deadline import Deadline
+from utils.download_scheduler import download_scheduler, QueueFull, PRIORITIES, DEFAULT_PRIORITY
+from utils.download_manager import track_download_files, remove_partial_files
+from utils.file_store import FileStore
+from utils.task_store import task_store
+from utils.file_delivery import (mimetype_for, content_disposition, requested_ranges,
+                                 single_range_response, multipart_range_response)
+import shutil
+import threading
 import uuid
-from threading import Thread
 import os
 import time
 import random
 
 download_bp = Blueprint('download', __name__)
 
-# Dicionário para armazenar o status dos downloads
-downloads = {}
+# Jobs (um por download real) e tarefas (um por pedido) ficam no task_store,
+# compartilhado entre os workers. Aqui fica só o estado dos jobs deste
+# processo: os pedidos de cancelamento verificados nos hooks do yt-dlp
+cancel_events = {}
+# Arquivos concluídos, endereçados por conteúdo e com referências por tarefa
+# (DOWNLOAD_DIR/store, aberto em init_app)
+file_store = FileStore()
+# Diretórios de trabalho dos jobs (DOWNLOAD_DIR/tmp, definido em init_app)
+work_root = None
 
 def get_random_user_agent():
     user_agents = [
@@ -22,18 +40,65 @@ def get_random_user_agent():
     ]
     return random.choice(user_agents)
 
-def download_video(task_id, url, format_id=None, quality='best'):
+def downloaded_path(ydl, info):
+    """Caminho final do arquivo (após merge/pós-processamento)"""
+    requested = info.get('requested_downloads') or []
+    if requested and requested[-1].get('filepath'):
+        return requested[-1]['filepath']
+    return ydl.prepare_filename(info)
+
+def job_work_dir(job_id):
+    """Diretório de trabalho do job; sobrevive a um reinício para a retomada"""
+    return os.path.join(work_root, job_id)
+
+def finish_job(job_id, status, error=None, stored=None):
+    """Encerra um job e referencia o arquivo pelas tarefas ligadas a ele"""
+    task_ids = task_store.finish_job(job_id, status, error, stored)
+    if stored:
+        for task_id in task_ids:
+            file_store.add_ref(task_id, stored['digest'])
+
+def download_video(job_id, url, key, format_id=None, quality='best', url_expiry_margin=300, timeout=None):
+    deadline = Deadline(timeout) if timeout else None
+    cancel_event = cancel_events.setdefault(job_id, threading.Event())
+    files = set()
+    # Cada job baixa em um diretório próprio: jobs diferentes nunca disputam o mesmo caminho
+    work_dir = job_work_dir(job_id)
+    
+    def check_cancelled(d):
+        # Chamado a cada bloco/fragmento e a cada etapa de pós-processamento
+        track_download_files(files, d)
+        if cancel_event.is_set():
+            raise yt_dlp.utils.DownloadCancelled('Download cancelado')
+        # DOWNLOAD_TIMEOUT
+        if deadline is not None and deadline.expired():
+            raise yt_dlp.utils.DownloadCancelled('Tempo limite do download excedido')
+    
+    def progress_hook(d):
+        check_cancelled(d)
+        update_progress(job_id, d)
+    
     try:
-        downloads[task_id]['status'] = 'downloading'
+        if not task_store.set_status(job_id, 'downloading', ('queued',)):
+            # Cancelado por outro worker antes de sair da fila
+            finish_job(job_id, 'cancelled')
+            return
         
         ydl_opts = {
             'format': f'{format_id}' if format_id else f'{quality}',
-            'outtmpl': f'downloads/%(title)s-%(id)s.%(ext)s',
-            'progress_hooks': [lambda d: update_progress(task_id, d)],
+            # O diretório do job vai em 'paths', aplicado por chamada: o modelo
+            # fica constante e não fragmenta o pool de YoutubeDL
+            'outtmpl': '%(title)s-%(id)s.%(ext)s',
+            'paths': {'home': work_dir},
             'quiet': True,
             'no_warnings': True,
+            # quiet não esconde a barra de progresso; o progresso vai para /api/status
+            'noprogress': True,
             'extract_flat': False,
             'nocheckcertificate': True,
+            # Um job retomado após reinício continua dos .part no work_dir
+            'continuedl': True,
+            'cachedir': Config.YTDL_CACHE_DIR,
             'http_headers': {
                 'User-Agent': get_random_user_agent(),
                 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
@@ -43,62 +108,175 @@ def download_video(task_id, url, format_id=None, quality='best'):
             }
         }
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Primeiro extrai as informações para verificar se o vídeo está disponível
+        with ydl_pool.acquire('download', ydl_opts) as ydl:
+            # O hook é adicionado após o checkout; o pool o remove na devolução
+            ydl.add_progress_hook(progress_hook)
+            ydl.add_postprocessor_hook(check_cancelled)
+            
+            # Uma única extração por download: se /api/info já extraiu o vídeo e
+            # as URLs assinadas ainda valem, vai direto à seleção de formato
             try:
-                info = ydl.extract_info(url, download=False)
+                info = None
+                cached_info = get_cached_raw_info(url, url_expiry_margin)
+                if cached_info:
+                    try:
+                        info = ydl.process_ie_result(cached_info, download=True)
+                    except yt_dlp.utils.DownloadError as e:
+                        # URL revogada antes do prazo: refaz a extração
+                        print(f"Cached info failed for job {job_id}, re-extracting: {str(e)}")
+                
+                if info is None:
+                    info = ydl.extract_info(url, download=True)
                 if not info:
                     raise Exception("Não foi possível obter informações do vídeo")
                 
-                # Se chegou aqui, o vídeo está disponível, então faz o download
-                info = ydl.extract_info(url, download=True)
-                downloads[task_id]['filename'] = ydl.prepare_filename(info)
-                downloads[task_id]['status'] = 'completed'
-                downloads[task_id]['error'] = None
+                path = downloaded_path(ydl, info)
                 
+            except yt_dlp.utils.DownloadCancelled:
+                raise
             except Exception as e:
                 raise Exception(f"Erro ao extrair informações: {str(e)}")
+        
+        video_id, fmt = key
+        stored = file_store.put(video_id, fmt, path, name=os.path.basename(path))
+        finish_job(job_id, 'completed', stored=stored)
             
+    except yt_dlp.utils.DownloadCancelled as e:
+        # Libera o worker imediatamente e não deixa .part/.ytdl para trás
+        remove_partial_files(files)
+        if cancel_event.is_set():
+            finish_job(job_id, 'cancelled')
+        else:
+            finish_job(job_id, 'error', str(e))
     except Exception as e:
-        downloads[task_id]['status'] = 'error'
-        downloads[task_id]['error'] = str(e)
-        print(f"Download error for task {task_id}: {str(e)}")
+        finish_job(job_id, 'error', str(e))
+        print(f"Download error for job {job_id}: {str(e)}")
+    finally:
+        cancel_events.pop(job_id, None)
+        shutil.rmtree(work_dir, ignore_errors=True)
 
-def update_progress(task_id, d):
+def update_progress(job_id, d):
     if d['status'] == 'downloading':
         try:
             total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
             downloaded = d.get('downloaded_bytes', 0)
             
-            downloads[task_id]['progress'] = {
+            task_store.set_progress(job_id, {
                 'downloaded_bytes': downloaded,
                 'total_bytes': total,
                 'speed': d.get('speed', 0),
                 'eta': d.get('eta', 0),
                 'percentage': (downloaded / total * 100) if total > 0 else 0
-            }
+            })
         except Exception as e:
-            print(f"Error updating progress for task {task_id}: {str(e)}")
+            print(f"Error updating progress for job {job_id}: {str(e)}")
 
 def cleanup_old_downloads():
-    current_time = time.time()
-    to_remove = []
+    """
+    Descarta tarefas com mais de 1 hora e os jobs sem tarefas
+    
+    A tarefa descartada solta a referência ao arquivo; o arquivo só é
+    apagado pelo FileStore quando nenhuma tarefa o referencia e ele não é
+    acessado há DOWNLOAD_STORE_MAX_AGE segundos.
+    """
+    try:
+        for task_id in task_store.expire_tasks(3600):
+            file_store.release(task_id)
+        file_store.cleanup(current_app.config.get('DOWNLOAD_STORE_MAX_AGE', 3600))
+    except Exception as e:
+        print(f"Error cleaning up downloads: {str(e)}")
+
+def submit_job(job_id, job, config):
+    """Coloca um job deste processo na fila de downloads"""
+    key = (job['video_id'], job['format'])
+    url_expiry_margin = config.get('DOWNLOAD_URL_EXPIRY_MARGIN', 300)
+    timeout = config.get('DOWNLOAD_TIMEOUT')
+    cancel_events[job_id] = threading.Event()
+    try:
+        return download_scheduler.submit(
+            job_id,
+            lambda: download_video(job_id, job['url'], key, job['format_id'], job['quality'],
+                                   url_expiry_margin, timeout),
+            job['url'], job['priority']
+        )
+    except QueueFull:
+        cancel_events.pop(job_id, None)
+        raise
+
+def cancel_job(job_id):
+    """
+    Cancela um job deste processo
+    
+    Returns:
+        bool: True se o job ainda estava na fila e já foi cancelado
+    """
+    if download_scheduler.remove(job_id):
+        # Ainda não começou: basta retirar da fila
+        cancel_events.pop(job_id, None)
+        finish_job(job_id, 'cancelled')
+        return True
+    # O download para no próximo bloco; a thread remove os arquivos parciais
+    # e passa o status para 'cancelled'
+    task_store.set_status(job_id, 'cancelling', ('queued', 'downloading'))
+    cancel_events.setdefault(job_id, threading.Event()).set()
+    return False
+
+def resume_job(job, config):
+    """Retoma um job interrompido (reinício ou worker morto)"""
+    job_id = job['job_id']
+    if job['status'] == 'cancelling' or job['cancel_requested']:
+        shutil.rmtree(job_work_dir(job_id), ignore_errors=True)
+        finish_job(job_id, 'cancelled')
+        return
+    task_store.set_status(job_id, 'queued')
+    try:
+        submit_job(job_id, job, config)
+        print(f"Resumed download job {job_id}")
+    except QueueFull:
+        # Fila cheia: outro processo (ou este, depois) retoma o job
+        task_store.release_job(job_id)
+
+def sync_jobs(config):
+    """
+    Sincroniza os jobs deste processo com o task_store (thread do task_store)
     
-    for task_id, info in downloads.items():
-        # Remove downloads mais antigos que 1 hora
-        if current_time - info.get('start_time', current_time) > 3600:
-            to_remove.append(task_id)
+    Aplica os cancelamentos pedidos em outros workers, publica as posições
+    na fila e assume os jobs órfãos.
+    """
+    for job_id in task_store.cancel_requests():
+        cancel_job(job_id)
     
-    for task_id in to_remove:
-        try:
-            if downloads[task_id].get('filename'):
-                try:
-                    os.remove(downloads[task_id]['filename'])
-                except:
-                    pass
-            del downloads[task_id]
-        except:
-            pass
+    positions = {}
+    for job_id in list(cancel_events):
+        position = download_scheduler.position(job_id)
+        if position is not None:
+            positions[job_id] = position
+    task_store.set_queue_positions(positions)
+    
+    for job in task_store.claim_orphans():
+        resume_job(job, config)
+
+def init_app(app):
+    """Abre o registro e o armazenamento de downloads e retoma os jobs interrompidos"""
+    global work_root
+    # Work dirs e store na mesma árvore: o arquivo concluído é movido, não copiado
+    work_root = os.path.join(app.config['DOWNLOAD_DIR'], 'tmp')
+    file_store.init_app(app)
+    task_store.init_app(app)
+    task_store.start(lambda: sync_jobs(app.config))
+
+def resolve_priority(requested):
+    """
+    Prioridade efetiva do download
+    
+    A chave de API (X-API-Key, em DOWNLOAD_PRIORITY_API_KEYS) define o nível
+    máximo do cliente; o campo "priority" do pedido só pode baixá-lo.
+    """
+    api_keys = current_app.config.get('DOWNLOAD_PRIORITY_API_KEYS', {})
+    allowed = api_keys.get(request.headers.get('X-API-Key'), DEFAULT_PRIORITY)
+    if requested not in PRIORITIES:
+        return allowed
+    return max(allowed, requested, key=PRIORITIES.get)
 
 @download_bp.route('/download', methods=['POST'])
 def start_download():
@@ -117,46 +295,149 @@ def start_download():
         return jsonify({'error': 'URL inválida'}), 400
     
     task_id = str(uuid.uuid4())
-    downloads[task_id] = {
-        'status': 'pending',
+    video_id = extract_video_id(url) or url
+    fmt = format_id or quality
+    
+    # Arquivo já baixado: a tarefa recebe uma referência a ele
+    stored = file_store.lookup(video_id, fmt)
+    job = {
+        'job_id': str(uuid.uuid4()),
         'url': url,
-        'progress': {},
-        'filename': None,
-        'error': None,
+        'video_id': video_id,
+        'format': fmt,
+        'format_id': format_id,
+        'quality': quality,
+        'priority': resolve_priority(data.get('priority')),
+        'status': 'completed' if stored else 'queued',
+        'filename': stored and stored['path'],
+        'download_name': stored and stored['name'],
         'start_time': time.time()
     }
     
-    # Inicia o download em uma thread separada
-    thread = Thread(target=download_video, args=(task_id, url, format_id, quality))
-    thread.daemon = True
-    thread.start()
+    # Mesmo vídeo e formato já na fila ou baixando (em qualquer worker):
+    # a tarefa acompanha esse job
+    job_id, created = task_store.open_task(task_id, job)
+    if not created:
+        return jsonify({
+            'message': 'Download já em andamento',
+            'task_id': task_id
+        }), 202
+    
+    if stored:
+        file_store.add_ref(task_id, stored['digest'])
+        return jsonify({
+            'message': 'Download concluído',
+            'task_id': task_id
+        }), 200
+    
+    # Coloca o download na fila; os workers do scheduler limitam a concorrência
+    try:
+        position = submit_job(job_id, job, current_app.config)
+    except QueueFull:
+        task_store.delete_job(job_id)
+        retry_after = current_app.config.get('DOWNLOAD_RETRY_AFTER', 30)
+        response = jsonify({'error': 'Fila de downloads cheia, tente novamente mais tarde'})
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 503
     
     return jsonify({
-        'message': 'Download iniciado',
-        'task_id': task_id
+        'message': 'Download na fila',
+        'task_id': task_id,
+        'queue_position': position
     }), 202
 
 @download_bp.route('/status/<task_id>', methods=['GET'])
 def get_status(task_id):
-    if task_id not in downloads:
+    task = task_store.get_task(task_id)
+    if task is None:
         return jsonify({'error': 'Download não encontrado'}), 404
-        
-    return jsonify(downloads[task_id])
+    
+    status = {k: task[k] for k in ('task_id', 'status', 'url', 'priority', 'progress', 'filename',
+                                   'download_name', 'error', 'start_time', 'shared_by')}
+    if task['task_status'] and not task['cancel_requested']:
+        # Esta tarefa foi cancelada, mas o job continua para as demais. Se
+        # era a última, vale o status do job (cancelling, depois cancelled)
+        status['status'] = task['task_status']
+    elif status['status'] == 'queued':
+        # No dono do job a posição é exata; nos demais workers, a última publicada
+        position = None
+        if task['owner'] == task_store.owner:
+            position = download_scheduler.position(task['job_id'])
+        status['queue_position'] = position or task['queue_position']
+    return jsonify(status)
 
 @download_bp.route('/cancel/<task_id>', methods=['POST'])
 def cancel_download(task_id):
-    if task_id not in downloads:
+    task = task_store.get_task(task_id)
+    if task is None:
         return jsonify({'error': 'Download não encontrado'}), 404
-        
-    if downloads[task_id]['status'] == 'downloading':
-        # Tenta cancelar o download removendo o arquivo parcial
-        if downloads[task_id].get('filename'):
-            try:
-                os.remove(downloads[task_id]['filename'])
-            except:
-                pass
-        
-        downloads[task_id]['status'] = 'cancelled'
+    
+    remaining = task_store.detach_task(task_id)
+    if remaining is None:
+        return jsonify({'error': 'Download não pode ser cancelado'}), 400
+    if remaining:
+        # Outras tarefas ainda aguardam o mesmo job
         return jsonify({'message': 'Download cancelado'})
+    
+    # Job de outro worker: o dono o interrompe na próxima sincronização
+    if task['owner'] == task_store.owner and cancel_job(task['job_id']):
+        return jsonify({'message': 'Download cancelado'})
+    return jsonify({'message': 'Cancelamento solicitado'}), 202
+
+@download_bp.route('/file/<task_id>', methods=['GET'])
+def get_file(task_id):
+    task = task_store.get_task(task_id)
+    if task is None:
+        return jsonify({'error': 'Download não encontrado'}), 404
+    if task['task_status'] or task['status'] != 'completed':
+        return jsonify({'error': 'Download não concluído', 'status': task['task_status'] or task['status']}), 409
+    
+    path = task['filename']
+    if not path or not os.path.isfile(path):
+        return jsonify({'error': 'Arquivo não está mais disponível'}), 410
+    
+    # O nome do arquivo no store é o SHA-256 do conteúdo: serve de ETag forte
+    digest = os.path.splitext(os.path.basename(path))[0]
+    file_store.touch(digest)
+    mimetype = mimetype_for(path)
+    download_name = task['download_name'] or os.path.basename(path)
+    
+    # Com DOWNLOAD_ACCEL_REDIRECT, o nginx serve o arquivo (sendfile, Range e
+    # condicionais) a partir de um location internal que aponta para o store
+    accel_prefix = current_app.config.get('DOWNLOAD_ACCEL_REDIRECT')
+    if accel_prefix:
+        response = current_app.response_class(mimetype=mimetype)
+        relative = os.path.relpath(path, file_store.root).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{relative}"
+        response.headers['Content-Disposition'] = content_disposition(download_name)
+        response.set_etag(digest)
+        return response.make_conditional(request)
+    
+    stat = os.stat(path)
+    ranges = requested_ranges(request, digest, stat.st_size, stat.st_mtime,
+                              current_app.config.get('DOWNLOAD_MAX_RANGES', 16))
+    if ranges is None:
+        # Arquivo inteiro (ou 304): send_file usa o wsgi.file_wrapper, que
+        # no gunicorn envia via sendfile. O Range já foi decidido acima; o
+        # Werkzeug não o reprocessa (atenderia o Range antes do If-None-Match)
+        response = send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name,
+                             conditional=False)
+        response.set_etag(digest)
+        response.make_conditional(request, accept_ranges=False, complete_length=stat.st_size)
+        response.accept_ranges = 'bytes'
+        return response
+    
+    if not ranges:
+        response = jsonify({'error': 'Intervalo inválido'})
+        response.headers['Content-Range'] = f'bytes */{stat.st_size}'
+        return response, 416
+    
+    if len(ranges) == 1:
+        response = single_range_response(request.environ, path, *ranges[0], stat.st_size, mimetype)
     else:
-        return jsonify({'error': 'Download não pode ser cancelado'}), 400
+        response = multipart_range_response(path, ranges, stat.st_size, mimetype)
+    response.set_etag(digest)
+    response.last_modified = stat.st_mtime
+    response.accept_ranges = 'bytes'
+    response.headers['Content-Disposition'] = content_disposition(download_name)
+    return response
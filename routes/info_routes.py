@@ -1,39 +1,21 @@
-from flask import Blueprint, jsonify, request
-from utils.validators import validate_url
-import yt_dlp
-from utils.cache_manager import CacheManager
+import base64
+import binascii
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from utils.validators import validate_url, validate_video_id, extract_video_id
+from utils.cache_manager import CacheableError
+from utils.deadline import DeadlineExceeded, current_deadline, deadline_scope
+from utils.transcripts import choose_track, fetch_transcript, select_range, to_segments, to_srt, to_text
+from utils.extractor import (
+    cache, get_yt_info, get_raw_video_info, prefetch_raw_video_info, resolve_cache_id, get_video_comments,
+    EXTRACTION_PROFILES, DEFAULT_PROFILE, PROFILE_RANK, PROFILE_ALIASES, COMMENT_SORTS, resolve_profile
+)
+from utils.analytics import build_video_metrics
+from utils.projection import parse_fields, project
 from datetime import datetime
 
 info_bp = Blueprint('info', __name__)
-cache = CacheManager()
-
-def get_yt_info(url, extract_subtitles=False):
-    ydl_opts = {
-        'quiet': True,
-        'no_warnings': True,
-        'extract_flat': False,  # Mudado para False para obter todos os dados
-        'writesubtitles': extract_subtitles,
-        'writeautomaticsub': extract_subtitles,
-        'subtitleslangs': ['en', 'pt', 'es'],
-        'get_all_subtitles': True,
-        'writethumbnail': True,
-        'writeinfojson': True,
-        'writedescription': True,
-        'writecomments': True,
-        'getcomments': True,
-        'ignoreerrors': True,
-        'http_headers': {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        }
-    }
-    
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        try:
-            info = ydl.extract_info(url, download=False)
-            return info
-        except Exception as e:
-            print(f"Error extracting info: {str(e)}")
-            return None
 
 def format_duration(seconds):
     if not seconds:
@@ -53,23 +35,9 @@ def format_date(date_str):
     except:
         return date_str
 
-@info_bp.route('/info', methods=['GET'])
-def get_video_info():
-    url = request.args.get('url')
-    if not url or not validate_url(url):
-        return jsonify({'error': 'URL inválida'}), 400
-    
-    # Tenta obter do cache primeiro
-    cached_info = cache.get(f'info_{url}')
-    if cached_info:
-        return jsonify(cached_info)
-    
-    info = get_yt_info(url)
-    if not info:
-        return jsonify({'error': 'Não foi possível obter informações do vídeo'}), 500
-    
+def build_video_info(info):
     # Extrai todos os dados possíveis do vídeo
-    video_info = {
+    return {
         # Informações Básicas
         'id': info.get('id'),
         'title': info.get('title'),
@@ -171,9 +139,6 @@ def get_video_info():
         'playlist_title': info.get('playlist_title'),
         'playlist_index': info.get('playlist_index'),
         
-        # Comentários (se disponíveis)
-        'comments': info.get('comments', []),
-        
         # URLs relacionadas
         'related_videos': [{
             'id': v.get('id'),
@@ -203,10 +168,218 @@ def get_video_info():
             'url': f.get('url')
         } for f in info.get('formats', [])]
     }
+
+def info_cache_key(url, profile):
+    return f'info_{resolve_cache_id(url)}_{profile}'
+
+def load_video_info(url, profile, stale_for=0):
+    """
+    Obtém o registro de /info de um vídeo (sem projeção)
     
-    # Cache por 1 hora
-    cache.set(f'info_{url}', video_info, 3600)
-    return jsonify(video_info)
+    Cache por 1 hora (chave canônica: ID do vídeo e perfil); depois disso o
+    valor velho ainda é servido enquanto é revalidado em segundo plano.
+    Não depende do contexto da aplicação, para poder rodar em outras threads.
+    """
+    def load():
+        info = get_raw_video_info(url, profile)
+        return build_video_info(info) if info else None
+    
+    return cache.get_or_set(info_cache_key(url, profile), load, 3600, stale_for=stale_for)
+
+def cached_video_info_any_profile(url, profile):
+    """
+    Registro de /info já em cache com outro perfil, para respostas parciais
+    
+    Prefere perfis mais completos; retorna (perfil, valor) ou None.
+    """
+    for other in sorted(EXTRACTION_PROFILES, key=PROFILE_RANK.get, reverse=True):
+        if other == profile:
+            continue
+        value = cache.get(info_cache_key(url, other))
+        if value:
+            return other, value
+    return None
+
+@info_bp.route('/info', methods=['GET'])
+def get_video_info():
+    url = request.args.get('url')
+    if not url or not validate_url(url):
+        return jsonify({'error': 'URL inválida'}), 400
+    
+    fields = parse_fields(request.args.get('fields'))
+    exclude = parse_fields(request.args.get('exclude'))
+    
+    # Comentários não fazem parte de /info: use /api/comments
+    profile = resolve_profile(request.args.get('profile', DEFAULT_PROFILE))
+    if profile is None:
+        return jsonify({'error': f'Perfil inválido. Use: {", ".join([*EXTRACTION_PROFILES, *PROFILE_ALIASES])}'}), 400
+    
+    try:
+        video_info = load_video_info(url, profile, current_app.config.get('CACHE_INFO_STALE_TTL', 0))
+    except DeadlineExceeded as e:
+        # Prazo excedido: devolve o que houver em cache com outro perfil
+        body = e.to_dict()
+        partial = cached_video_info_any_profile(url, profile)
+        if partial:
+            body.update({'partial': True, 'profile': partial[0], 'data': project(partial[1], fields, exclude)})
+        return jsonify(body), e.status_code
+    if not video_info:
+        return jsonify({'error': 'Não foi possível obter informações do vídeo'}), 500
+    
+    # O cache guarda o registro completo; a projeção é aplicada antes da serialização
+    return jsonify(project(video_info, fields, exclude))
+
+@info_bp.route('/info/batch', methods=['POST'])
+def get_video_info_batch():
+    """
+    Informações de vários vídeos em uma requisição, em NDJSON
+    
+    Acertos do cache são enviados imediatamente; os demais vídeos são
+    extraídos em paralelo (até BATCH_CONCURRENCY) e cada linha é enviada
+    assim que fica pronta, marcada com o índice da entrada.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('urls')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Informe uma lista de URLs ou IDs em "urls"'}), 400
+    
+    max_items = current_app.config.get('BATCH_MAX_ITEMS', 100)
+    if len(items) > max_items:
+        return jsonify({'error': f'Máximo de {max_items} itens por requisição'}), 400
+    
+    fields = parse_fields(data.get('fields'))
+    exclude = parse_fields(data.get('exclude'))
+    profile = resolve_profile(data.get('profile', DEFAULT_PROFILE))
+    if profile is None:
+        return jsonify({'error': f'Perfil inválido. Use: {", ".join([*EXTRACTION_PROFILES, *PROFILE_ALIASES])}'}), 400
+    
+    stale_for = current_app.config.get('CACHE_INFO_STALE_TTL', 0)
+    concurrency = current_app.config.get('BATCH_CONCURRENCY', 8)
+    item_timeout = current_app.config.get('REQUEST_TIMEOUT', 30)
+    
+    def load_item(url):
+        # Cada item tem o seu próprio prazo, contado a partir do início da extração
+        with deadline_scope(item_timeout):
+            return load_video_info(url, profile, stale_for)
+    
+    def line(index, item, status, body):
+        return json.dumps({'index': index, 'input': item, 'status': status, **body}) + '\n'
+    
+    def result_lines(indices, value):
+        value = project(value, fields, exclude)
+        return ''.join(line(i, items[i], 200, {'data': value}) for i in indices)
+    
+    def error_lines(indices, error):
+        if isinstance(error, CacheableError):
+            status, body = error.status_code, error.to_dict()
+        else:
+            status, body = 500, {'error': str(error)}
+        return ''.join(line(i, items[i], status, body) for i in indices)
+    
+    def generate():
+        # Agrupa entradas repetidas (mesmo vídeo em grafias diferentes)
+        pending = {}
+        for index, item in enumerate(items):
+            if not isinstance(item, str) or not (extract_video_id(item) or validate_url(item)):
+                yield line(index, item, 400, {'error': 'URL ou ID inválido'})
+                continue
+            pending.setdefault(info_cache_key(item, profile), []).append(index)
+        
+        hits = cache.get_many(pending)
+        for key, value in hits.items():
+            if value:
+                yield result_lines(pending.pop(key), value)
+        if not pending:
+            return
+        
+        executor = ThreadPoolExecutor(max_workers=min(concurrency, len(pending)))
+        try:
+            futures = {
+                executor.submit(load_item, items[indices[0]]): indices
+                for indices in pending.values()
+            }
+            for future in as_completed(futures):
+                indices = futures[future]
+                try:
+                    value = future.result()
+                except Exception as e:
+                    yield error_lines(indices, e)
+                    continue
+                if value:
+                    yield result_lines(indices, value)
+                else:
+                    yield error_lines(indices, Exception('Não foi possível obter informações do vídeo'))
+        finally:
+            # Cliente desconectado: descarta o que ainda não começou
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def encode_comments_cursor(sort, offset):
+    return base64.urlsafe_b64encode(f'{sort}:{offset}'.encode()).decode().rstrip('=')
+
+def decode_comments_cursor(cursor):
+    """Retorna (sort, offset) ou None se o cursor for inválido"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort, offset = base64.urlsafe_b64decode(padded).decode().split(':', 1)
+        offset = int(offset)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if sort not in COMMENT_SORTS or offset < 0:
+        return None
+    return sort, offset
+
+@info_bp.route('/comments', methods=['GET'])
+def get_comments():
+    """
+    Comentários de um vídeo, paginados por cursor
+    
+    Os comentários ficam em cache por vídeo e ordem (`comments_{id}_{sort}`).
+    Quando uma página passa do que está em cache, a extração é refeita com
+    um limite maior (blocos que dobram de tamanho, até COMMENTS_MAX_TOTAL).
+    """
+    url = request.args.get('url')
+    if not url or not validate_url(url):
+        return jsonify({'error': 'URL inválida'}), 400
+    
+    sort = request.args.get('sort', 'top')
+    if sort not in COMMENT_SORTS:
+        return jsonify({'error': f'Ordem inválida. Use: {", ".join(COMMENT_SORTS)}'}), 400
+    
+    config = current_app.config
+    max_total = config.get('COMMENTS_MAX_TOTAL', 2000)
+    page_size = request.args.get('page_size', config.get('COMMENTS_PAGE_SIZE', 20), type=int)
+    page_size = max(1, min(page_size, config.get('COMMENTS_MAX_PAGE_SIZE', 100)))
+    max_comments = request.args.get('max_comments', max_total, type=int)
+    max_comments = max(1, min(max_comments, max_total))
+    
+    offset = 0
+    cursor = request.args.get('cursor')
+    if cursor:
+        decoded = decode_comments_cursor(cursor)
+        if decoded is None or decoded[0] != sort:
+            return jsonify({'error': 'Cursor inválido'}), 400
+        offset = decoded[1]
+    end = min(offset + page_size, max_comments)
+    
+    cache_key = f'comments_{resolve_cache_id(url)}_{sort}'
+    entry = cache.get(cache_key)
+    if not entry or (len(entry['comments']) < end and not entry['complete']):
+        count = config.get('COMMENTS_FETCH_CHUNK', 100)
+        while count < end:
+            count *= 2
+        entry = get_video_comments(url, sort, min(count, max_total))
+        cache.set(cache_key, entry, config.get('COMMENTS_CACHE_TTL', 1800))
+    
+    comments = entry['comments']
+    has_more = end < max_comments and (end < len(comments) or not entry['complete'])
+    return jsonify({
+        'comments': comments[offset:end],
+        'comment_count': entry.get('comment_count'),
+        'has_more': has_more,
+        'next_cursor': encode_comments_cursor(sort, end) if has_more else None
+    })
 
 @info_bp.route('/formats', methods=['GET'])
 def get_formats():
@@ -214,7 +387,7 @@ def get_formats():
     if not url or not validate_url(url):
         return jsonify({'error': 'URL inválida'}), 400
         
-    info = get_yt_info(url)
+    info = get_raw_video_info(url, 'minimal')
     if not info:
         return jsonify({'error': 'Não foi possível obter informações do vídeo'}), 500
     
@@ -240,11 +413,12 @@ def get_subtitles():
         return jsonify({'error': 'URL inválida'}), 400
     
     # Tenta obter do cache primeiro
-    cached_subs = cache.get(f'subs_{url}')
+    cache_id = resolve_cache_id(url)
+    cached_subs = cache.get(f'subs_{cache_id}')
     if cached_subs:
         return jsonify(cached_subs)
     
-    info = get_yt_info(url, extract_subtitles=True)
+    info = get_raw_video_info(url)
     if not info:
         return jsonify({'error': 'Não foi possível obter informações do vídeo'}), 500
     
@@ -254,26 +428,56 @@ def get_subtitles():
     }
     
     # Cache por 24 horas
-    cache.set(f'subs_{url}', subtitles, 86400)
+    cache.set(f'subs_{cache_id}', subtitles, 86400)
     return jsonify(subtitles)
 
 @info_bp.route('/transcript', methods=['GET'])
 def get_transcript():
+    """
+    Transcrição de um vídeo já interpretada, com busca por intervalo
+    
+    A faixa de legenda (json3 ou VTT) é baixada uma vez, interpretada em
+    streaming e guardada em cache como índice compacto por vídeo e idioma.
+    """
     url = request.args.get('url')
     lang = request.args.get('lang', 'en')  # Língua padrão: inglês
+    output = request.args.get('format', 'json')
+    start = request.args.get('start', type=float)
+    end = request.args.get('end', type=float)
     
     if not url or not validate_url(url):
         return jsonify({'error': 'URL inválida'}), 400
+    if output not in ('json', 'text', 'srt'):
+        return jsonify({'error': 'Formato inválido. Use: json, text, srt'}), 400
     
     # Tenta obter do cache primeiro
-    cache_key = f'transcript_{url}_{lang}'
-    cached_transcript = cache.get(cache_key)
-    if cached_transcript:
-        return jsonify(cached_transcript)
+    cache_key = f'transcript_{resolve_cache_id(url)}_{lang}'
+    transcript = cache.get(cache_key)
+    # Índices sem 'reach' são de uma versão anterior: refaz
+    if not transcript or 'reach' not in transcript:
+        transcript, error = load_transcript(url, lang)
+        if error:
+            return error
+        # Cache por 24 horas
+        cache.set(cache_key, transcript, 86400)
+    
+    positions = select_range(transcript, start, end)
+    if output == 'text':
+        return Response(to_text(transcript, positions), mimetype='text/plain')
+    if output == 'srt':
+        return Response(to_srt(transcript, positions), mimetype='application/x-subrip')
     
-    info = get_yt_info(url, extract_subtitles=True)
+    return jsonify({
+        'language': transcript['language'],
+        'is_generated': transcript['is_generated'],
+        'segments': to_segments(transcript, positions)
+    })
+
+def load_transcript(url, lang):
+    """Retorna (índice da transcrição, None) ou (None, resposta de erro)"""
+    info = get_raw_video_info(url)
     if not info:
-        return jsonify({'error': 'Não foi possível obter informações do vídeo'}), 500
+        return None, (jsonify({'error': 'Não foi possível obter informações do vídeo'}), 500)
     
     # Tenta obter legendas manuais primeiro, depois automáticas
     subtitles = info.get('subtitles', {})
@@ -286,83 +490,49 @@ def get_transcript():
         transcript = auto_subtitles[lang]
     
     if not transcript:
-        return jsonify({
+        return None, (jsonify({
             'error': f'Transcrição não disponível para o idioma {lang}',
             'available_languages': list(set(list(subtitles.keys()) + list(auto_subtitles.keys())))
-        }), 404
+        }), 404)
     
-    # Formata a transcrição
-    formatted_transcript = {
-        'language': lang,
-        'is_generated': lang in auto_subtitles,
-        'segments': transcript
-    }
+    track = choose_track(transcript)
+    if not track:
+        return None, (jsonify({
+            'error': f'Nenhuma faixa em formato suportado para o idioma {lang}',
+            'available_formats': [t.get('ext') for t in transcript]
+        }), 404)
     
-    # Cache por 24 horas
-    cache.set(cache_key, formatted_transcript, 86400)
-    return jsonify(formatted_transcript)
+    deadline = current_deadline()
+    timeout = deadline.remaining() if deadline else current_app.config.get('REQUEST_TIMEOUT', 30)
+    if timeout <= 0:
+        raise DeadlineExceeded()
+    
+    index = fetch_transcript(track, timeout)
+    index.update({'language': lang, 'is_generated': lang not in subtitles})
+    return index, None
 
 @info_bp.route('/analytics/video/metrics/<video_id>', methods=['GET'])
 def get_video_metrics(video_id):
-    url = f'https://www.youtube.com/watch?v={video_id}'
+    if not validate_video_id(video_id):
+        return jsonify({'error': 'ID do vídeo inválido'}), 400
     
     # Tenta obter do cache primeiro
     cached_metrics = cache.get(f'metrics_{video_id}')
     if cached_metrics:
         return jsonify(cached_metrics)
     
-    info = get_yt_info(url)
+    info = get_raw_video_info(video_id, 'minimal')
     if not info:
         return jsonify({'error': 'Não foi possível obter métricas do vídeo'}), 500
     
-    metrics = {
-        'basic_info': {
-            'title': info.get('title'),
-            'channel': info.get('channel'),
-            'channel_id': info.get('channel_id'),
-            'duration': info.get('duration'),
-            'upload_date': info.get('upload_date')
-        },
-        'engagement': {
-            'view_count': info.get('view_count'),
-            'like_count': info.get('like_count'),
-            'comment_count': info.get('comment_count'),
-            'average_rating': info.get('average_rating')
-        },
-        'metadata': {
-            'tags': info.get('tags', []),
-            'categories': info.get('categories', []),
-            'language': info.get('language'),
-            'age_restricted': info.get('age_restricted', False)
-        },
-        'technical': {
-            'available_qualities': [f.get('format_note') for f in info.get('formats', []) if f.get('format_note')],
-            'formats': len(info.get('formats', [])),
-            'resolution': info.get('resolution'),
-            'filesize_approx': info.get('filesize_approx')
-        }
-    }
+    metrics = build_video_metrics(info)
     
     # Cache por 1 hora
     cache.set(f'metrics_{video_id}', metrics, 3600)
     return jsonify(metrics)
 
-@info_bp.route('/analytics/channel/info', methods=['GET'])
-def get_channel_info():
-    url = request.args.get('url')
-    if not url or not validate_url(url):
-        return jsonify({'error': 'URL inválida'}), 400
-    
-    # Tenta obter do cache primeiro
-    cached_info = cache.get(f'channel_{url}')
-    if cached_info:
-        return jsonify(cached_info)
-    
-    info = get_yt_info(url)
-    if not info:
-        return jsonify({'error': 'Não foi possível obter informações do canal'}), 500
-    
-    channel_info = {
+def build_channel_info(info):
+    return {
         'id': info.get('id'),
         'name': info.get('channel'),
         'description': info.get('description'),
@@ -376,7 +546,71 @@ def get_channel_info():
         'tags': info.get('tags', []),
         'categories': info.get('categories', [])
     }
+
+@info_bp.route('/analytics/channel/info', methods=['GET'])
+def get_channel_info():
+    url = request.args.get('url')
+    if not url or not validate_url(url):
+        return jsonify({'error': 'URL inválida'}), 400
+    
+    def load():
+        info = get_yt_info(url)
+        return build_channel_info(info) if info else None
+    
+    # Cache por 6 horas, servindo o valor velho durante a revalidação
+    channel_info = cache.get_or_set(
+        f'channel_{url}', load, 21600,
+        stale_for=current_app.config.get('CACHE_CHANNEL_STALE_TTL', 0)
+    )
+    if not channel_info:
+        return jsonify({'error': 'Não foi possível obter informações do canal'}), 500
     
-    # Cache por 6 horas
-    cache.set(f'channel_{url}', channel_info, 21600)
     return jsonify(channel_info)
+
+def _cached(key):
+    """Indica se a rota responde do próprio cache (inclusive negativo) sem extrair"""
+    try:
+        return cache.peek(key) is not None
+    except CacheableError:
+        return True
+
+def prefetch_plan(endpoint, view_args, args):
+    """
+    Extração bruta (url, perfil) de que a rota vai precisar, ou None
+
+    Só as rotas que leem a extração compartilhada (get_raw_video_info)
+    entram aqui, e só quando a resposta ainda não está no cache da rota.
+    """
+    if endpoint == 'info.get_video_metrics':
+        video_id = view_args.get('video_id', '')
+        if not validate_video_id(video_id) or _cached(f'metrics_{video_id}'):
+            return None
+        return video_id, 'minimal'
+
+    url = args.get('url')
+    if not url or not validate_url(url):
+        return None
+    if endpoint == 'info.get_video_info':
+        profile = resolve_profile(args.get('profile', DEFAULT_PROFILE))
+        if profile is None or _cached(info_cache_key(url, profile)):
+            return None
+        return url, profile
+    if endpoint == 'info.get_formats':
+        return url, 'minimal'
+    if endpoint == 'info.get_subtitles':
+        return None if _cached(f'subs_{resolve_cache_id(url)}') else (url, DEFAULT_PROFILE)
+    if endpoint == 'info.get_transcript':
+        lang = args.get('lang', 'en')
+        return None if _cached(f'transcript_{resolve_cache_id(url)}_{lang}') else (url, DEFAULT_PROFILE)
+    return None
+
+async def prefetch_request(endpoint, view_args, args):
+    """
+    Extração da rota no event loop, antes de ela rodar em uma thread (modo ASGI)
+
+    O resultado chega à rota pelo contexto da requisição; veja
+    prefetch_raw_video_info.
+    """
+    plan = prefetch_plan(endpoint, view_args, args)
+    if plan is not None:
+        await prefetch_raw_video_info(*plan)
@@ -0,0 +1,189 @@
+import asyncio
+import contextvars
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils import extractor
+from utils.asgi_bridge import AsyncWSGIBridge
+from utils.deadline import DeadlineExceeded, current_deadline
+from utils.extraction_service import extraction_service
+from utils.extractor import CacheableError, get_raw_video_info, prefetch_raw_video_info
+from utils.singleflight import SingleFlight
+
+prefetched = contextvars.ContextVar('prefetched', default=None)
+
+def wsgi_app(environ, start_response):
+    """Responde com o valor antecipado e o prazo vistos pela thread da rota"""
+    deadline = current_deadline()
+    body = json.dumps({
+        'prefetched': prefetched.get(),
+        'remaining': deadline.remaining() if deadline else None,
+        'thread': threading.current_thread().name
+    }).encode()
+    start_response('200 OK', [('Content-Type', 'application/json')])
+    return [body]
+
+async def slow_prefetch(scope):
+    # Espera pelo upstream: no event loop, sem thread
+    await asyncio.sleep(0.2)
+    prefetched.set(scope['path'])
+
+async def request(bridge, path):
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'headers': []}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await bridge(scope, receive, send)
+    status = messages[0]['status']
+    body = b''.join(m.get('body', b'') for m in messages[1:])
+    return status, json.loads(body)
+
+def test_waiting_for_the_prefetch_holds_no_thread():
+    bridge = AsyncWSGIBridge(wsgi_app, max_in_flight=1, prefetch=slow_prefetch, deadline=10)
+
+    async def run():
+        return await asyncio.gather(*(request(bridge, f'/{i}') for i in range(20)))
+
+    started = time.monotonic()
+    responses = asyncio.run(run())
+    # Com a espera em threads seriam 20 x 0,2s em uma única thread
+    assert time.monotonic() - started < 1
+    assert [status for status, _ in responses] == [200] * 20
+    assert [body['prefetched'] for _, body in responses] == [f'/{i}' for i in range(20)]
+    assert {body['thread'] for _, body in responses} == {'asgi_0'}
+
+def test_route_inherits_the_deadline_started_on_arrival():
+    bridge = AsyncWSGIBridge(wsgi_app, prefetch=slow_prefetch, deadline=5)
+    status, body = asyncio.run(request(bridge, '/'))
+    assert status == 200
+    assert 4 < body['remaining'] <= 4.8
+
+def test_failed_prefetch_still_runs_the_route():
+    async def broken(scope):
+        raise RuntimeError('falha inesperada')
+
+    bridge = AsyncWSGIBridge(wsgi_app, prefetch=broken)
+    status, body = asyncio.run(request(bridge, '/'))
+    assert status == 200
+    assert body['prefetched'] is None
+
+def test_async_calls_are_coalesced():
+    flight = SingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return 'info'
+
+    async def run():
+        return await asyncio.gather(*(flight.do_async('key', fn, timeout=5) for _ in range(5)))
+
+    assert asyncio.run(run()) == ['info'] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {'executions': 1, 'coalesced': 4, 'coalesced_process': 0, 'in_flight': 0}
+
+def test_async_follower_retries_after_the_leaders_deadline():
+    flight = SingleFlight()
+
+    async def leader_fn():
+        await asyncio.sleep(0.1)
+        raise DeadlineExceeded()
+
+    async def follower_fn():
+        return 'from follower'
+
+    async def run():
+        leader = asyncio.create_task(flight.do_async('key', leader_fn))
+        await asyncio.sleep(0)
+        follower = await flight.do_async('key', follower_fn, timeout=5)
+        with pytest.raises(DeadlineExceeded):
+            await leader
+        return follower
+
+    assert asyncio.run(run()) == 'from follower'
+    assert flight.stats()['executions'] == 2
+
+def test_async_follower_times_out_on_its_own_deadline():
+    flight = SingleFlight()
+
+    async def run():
+        leader = asyncio.create_task(flight.do_async('key', lambda: asyncio.sleep(1, 'late')))
+        await asyncio.sleep(0)
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            await flight.do_async('key', lambda: asyncio.sleep(0, 'unused'), timeout=0.1)
+        assert time.monotonic() - started < 0.5
+        leader.cancel()
+
+    asyncio.run(run())
+
+class VideoHandler(BaseHTTPRequestHandler):
+    """Serve um arquivo de vídeo em /video.mp4 e 404 no resto"""
+
+    def do_GET(self):
+        if self.path != '/video.mp4':
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', '1024')
+        self.end_headers()
+        self.wfile.write(b'\0' * 1024)
+
+    do_HEAD = do_GET
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def video_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), VideoHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+
+@pytest.fixture
+def no_sync_extraction(monkeypatch):
+    """A rota não pode extrair de novo: o resultado vem do prefetch"""
+    def fail(*args, **kwargs):
+        pytest.fail('a rota não deve extrair na thread')
+    monkeypatch.setattr(extraction_service, 'extract', fail)
+    monkeypatch.setattr(extractor.cache, 'get_or_set', fail)
+
+def test_prefetched_info_reaches_the_route(video_server, no_sync_extraction):
+    url = f'{video_server}/video.mp4'
+
+    async def run():
+        await prefetch_raw_video_info(url, 'minimal')
+        # O contexto da requisição, como o bridge o entrega à thread da rota
+        return contextvars.copy_context()
+
+    context = asyncio.run(run())
+    info = context.run(get_raw_video_info, url, 'minimal')
+    assert info['url'] == url
+    assert info['ext'] == 'mp4'
+    extractor.cache.delete(f'raw_{url}')
+
+def test_prefetched_error_is_raised_by_the_route(video_server, no_sync_extraction):
+    url = f'{video_server}/missing.mp4'
+
+    async def run():
+        await prefetch_raw_video_info(url, 'minimal')
+        return contextvars.copy_context()
+
+    context = asyncio.run(run())
+    with pytest.raises(CacheableError) as raised:
+        context.run(get_raw_video_info, url, 'minimal')
+    assert raised.value.status_code in (404, 503)
+    extractor.cache.delete(f'raw_{url}')
@@ -0,0 +1,97 @@
+import os
+import time
+
+import pytest
+
+from utils.cache_backends import FileSystemBackend, RedisBackend
+
+def test_cleanup_removes_only_old_temp_files_in_shards(tmp_path):
+    backend = FileSystemBackend(str(tmp_path))
+    assert backend.set('info_aaaaaaaaaaa_standard', b'data', time.time() + 3600)
+    shard_dir = os.path.dirname(backend._get_cache_path('info_aaaaaaaaaaa_standard'))
+
+    # Escritas interrompidas por um crash: uma antiga, outra ainda em andamento
+    old_tmp = os.path.join(shard_dir, '.tmp-old')
+    recent_tmp = os.path.join(shard_dir, '.tmp-recent')
+    for path in (old_tmp, recent_tmp):
+        with open(path, 'wb') as f:
+            f.write(b'partial')
+    stale = time.time() - FileSystemBackend.TMP_MAX_AGE - 60
+    os.utime(old_tmp, (stale, stale))
+
+    assert backend.cleanup_expired() == 1
+    assert not os.path.exists(old_tmp)
+    assert os.path.exists(recent_tmp)
+    assert backend.get('info_aaaaaaaaaaa_standard') == b'data'
+
+def test_temp_sweep_stops_when_the_budget_is_spent(tmp_path):
+    backend = FileSystemBackend(str(tmp_path))
+    stale = time.time() - FileSystemBackend.TMP_MAX_AGE - 60
+    paths = []
+    for shard in ('0a', '1b', '2c'):
+        os.makedirs(tmp_path / shard / '00')
+        path = tmp_path / shard / '00' / '.tmp-x'
+        path.write_bytes(b'partial')
+        os.utime(path, (stale, stale))
+        paths.append(path)
+
+    # Sem tempo sobrando nada é percorrido; sem limite, a varredura cobre tudo
+    assert backend._sweep_temp_files(deadline=time.time() - 1) == 0
+    assert backend._sweep_temp_files() == 3
+    assert not any(path.exists() for path in paths)
+
+@pytest.fixture
+def redis_backend():
+    fakeredis = pytest.importorskip('fakeredis')
+    return RedisBackend(client=fakeredis.FakeRedis(), prefix='test:')
+
+def test_redis_set_many_and_get_many_use_one_mget(redis_backend, monkeypatch):
+    assert redis_backend.set_many({'a': b'1', 'b': b'2'}, time.time() + 60)
+
+    calls = []
+    mget = redis_backend.client.mget
+    monkeypatch.setattr(redis_backend.client, 'mget', lambda keys: calls.append(keys) or mget(keys))
+    assert redis_backend.get_many(['a', 'missing', 'b']) == {'a': b'1', 'b': b'2'}
+    assert calls == [['test:a', 'test:missing', 'test:b']]
+    assert redis_backend.get_many([]) == {}
+    assert len(calls) == 1
+
+def test_redis_expiry_is_set_with_pxat(redis_backend):
+    expires_at = time.time() + 60
+    assert redis_backend.set('a', b'1', expires_at)
+    assert 59000 < redis_backend.client.pttl('test:a') <= 60000
+
+    # Já expirado: nada é gravado
+    assert redis_backend.set('old', b'1', time.time() - 1)
+    assert redis_backend.client.exists('test:old') == 0
+
+    assert redis_backend.set('short', b'1', time.time() + 0.2)
+    time.sleep(0.3)
+    assert redis_backend.get('short') is None
+
+def test_redis_lock_release_keeps_a_lock_owned_by_someone_else(redis_backend):
+    pytest.importorskip('lupa')
+    token = redis_backend.acquire_lock('info_x', ttl=30)
+    assert token is not None
+    assert redis_backend.acquire_lock('info_x', ttl=30) is None
+
+    # Token errado (por exemplo, o lock expirou e foi obtido por outro processo)
+    redis_backend.release_lock('info_x', 'not-the-owner')
+    assert redis_backend.client.get('test:lock:info_x') == token.encode()
+
+    redis_backend.release_lock('info_x', token)
+    assert redis_backend.acquire_lock('info_x', ttl=30) is not None
+
+def test_redis_lock_expires_after_its_ttl(redis_backend):
+    assert redis_backend.acquire_lock('info_x', ttl=0.2) is not None
+    time.sleep(0.3)
+    assert redis_backend.acquire_lock('info_x', ttl=0.2) is not None
+
+def test_redis_clear_removes_only_prefixed_keys(redis_backend):
+    # Mais de um lote de DELETE no pipeline
+    redis_backend.set_many({f'key-{i}': b'x' for i in range(1200)}, time.time() + 60)
+    redis_backend.client.set('other:key', b'kept')
+
+    assert redis_backend.clear()
+    assert list(redis_backend.client.scan_iter(match='test:*')) == []
+    assert redis_backend.client.get('other:key') == b'kept'
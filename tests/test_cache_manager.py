@@ -0,0 +1,24 @@
+from prometheus_client import REGISTRY
+
+from utils.cache_manager import CacheManager
+
+def latency_count(operation, namespace):
+    return REGISTRY.get_sample_value('cache_operation_duration_seconds_count',
+                                     {'operation': operation, 'cache_type': namespace}) or 0
+
+def test_get_many_records_one_latency_observation_per_call(tmp_path):
+    cache = CacheManager(cache_dir=str(tmp_path))
+    cache.set('info_aaaaaaaaaaa_standard', {'id': 'a'})
+    cache.memory.clear()
+    before = latency_count('get_many', 'info')
+
+    result = cache.get_many(['info_aaaaaaaaaaa_standard', 'info_bbbbbbbbbbb_standard'])
+
+    assert result == {'info_aaaaaaaaaaa_standard': {'id': 'a'}}
+    assert latency_count('get_many', 'info') == before + 1
+
+def test_get_many_without_keys_records_nothing(tmp_path):
+    cache = CacheManager(cache_dir=str(tmp_path))
+    before = latency_count('get_many', 'info')
+    assert cache.get_many([]) == {}
+    assert latency_count('get_many', 'info') == before
@@ -0,0 +1,113 @@
+import glob
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import routes.download_routes as download_routes
+from app import create_app
+from routes.download_routes import init_app as init_downloads, submit_job
+from utils.task_store import task_store
+
+FILE_SIZE = 20 * 1024 * 1024
+CHUNK = 16 * 1024
+
+class SlowVideoHandler(BaseHTTPRequestHandler):
+    """Serve um mp4 de 20 MiB a ~320 KiB/s: o download leva mais de um minuto"""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(FILE_SIZE))
+        self.end_headers()
+        try:
+            for _ in range(FILE_SIZE // CHUNK):
+                self.wfile.write(b'\0' * CHUNK)
+                time.sleep(0.05)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def slow_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowVideoHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/video.mp4'
+    server.shutdown()
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app('testing')
+    app.config.update(
+        DOWNLOAD_DIR=str(tmp_path),
+        DOWNLOAD_TASK_DB=str(tmp_path / 'tasks.sqlite3'),
+        DOWNLOAD_PROGRESS_FLUSH_INTERVAL=0.1,
+        DOWNLOAD_TIMEOUT=None
+    )
+    init_downloads(app)
+    return app
+
+def start_job(app, url):
+    """Coloca um download na fila como POST /api/download, sem a validação de URL do YouTube"""
+    task_id = str(uuid.uuid4())
+    job = {
+        'job_id': str(uuid.uuid4()), 'url': url, 'video_id': url, 'format': 'best',
+        'format_id': None, 'quality': 'best', 'priority': 'normal', 'status': 'queued',
+        'start_time': time.time()
+    }
+    job_id, _ = task_store.open_task(task_id, job)
+    submit_job(job_id, job, app.config)
+    return task_id, job_id
+
+def wait_for(client, task_id, predicate, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = client.get(f'/api/status/{task_id}').get_json()
+        if predicate(status):
+            return status
+        time.sleep(0.05)
+    pytest.fail(f'status não chegou ao esperado: {status}')
+
+def transferring(status):
+    return status['status'] == 'downloading' and status['progress'].get('downloaded_bytes', 0) > 0
+
+def assert_no_partial_files(job_id):
+    work_dir = download_routes.job_work_dir(job_id)
+    assert not glob.glob(os.path.join(work_dir, '*'))
+
+def test_cancel_during_slow_transfer(app, slow_server):
+    client = app.test_client()
+    task_id, job_id = start_job(app, slow_server)
+    wait_for(client, task_id, transferring)
+
+    started = time.monotonic()
+    response = client.post(f'/api/cancel/{task_id}')
+    assert response.status_code == 202
+
+    status = wait_for(client, task_id, lambda s: s['status'] not in ('downloading', 'cancelling'))
+    assert status['status'] == 'cancelled'
+    # Interrompido no próximo bloco, não ao fim da transferência
+    assert time.monotonic() - started < 5
+    assert_no_partial_files(job_id)
+    assert job_id not in download_routes.cancel_events
+
+def test_cancel_requested_by_another_worker(app, slow_server):
+    client = app.test_client()
+    task_id, job_id = start_job(app, slow_server)
+    wait_for(client, task_id, transferring)
+
+    # Outro worker só marca o pedido no registro; o dono o aplica em sync_jobs
+    assert task_store.detach_task(task_id) == 0
+    assert download_routes.cancel_events[job_id].is_set() is False
+
+    deadline = time.monotonic() + 5
+    while task_store.get_task(task_id)['status'] != 'cancelled':
+        assert time.monotonic() < deadline, 'sync_jobs não aplicou o cancelamento'
+        time.sleep(0.05)
+    assert_no_partial_files(job_id)
@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from app import create_app
+from routes.download_routes import init_app as init_downloads
+from utils.download_scheduler import DownloadScheduler, QueueFull, download_scheduler
+from utils.task_store import task_store
+
+YOUTUBE = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+
+class Probe:
+    """Jobs que bloqueiam até `finish` e registram a concorrência por host"""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.lock = threading.Lock()
+        self.active = {}
+        self.peak = {}
+        self.order = []
+        self.done = threading.Semaphore(0)
+
+    def job(self, name, host='youtube.com'):
+        def run():
+            with self.lock:
+                self.order.append(name)
+                self.active[host] = self.active.get(host, 0) + 1
+                self.peak[host] = max(self.peak.get(host, 0), self.active[host])
+            self.gate.wait(10)
+            with self.lock:
+                self.active[host] -= 1
+            self.done.release()
+        return run
+
+    def wait_started(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.order) < count:
+            assert time.monotonic() < deadline, f'só {len(self.order)} jobs começaram'
+            time.sleep(0.01)
+
+    def finish(self, count):
+        self.gate.set()
+        for _ in range(count):
+            assert self.done.acquire(timeout=5)
+
+def test_priority_order_with_fifo_inside_a_level():
+    scheduler = DownloadScheduler(max_workers=1)
+    probe = Probe()
+    scheduler.submit('busy', probe.job('busy'), YOUTUBE)
+    probe.wait_started(1)
+
+    for name, priority in [('low', 'low'), ('normal-1', 'normal'), ('high', 'high'), ('normal-2', 'normal')]:
+        scheduler.submit(name, probe.job(name), YOUTUBE, priority)
+    assert scheduler.position('high') == 1
+    assert scheduler.position('low') == 4
+
+    probe.finish(5)
+    assert probe.order == ['busy', 'high', 'normal-1', 'normal-2', 'low']
+
+def test_youtube_jobs_use_every_worker_by_default():
+    scheduler = DownloadScheduler(max_workers=5)
+    probe = Probe()
+    for i in range(10):
+        scheduler.submit(f'job-{i}', probe.job(f'job-{i}'), YOUTUBE)
+    probe.wait_started(5)
+    assert probe.peak['youtube.com'] == 5
+    probe.finish(10)
+
+def test_per_host_limit_holds_jobs_and_lets_other_hosts_through():
+    scheduler = DownloadScheduler(max_workers=4, per_host_limit=2)
+    probe = Probe()
+    for i in range(4):
+        scheduler.submit(f'yt-{i}', probe.job(f'yt-{i}', 'youtube.com'), f'{YOUTUBE}&n={i}')
+    # Submetido depois, mas o host tem vaga: passa à frente dos retidos
+    scheduler.submit('other', probe.job('other', 'example.com'), 'https://example.com/video.mp4')
+    probe.wait_started(3)
+    time.sleep(0.1)
+
+    assert probe.peak['youtube.com'] == 2
+    assert 'other' in probe.order
+    assert scheduler.stats()['per_host'] == {'youtube.com': 2, 'example.com': 1}
+    probe.finish(5)
+    assert probe.peak['youtube.com'] == 2
+
+def test_submit_raises_queue_full():
+    scheduler = DownloadScheduler(max_workers=1, max_queue=1)
+    probe = Probe()
+    scheduler.submit('busy', probe.job('busy'), YOUTUBE)
+    probe.wait_started(1)
+    scheduler.submit('waiting', probe.job('waiting'), YOUTUBE)
+    with pytest.raises(QueueFull):
+        scheduler.submit('rejected', probe.job('rejected'), YOUTUBE)
+    probe.finish(2)
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    app = create_app('testing')
+    app.config.update(
+        DOWNLOAD_DIR=str(tmp_path),
+        DOWNLOAD_TASK_DB=str(tmp_path / 'tasks.sqlite3'),
+        DOWNLOAD_RETRY_AFTER=17
+    )
+    init_downloads(app)
+    monkeypatch.setattr(download_scheduler, 'max_queue', 0)
+    return app
+
+def test_full_queue_answers_503_with_retry_after(app):
+    response = app.test_client().post('/api/download', json={'url': YOUTUBE})
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '17'
+    # O job recusado não fica no registro bloqueando o próximo pedido
+    assert task_store._conn().execute('SELECT COUNT(*) FROM jobs').fetchone()[0] == 0
@@ -0,0 +1,170 @@
+import os
+import time
+import uuid
+from email.utils import formatdate
+
+import pytest
+from werkzeug.wsgi import FileWrapper
+
+from app import create_app
+from routes.download_routes import file_store, init_app as init_downloads
+from utils.task_store import task_store
+
+CONTENT = bytes(range(256)) * 40
+SIZE = len(CONTENT)
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app('testing')
+    app.config.update(
+        DOWNLOAD_DIR=str(tmp_path),
+        DOWNLOAD_TASK_DB=str(tmp_path / 'tasks.sqlite3')
+    )
+    init_downloads(app)
+    return app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def completed_task(tmp_path, name='vídeo.mp4'):
+    """Tarefa concluída, com o arquivo no store, como ao fim de download_video"""
+    src = tmp_path / 'download.mp4'
+    src.write_bytes(CONTENT)
+    stored = file_store.put('dQw4w9WgXcQ', 'best', str(src), name=name)
+    task_id = str(uuid.uuid4())
+    task_store.open_task(task_id, {
+        'job_id': str(uuid.uuid4()), 'url': 'https://youtu.be/dQw4w9WgXcQ', 'video_id': 'dQw4w9WgXcQ',
+        'format': 'best', 'format_id': None, 'quality': 'best', 'priority': 'normal',
+        'status': 'completed', 'filename': stored['path'], 'download_name': stored['name'],
+        'start_time': time.time()
+    })
+    file_store.add_ref(task_id, stored['digest'])
+    return task_id, stored
+
+def test_full_file_with_strong_etag(client, tmp_path):
+    task_id, stored = completed_task(tmp_path)
+    response = client.get(f'/api/file/{task_id}')
+
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    assert response.mimetype == 'video/mp4'
+    assert response.get_etag() == (stored['digest'], False)
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert "filename*=UTF-8''v%C3%ADdeo.mp4" in response.headers['Content-Disposition']
+
+def test_if_none_match_answers_304(client, tmp_path):
+    task_id, stored = completed_task(tmp_path)
+    for headers in ({'If-None-Match': f'"{stored["digest"]}"'},
+                    {'If-None-Match': f'"{stored["digest"]}"', 'Range': 'bytes=0-9'}):
+        response = client.get(f'/api/file/{task_id}', headers=headers)
+        assert response.status_code == 304
+        assert response.data == b''
+
+@pytest.mark.parametrize('header, start, stop', [
+    ('bytes=10-19', 10, 20),
+    ('bytes=-5', SIZE - 5, SIZE),
+    (f'bytes={SIZE - 3}-', SIZE - 3, SIZE),
+    (f'bytes=100-{SIZE + 500}', 100, SIZE),
+])
+def test_single_range(client, tmp_path, header, start, stop):
+    task_id, stored = completed_task(tmp_path)
+    response = client.get(f'/api/file/{task_id}', headers={'Range': header})
+
+    assert response.status_code == 206
+    assert response.data == CONTENT[start:stop]
+    assert response.headers['Content-Length'] == str(stop - start)
+    assert response.headers['Content-Range'] == f'bytes {start}-{stop - 1}/{SIZE}'
+    assert response.get_etag() == (stored['digest'], False)
+
+def test_single_range_through_wsgi_file_wrapper(client, tmp_path):
+    task_id, _ = completed_task(tmp_path)
+    response = client.get(f'/api/file/{task_id}', headers={'Range': 'bytes=1000-1999'},
+                          environ_overrides={'wsgi.file_wrapper': FileWrapper})
+
+    assert response.status_code == 206
+    # O servidor envia Content-Length bytes a partir da posição do arquivo
+    assert response.headers['Content-Length'] == '1000'
+    assert response.data[:1000] == CONTENT[1000:2000]
+
+def test_multipart_ranges_match_content_length(client, tmp_path):
+    task_id, _ = completed_task(tmp_path)
+    response = client.get(f'/api/file/{task_id}', headers={'Range': 'bytes=0-4,100-149,-3'})
+
+    assert response.status_code == 206
+    assert response.mimetype == 'multipart/byteranges'
+    assert int(response.headers['Content-Length']) == len(response.data)
+
+    boundary = response.mimetype_params['boundary'].encode()
+    parts = response.data.split(b'--' + boundary)
+    assert parts[0] == b'' and parts[-1] == b'--\r\n'
+    bodies = {}
+    for part in parts[1:-1]:
+        head, body = part.split(b'\r\n\r\n', 1)
+        content_range = next(line for line in head.split(b'\r\n') if line.startswith(b'Content-Range'))
+        bodies[content_range.decode().split(': ')[1]] = body[:-2]
+    assert bodies == {
+        f'bytes 0-4/{SIZE}': CONTENT[0:5],
+        f'bytes 100-149/{SIZE}': CONTENT[100:150],
+        f'bytes {SIZE - 3}-{SIZE - 1}/{SIZE}': CONTENT[-3:],
+    }
+
+def test_unsatisfiable_range_answers_416(client, tmp_path):
+    task_id, _ = completed_task(tmp_path)
+    response = client.get(f'/api/file/{task_id}', headers={'Range': f'bytes={SIZE + 10}-'})
+
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{SIZE}'
+
+def test_if_range(client, tmp_path):
+    task_id, stored = completed_task(tmp_path)
+    url = f'/api/file/{task_id}'
+    mtime = os.path.getmtime(stored['path'])
+
+    response = client.get(url, headers={'Range': 'bytes=0-9', 'If-Range': f'"{stored["digest"]}"'})
+    assert response.status_code == 206
+    assert response.data == CONTENT[:10]
+
+    # Arquivo diferente do que o cliente já tem: recomeça do início
+    for if_range in ('"other-digest"', formatdate(mtime - 3600, usegmt=True)):
+        response = client.get(url, headers={'Range': 'bytes=0-9', 'If-Range': if_range})
+        assert response.status_code == 200
+        assert response.data == CONTENT
+
+def test_accel_redirect_delegates_to_nginx(app, client, tmp_path):
+    app.config['DOWNLOAD_ACCEL_REDIRECT'] = '/protected/'
+    task_id, stored = completed_task(tmp_path)
+    response = client.get(f'/api/file/{task_id}', headers={'Range': 'bytes=0-9'})
+
+    assert response.status_code == 200
+    assert response.data == b''
+    assert response.headers['X-Accel-Redirect'] == \
+        f"/protected/{stored['digest'][:2]}/{os.path.basename(stored['path'])}"
+    assert response.get_etag() == (stored['digest'], False)
+
+def test_unavailable_files(client, tmp_path):
+    assert client.get('/api/file/unknown').status_code == 404
+
+    task_id, stored = completed_task(tmp_path)
+    os.remove(stored['path'])
+    assert client.get(f'/api/file/{task_id}').status_code == 410
+
+    # Tarefa de um job ainda na fila
+    pending = str(uuid.uuid4())
+    task_store.open_task(pending, {
+        'job_id': str(uuid.uuid4()), 'url': 'https://youtu.be/aaaaaaaaaaa', 'video_id': 'aaaaaaaaaaa',
+        'format': 'best', 'format_id': None, 'quality': 'best', 'priority': 'normal',
+        'status': 'queued', 'start_time': time.time()
+    })
+    response = client.get(f'/api/file/{pending}')
+    assert response.status_code == 409
+    assert response.get_json()['status'] == 'queued'
+
+@pytest.mark.parametrize('header', ['bytes=0-1,4-5,8-9', 'items=0-1'])
+def test_ranges_not_served_fall_back_to_the_full_file(app, client, tmp_path, header):
+    app.config['DOWNLOAD_MAX_RANGES'] = 2
+    task_id, _ = completed_task(tmp_path)
+    response = client.get(f'/api/file/{task_id}', headers={'Range': header})
+
+    assert response.status_code == 200
+    assert response.data == CONTENT
@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+from utils.cache_manager import CacheManager
+from utils.deadline import DeadlineExceeded
+from utils.extractor import ExtractionError
+from utils.singleflight import SingleFlight
+
+def start_leader(flight, key, fn):
+    """Inicia a execução líder em outra thread e espera ela começar"""
+    started = threading.Event()
+    outcome = {}
+
+    def leader_fn():
+        started.set()
+        return fn()
+
+    def run():
+        try:
+            outcome['result'] = flight.do(key, leader_fn)
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert started.wait(5)
+    return thread, outcome
+
+def test_follower_with_time_left_retries_after_the_leaders_deadline():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def leader_fn():
+        release.wait(5)
+        raise DeadlineExceeded()
+
+    thread, outcome = start_leader(flight, 'key', leader_fn)
+    calls = []
+    follower = threading.Thread(target=lambda: calls.append(
+        flight.do('key', lambda: 'from follower', timeout=5)))
+    follower.start()
+    time.sleep(0.1)
+    release.set()
+    thread.join()
+    follower.join()
+
+    assert isinstance(outcome['error'], DeadlineExceeded)
+    assert calls == ['from follower']
+    assert flight.stats()['executions'] == 2
+
+def test_follower_receives_other_leader_errors():
+    flight = SingleFlight()
+    release = threading.Event()
+    error = ExtractionError('unavailable', 'Vídeo indisponível', 404)
+
+    def leader_fn():
+        release.wait(5)
+        raise error
+
+    thread, _ = start_leader(flight, 'key', leader_fn)
+    threading.Timer(0.1, release.set).start()
+    with pytest.raises(ExtractionError) as raised:
+        flight.do('key', lambda: pytest.fail('o seguidor não deve extrair de novo'), timeout=5)
+    thread.join()
+    assert raised.value is error
+
+def test_follower_times_out_on_its_own_deadline():
+    flight = SingleFlight()
+    release = threading.Event()
+    thread, _ = start_leader(flight, 'key', lambda: release.wait(5) and 'late')
+
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        flight.do('key', lambda: 'unused', timeout=0.2)
+    assert time.monotonic() - started < 1
+    release.set()
+    thread.join()
+
+def test_cross_process_wait_stops_at_the_callers_deadline(tmp_path):
+    cache = CacheManager(cache_dir=str(tmp_path))
+    flight = SingleFlight(cache, process_lock=True, lock_timeout=60, poll_interval=0.05)
+    # Outro processo detém o lock e ainda não publicou o resultado
+    token = cache.backend.acquire_lock('key', 60)
+    assert token is not None
+    try:
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            flight.do('key', lambda: pytest.fail('não deve extrair sem o lock'),
+                      recheck=lambda: None, timeout=0.3)
+        assert time.monotonic() - started < 1
+    finally:
+        cache.backend.release_lock('key', token)
+
+def test_cross_process_wait_returns_the_published_result(tmp_path):
+    cache = CacheManager(cache_dir=str(tmp_path))
+    flight = SingleFlight(cache, process_lock=True, lock_timeout=60, poll_interval=0.05)
+    token = cache.backend.acquire_lock('key', 60)
+    published = {}
+    threading.Timer(0.1, lambda: published.setdefault('info', {'id': 'x'})).start()
+    try:
+        result = flight.do('key', lambda: pytest.fail('não deve extrair de novo'),
+                           recheck=lambda: published.get('info'), timeout=5)
+    finally:
+        cache.backend.release_lock('key', token)
+    assert result == {'id': 'x'}
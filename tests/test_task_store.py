@@ -0,0 +1,218 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import routes.download_routes as download_routes
+from app import create_app
+from routes.download_routes import init_app as init_downloads
+from utils.task_store import TaskStore, task_store
+
+CONTENT = bytes(range(256)) * 1024
+PARTIAL = 64 * 1024
+
+def make_job(url='http://127.0.0.1:9/video.mp4', video_id='video', status='queued'):
+    return {
+        'job_id': str(uuid.uuid4()), 'url': url, 'video_id': video_id, 'format': 'best',
+        'format_id': None, 'quality': 'best', 'priority': 'normal', 'status': status,
+        'start_time': time.time()
+    }
+
+def orphan_job(path, job, task_id):
+    """Deixa no registro um job de um processo que morreu sem encerrá-lo"""
+    owner = 'dead-host:1:00000000'
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.execute(
+            'INSERT INTO jobs (job_id, url, video_id, format, format_id, quality, priority, status, '
+            'start_time, owner) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (job['job_id'], job['url'], job['video_id'], job['format'], job['format_id'],
+             job['quality'], job['priority'], job['status'], job['start_time'], owner)
+        )
+        conn.execute('INSERT INTO tasks (task_id, job_id, start_time) VALUES (?, ?, ?)',
+                     (task_id, job['job_id'], time.time()))
+        conn.execute('INSERT INTO workers (owner, last_seen) VALUES (?, ?)', (owner, time.time() - 3600))
+    finally:
+        conn.close()
+
+def create_db(path):
+    conn = sqlite3.connect(path, isolation_level=None)
+    TaskStore._create_schema(conn)
+    conn.close()
+
+def wait_until(predicate, timeout=10, message='condição não atingida'):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, message
+        time.sleep(0.02)
+
+@pytest.fixture
+def stores(tmp_path):
+    """Dois processos (donos) sobre o mesmo banco"""
+    path = str(tmp_path / 'tasks.sqlite3')
+    create_db(path)
+    first = TaskStore(path, flush_interval=0.02, orphan_timeout=0.3)
+    second = TaskStore(path, flush_interval=0.02, orphan_timeout=0.3)
+    first.start()
+    second.start()
+    return first, second
+
+def test_active_job_is_shared_across_owners(stores):
+    first, second = stores
+    job_id, created = first.open_task('task-1', make_job())
+    assert created
+
+    shared_id, created = second.open_task('task-2', make_job())
+    assert (shared_id, created) == (job_id, False)
+    assert second.get_task('task-2')['owner'] == first.owner
+    assert second.get_task('task-2')['shared_by'] == 2
+
+    # O índice único parcial barra um segundo job ativo mesmo sem open_task
+    with pytest.raises(sqlite3.IntegrityError):
+        with second._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, url, video_id, format, priority, status, start_time) "
+                "VALUES ('other', 'u', 'video', 'best', 'normal', 'queued', 0)"
+            )
+
+def test_cancel_flagged_by_another_owner_reaches_the_owner(stores):
+    first, second = stores
+    job_id, _ = first.open_task('task-1', make_job())
+
+    assert second.detach_task('task-1') == 0
+    assert first.cancel_requests() == [job_id]
+    assert second.cancel_requests() == []
+    # Com o cancelamento pedido, o mesmo vídeo pode ser pedido de novo
+    assert second.open_task('task-2', make_job())[1]
+
+def test_live_owner_keeps_its_jobs(stores):
+    first, second = stores
+    first.open_task('task-1', make_job(status='downloading'))
+    time.sleep(0.5)
+    assert second.claim_orphans() == []
+
+def test_orphan_is_claimed_exactly_once(stores):
+    first, second = stores
+    job = make_job(status='downloading')
+    orphan_job(first.path, job, 'task-1')
+
+    claimed = []
+    barrier = threading.Barrier(2)
+    def claim(store):
+        barrier.wait()
+        claimed.extend((store.owner, j['job_id']) for j in store.claim_orphans())
+    threads = [threading.Thread(target=claim, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(claimed) == 1
+    owner, job_id = claimed[0]
+    assert job_id == job['job_id']
+    assert first.get_task('task-1')['owner'] == owner
+    assert first.claim_orphans() == second.claim_orphans() == []
+
+def test_claimed_job_is_not_an_orphan_before_the_first_heartbeat(tmp_path):
+    path = str(tmp_path / 'tasks.sqlite3')
+    create_db(path)
+    first = TaskStore(path, orphan_timeout=0.3)
+    second = TaskStore(path, orphan_timeout=0.3)
+    # Sem start(): nenhum dos dois registrou heartbeat ainda
+    orphan_job(path, make_job(status='downloading'), 'task-1')
+
+    assert len(first.claim_orphans()) == 1
+    assert second.claim_orphans() == []
+
+class RangeVideoHandler(BaseHTTPRequestHandler):
+    """Serve CONTENT com suporte a Range, registrando os intervalos pedidos"""
+
+    ranges = []
+
+    def do_GET(self):
+        header = self.headers.get('Range')
+        start = 0
+        if header:
+            self.ranges.append(header)
+            start = int(header.split('=')[1].split('-')[0])
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(CONTENT) - 1}/{len(CONTENT)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(len(CONTENT) - start))
+        self.end_headers()
+        self.wfile.write(CONTENT[start:])
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def video_server():
+    RangeVideoHandler.ranges = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeVideoHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/video.mp4'
+    server.shutdown()
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app('testing')
+    app.config.update(
+        DOWNLOAD_DIR=str(tmp_path),
+        DOWNLOAD_TASK_DB=str(tmp_path / 'tasks.sqlite3'),
+        DOWNLOAD_PROGRESS_FLUSH_INTERVAL=0.05,
+        DOWNLOAD_ORPHAN_TIMEOUT=0.3,
+        DOWNLOAD_TIMEOUT=None
+    )
+    init_downloads(app)
+    yield app
+    # Os testes seguintes não devem assumir jobs deste banco
+    task_store.orphan_timeout = 30
+
+def test_orphan_is_resumed_from_its_partial_file(app, video_server):
+    job = make_job(url=video_server, status='downloading')
+    work_dir = download_routes.job_work_dir(job['job_id'])
+    os.makedirs(work_dir)
+    # .part deixado pelo processo morto (continuedl retoma a partir dele)
+    with open(os.path.join(work_dir, 'video-video.mp4.part'), 'wb') as f:
+        f.write(CONTENT[:PARTIAL])
+    orphan_job(task_store.path, job, 'task-1')
+
+    # A thread do task_store assume o job em sync_jobs e o coloca na fila
+    wait_until(lambda: task_store.get_task('task-1')['status'] in ('completed', 'error'),
+               message='job órfão não foi retomado')
+    task = task_store.get_task('task-1')
+    assert task['status'] == 'completed', task['error']
+    assert task['owner'] == task_store.owner
+    assert RangeVideoHandler.ranges == [f'bytes={PARTIAL}-']
+    with open(task['filename'], 'rb') as f:
+        assert f.read() == CONTENT
+
+def test_status_is_answered_for_another_owners_job(app):
+    other = TaskStore(task_store.path, flush_interval=0.05)
+    job_id, _ = other.open_task('task-1', make_job())
+    other.set_queue_positions({job_id: 3})
+    client = app.test_client()
+
+    status = client.get('/api/status/task-1').get_json()
+    assert status['status'] == 'queued'
+    assert status['queue_position'] == 3
+
+    other.set_status(job_id, 'downloading')
+    other.set_progress(job_id, {'downloaded_bytes': 10, 'total_bytes': 100})
+    other.flush()
+    status = client.get('/api/status/task-1').get_json()
+    assert status['status'] == 'downloading'
+    assert status['progress']['downloaded_bytes'] == 10
+
+    # O pedido de cancelamento fica para o dono, que o vê em cancel_requests
+    response = client.post('/api/cancel/task-1')
+    assert response.status_code == 202
+    assert other.cancel_requests() == [job_id]
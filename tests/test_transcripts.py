@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from utils.transcripts import build_index, parse_json3, parse_vtt, select_range, to_segments, to_srt
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+def test_vtt_rolling_captions_drop_repeated_lines():
+    segments = list(parse_vtt([read_fixture('rolling.vtt')]))
+    assert segments == [
+        (0, 2500, 'olá pessoal'),
+        (2510, 5000, 'hoje vamos falar'),
+        (3605010, 3607000, 'de legendas'),
+    ]
+
+@pytest.mark.parametrize('size', [1, 7, 64])
+def test_vtt_chunk_boundaries(size):
+    text = read_fixture('rolling.vtt')
+    assert list(parse_vtt(chunked(text, size))) == list(parse_vtt([text]))
+
+def test_json3_events():
+    segments = list(parse_json3([read_fixture('auto.json3')]))
+    assert segments == [
+        (0, 5000, 'primeira linha'),
+        (1000, 6000, 'segunda linha'),
+        (2000, 3000, 'terceira "linha" {com} [chaves]'),
+    ]
+
+@pytest.mark.parametrize('size', [1, 3, 17, 100])
+def test_json3_chunk_boundaries(size):
+    text = read_fixture('auto.json3')
+    assert list(parse_json3(chunked(text, size))) == list(parse_json3([text]))
+
+@pytest.fixture
+def overlapping():
+    # Segmentos sobrepostos, como nas legendas automáticas em json3
+    return build_index(parse_json3([read_fixture('auto.json3')]))
+
+def texts(index, positions):
+    return [segment['text'] for segment in to_segments(index, positions)]
+
+def test_range_inside_overlapping_segments(overlapping):
+    assert texts(overlapping, select_range(overlapping, 3.5, 4)) == ['primeira linha', 'segunda linha']
+
+def test_range_skips_short_segment_that_already_ended(overlapping):
+    assert select_range(overlapping, 5.5, None) == [1]
+
+@pytest.mark.parametrize('start, end, expected', [
+    (None, None, [0, 1, 2]),
+    (0, 1, [0]),
+    (None, 1.0, [0]),
+    (1.0, 1.001, [0, 1]),
+    (3.0, None, [0, 1]),
+    (6.0, None, []),
+    (10, 20, []),
+    (2.5, 2.5, [0, 1, 2]),
+])
+def test_range_edges(overlapping, start, end, expected):
+    assert select_range(overlapping, start, end) == expected
+
+def test_empty_index():
+    index = build_index([])
+    assert select_range(index) == []
+    assert select_range(index, 1, 2) == []
+
+def test_srt_numbers_selected_segments(overlapping):
+    srt = to_srt(overlapping, select_range(overlapping, 3.5, 4))
+    assert srt.startswith('1\n00:00:00,000 --> 00:00:05,000\nprimeira linha\n')
+    assert '2\n00:00:01,000 --> 00:00:06,000\nsegunda linha\n' in srt
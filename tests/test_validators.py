@@ -0,0 +1,22 @@
+import pytest
+
+from utils.validators import extract_video_id, validate_url, validate_video_id
+
+@pytest.mark.parametrize('url', [
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://youtube.com/watch?v=dQw4w9WgXcQ&t=42',
+    'https://m.youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://music.youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://youtu.be/dQw4w9WgXcQ',
+])
+def test_accepted_urls_resolve_to_the_same_id(url):
+    assert validate_url(url)
+    assert extract_video_id(url) == 'dQw4w9WgXcQ'
+
+def test_rejects_other_hosts():
+    assert not validate_url('https://example.com/watch?v=dQw4w9WgXcQ')
+
+@pytest.mark.parametrize('value', ['dQw4w9WgXcQ\n', 'dQw4w9WgXc', 'dQw4w9WgXcQQ', ''])
+def test_video_id_must_match_exactly(value):
+    assert not validate_video_id(value)
+    assert extract_video_id(value) is None
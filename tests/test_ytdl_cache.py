@@ -0,0 +1,45 @@
+import yt_dlp
+from prometheus_client import REGISTRY
+
+from utils.extraction_service import ExtractionService
+from utils.ytdl_cache import InstrumentedCache, collect_lookups, record_lookups
+
+def metric(section, result):
+    return REGISTRY.get_sample_value('ytdl_player_cache_total', {'section': section, 'result': result}) or 0
+
+def make_cache(tmp_path):
+    ydl = yt_dlp.YoutubeDL({'quiet': True, 'cachedir': str(tmp_path)})
+    cache = InstrumentedCache(ydl)
+    cache.store('test-section', 'player', {'ok': True})
+    return cache
+
+def test_lookups_are_recorded_directly_outside_a_collector(tmp_path):
+    cache = make_cache(tmp_path)
+    before_hit, before_miss = metric('test-section', 'hit'), metric('test-section', 'miss')
+    assert cache.load('test-section', 'player') == {'ok': True}
+    assert cache.load('test-section', 'other', default='x') == 'x'
+    assert metric('test-section', 'hit') == before_hit + 1
+    assert metric('test-section', 'miss') == before_miss + 1
+
+def test_collector_defers_recording_to_the_caller(tmp_path):
+    cache = make_cache(tmp_path)
+    before = metric('test-section', 'hit')
+    with collect_lookups() as lookups:
+        cache.load('test-section', 'player')
+        cache.load('test-section', 'player')
+        cache.load('test-section', 'other')
+    assert lookups == {('test-section', True): 2, ('test-section', False): 1}
+    assert metric('test-section', 'hit') == before
+
+    record_lookups(lookups)
+    assert metric('test-section', 'hit') == before + 2
+
+def test_process_backend_returns_lookups_to_the_parent():
+    # A extração falha rápido (porta fechada), mas o resultado atravessa o processo
+    service = ExtractionService(backend='process', workers=1, timeout=60)
+    try:
+        result = service._submit('http://127.0.0.1:9/video', 'test', {'quiet': True, 'socket_timeout': 5}, 60)
+    finally:
+        service.shutdown()
+    assert 'error' in result
+    assert isinstance(result['cache_lookups'], dict)
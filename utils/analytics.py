@@ -1,9 +1,50 @@
-import yt_dlp
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 import json
 import os
 from config import Config
+from utils.extractor import cache, get_raw_video_info
+from utils.cache_manager import CacheableError
+from utils.extraction_service import extraction_service
+from utils.deadline import current_deadline
+
+def build_video_metrics(info: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Monta as métricas de um vídeo a partir da extração bruta
+    
+    Args:
+        info (dict): Informações extraídas pelo yt-dlp
+        
+    Returns:
+        dict: Métricas do vídeo
+    """
+    return {
+        'basic_info': {
+            'title': info.get('title'),
+            'channel': info.get('channel'),
+            'channel_id': info.get('channel_id'),
+            'duration': info.get('duration'),
+            'upload_date': info.get('upload_date')
+        },
+        'engagement': {
+            'view_count': info.get('view_count'),
+            'like_count': info.get('like_count'),
+            'comment_count': info.get('comment_count'),
+            'average_rating': info.get('average_rating')
+        },
+        'metadata': {
+            'tags': info.get('tags', []),
+            'categories': info.get('categories', []),
+            'language': info.get('language'),
+            'age_restricted': info.get('age_restricted', False)
+        },
+        'technical': {
+            'available_qualities': [f.get('format_note') for f in info.get('formats', []) if f.get('format_note')],
+            'formats': len(info.get('formats', [])),
+            'resolution': info.get('resolution'),
+            'filesize_approx': info.get('filesize_approx')
+        }
+    }
 
 class YouTubeAnalytics:
     def __init__(self):
@@ -25,23 +66,30 @@ class YouTubeAnalytics:
             dict: Informações do canal
         """
         try:
-            with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-                channel_info = ydl.extract_info(channel_url, download=False)
-                
-                return {
-                    'id': channel_info.get('channel_id'),
-                    'name': channel_info.get('channel'),
-                    'description': channel_info.get('description'),
-                    'subscriber_count': channel_info.get('subscriber_count'),
-                    'video_count': channel_info.get('video_count'),
-                    'view_count': channel_info.get('view_count'),
-                    'channel_url': channel_info.get('channel_url'),
-                    'thumbnails': channel_info.get('thumbnails'),
-                    'country': channel_info.get('country'),
-                    'joined_date': channel_info.get('upload_date'),
-                    'categories': channel_info.get('categories', []),
-                    'tags': channel_info.get('tags', [])
-                }
+            deadline = current_deadline()
+            opts = self.ydl_opts.copy()
+            if deadline is not None:
+                opts.update(deadline.ytdl_options())
+            
+            channel_info = extraction_service.extract(channel_url, 'analytics_channel', opts, deadline)
+            
+            return {
+                'id': channel_info.get('channel_id'),
+                'name': channel_info.get('channel'),
+                'description': channel_info.get('description'),
+                'subscriber_count': channel_info.get('subscriber_count'),
+                'video_count': channel_info.get('video_count'),
+                'view_count': channel_info.get('view_count'),
+                'channel_url': channel_info.get('channel_url'),
+                'thumbnails': channel_info.get('thumbnails'),
+                'country': channel_info.get('country'),
+                'joined_date': channel_info.get('upload_date'),
+                'categories': channel_info.get('categories', []),
+                'tags': channel_info.get('tags', [])
+            }
+        except CacheableError:
+            # Fila de extração cheia ou prazo da requisição excedido
+            raise
         except Exception as e:
             raise Exception(f"Erro ao obter informações do canal: {str(e)}")
 
@@ -62,26 +110,30 @@ class YouTubeAnalytics:
                 'extract_flat': 'in_playlist',
                 'playlistend': limit
             })
+            deadline = current_deadline()
+            if deadline is not None:
+                opts.update(deadline.ytdl_options())
+            
+            playlist = extraction_service.extract(f"{channel_url}/videos", 'analytics_videos', opts, deadline)
             
-            with yt_dlp.YoutubeDL(opts) as ydl:
-                playlist = ydl.extract_info(f"{channel_url}/videos", download=False)
+            videos = []
+            for entry in playlist['entries'][:limit]:
+                videos.append({
+                    'id': entry.get('id'),
+                    'title': entry.get('title'),
+                    'description': entry.get('description'),
+                    'duration': entry.get('duration'),
+                    'view_count': entry.get('view_count'),
+                    'like_count': entry.get('like_count'),
+                    'comment_count': entry.get('comment_count'),
+                    'upload_date': entry.get('upload_date'),
+                    'thumbnails': entry.get('thumbnails'),
+                    'url': f"https://www.youtube.com/watch?v={entry.get('id')}"
+                })
                 
-                videos = []
-                for entry in playlist['entries'][:limit]:
-                    videos.append({
-                        'id': entry.get('id'),
-                        'title': entry.get('title'),
-                        'description': entry.get('description'),
-                        'duration': entry.get('duration'),
-                        'view_count': entry.get('view_count'),
-                        'like_count': entry.get('like_count'),
-                        'comment_count': entry.get('comment_count'),
-                        'upload_date': entry.get('upload_date'),
-                        'thumbnails': entry.get('thumbnails'),
-                        'url': f"https://www.youtube.com/watch?v={entry.get('id')}"
-                    })
-                    
-                return videos
+            return videos
+        except CacheableError:
+            raise
         except Exception as e:
             raise Exception(f"Erro ao obter vídeos do canal: {str(e)}")
 
@@ -96,41 +148,21 @@ class YouTubeAnalytics:
             dict: Métricas do vídeo
         """
         try:
-            url = f"https://www.youtube.com/watch?v={video_id}"
-            with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                
-                return {
-                    'basic_info': {
-                        'title': info.get('title'),
-                        'channel': info.get('channel'),
-                        'channel_id': info.get('channel_id'),
-                        'duration': info.get('duration'),
-                        'upload_date': info.get('upload_date')
-                    },
-                    'engagement': {
-                        'view_count': info.get('view_count'),
-                        'like_count': info.get('like_count'),
-                        'comment_count': info.get('comment_count'),
-                        'average_rating': info.get('average_rating')
-                    },
-                    'technical': {
-                        'formats': len(info.get('formats', [])),
-                        'available_qualities': [
-                            f['format_note'] 
-                            for f in info.get('formats', []) 
-                            if f.get('format_note')
-                        ],
-                        'filesize_approx': info.get('filesize_approx'),
-                        'resolution': info.get('resolution')
-                    },
-                    'metadata': {
-                        'categories': info.get('categories', []),
-                        'tags': info.get('tags', []),
-                        'language': info.get('language'),
-                        'age_restricted': info.get('age_restricted', False)
-                    }
-                }
+            # Reaproveita a extração bruta compartilhada com as rotas de informação
+            metrics = cache.get(f'metrics_{video_id}')
+            if metrics:
+                return metrics
+
+            info = get_raw_video_info(video_id, 'minimal')
+            if not info:
+                raise Exception("Não foi possível obter informações do vídeo")
+
+            metrics = build_video_metrics(info)
+            cache.set(f'metrics_{video_id}', metrics, 3600)
+            return metrics
+        except CacheableError:
+            # Mantém o status da classe de erro (404, 403, 451...)
+            raise
         except Exception as e:
             raise Exception(f"Erro ao obter métricas do vídeo: {str(e)}")
 
@@ -0,0 +1,258 @@
+import asyncio
+import contextvars
+import io
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.deadline import start_request_deadline
+
+class _ResponseState:
+    """
+    Estado da resposta compartilhado entre o event loop e a thread do WSGI
+
+    `started` e `abandoned` só são lidos e alterados no event loop, então
+    não precisam de lock (e o loop nunca bloqueia esperando a thread).
+    """
+
+    def __init__(self):
+        self.started = False
+        self.abandoned = False
+        self.status = 500
+        self.headers: List[Tuple[bytes, bytes]] = []
+
+class AsyncWSGIBridge:
+    """
+    Front end ASGI para a aplicação Flask
+
+    As conexões ficam no event loop. Antes de a rota rodar, `prefetch`
+    aguarda no próprio loop a extração de que ela vai precisar (o yt-dlp
+    roda no pool do extraction_service): enquanto espera pelo upstream, a
+    requisição não ocupa thread nenhuma. Só então a rota roda em um pool de
+    threads próprio, com limite de requisições em andamento, e recebe o
+    resultado pelo contexto (contextvars) da requisição.
+
+    O excesso espera por uma vaga em uma fila limitada (503 se a fila
+    estiver cheia ou a espera passar de `queue_timeout`) e uma requisição
+    que não começa a responder em `request_timeout`, contado desde a
+    chegada, recebe 504. Esse prazo é só uma rede de segurança: deve ficar
+    acima do prazo da própria aplicação (`deadline`), que responde antes
+    com dados parciais. Rotas e contratos JSON são os mesmos do modo WSGI.
+    """
+
+    def __init__(self, wsgi_app, max_in_flight: int = 64, max_queue: int = 256,
+                 queue_timeout: float = 10, request_timeout: float = 30,
+                 prefetch: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+                 deadline: Optional[float] = None):
+        """
+        Args:
+            wsgi_app: Aplicação WSGI (ex: app.wsgi_app ou a própria app Flask)
+            max_in_flight: Requisições executando ao mesmo tempo (threads)
+            max_queue: Requisições aguardando uma vaga
+            queue_timeout: Espera máxima (segundos) por uma vaga
+            request_timeout: Prazo (segundos) para a resposta começar
+            prefetch: Corrotina chamada com o scope antes da rota, no event loop
+            deadline: Prazo (segundos) da aplicação, iniciado na chegada da
+                requisição e herdado pela rota
+        """
+        self.wsgi_app = wsgi_app
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+        self.prefetch = prefetch
+        self.deadline = deadline
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='asgi')
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @classmethod
+    def from_app(cls, app, prefetch: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+                 ) -> 'AsyncWSGIBridge':
+        """
+        Cria o front end com os limites ASGI_* da aplicação
+
+        O prazo do bridge é REQUEST_TIMEOUT + ASGI_TIMEOUT_GRACE, para que o
+        504 da própria aplicação (com dados parciais) chegue primeiro.
+        """
+        return cls(
+            app,
+            max_in_flight=app.config.get('ASGI_MAX_IN_FLIGHT', 64),
+            max_queue=app.config.get('ASGI_MAX_QUEUE', 256),
+            queue_timeout=app.config.get('ASGI_QUEUE_TIMEOUT', 10),
+            request_timeout=app.config.get('REQUEST_TIMEOUT', 30) + app.config.get('ASGI_TIMEOUT_GRACE', 5),
+            prefetch=prefetch,
+            deadline=app.config.get('REQUEST_TIMEOUT')
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+
+        loop = asyncio.get_running_loop()
+        arrived = loop.time()
+        body = await self._read_body(receive)
+        # Cada requisição roda em sua própria task: o prazo fica no contexto dela
+        start_request_deadline(self.deadline)
+
+        if self.prefetch is not None:
+            try:
+                await self.prefetch(scope)
+            except Exception as e:
+                # A rota ainda pode extrair por conta própria, na thread
+                print(f"Erro na extração antecipada: {str(e)}")
+
+        if self._slots.locked() and self._waiting >= self.max_queue:
+            self.rejected += 1
+            await self._send_error(send, 503, 'Servidor sobrecarregado, tente novamente', retry_after=1)
+            return
+
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            await self._send_error(send, 503, 'Servidor sobrecarregado, tente novamente', retry_after=1)
+            return
+        finally:
+            self._waiting -= 1
+
+        state = _ResponseState()
+        environ = self._build_environ(scope, body)
+        # A rota herda o contexto da requisição: prazo e extração antecipada
+        context = contextvars.copy_context()
+        future = loop.run_in_executor(self.executor, context.run, self._run_wsgi, environ, state, send, loop)
+        # A vaga só é liberada quando a thread termina, mesmo após um 504
+        future.add_done_callback(lambda _: self._slots.release())
+
+        remaining = max(0.0, self.request_timeout - (loop.time() - arrived))
+        done, _ = await asyncio.wait({future}, timeout=remaining)
+        if not done:
+            # No event loop: não concorre com _send_from_worker
+            if not state.started:
+                state.abandoned = True
+                self.timed_out += 1
+                await self._send_error(send, 504, 'Tempo limite da requisição excedido')
+                return
+
+        # A resposta já começou (ex: NDJSON em streaming): acompanha até o fim
+        await future
+
+    async def _read_body(self, receive) -> bytes:
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunks.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        return b''.join(chunks)
+
+    @staticmethod
+    def _build_environ(scope, body: bytes) -> Dict[str, Any]:
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+                key = name
+            else:
+                key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    @staticmethod
+    async def _send_from_worker(state: _ResponseState, send, message) -> bool:
+        """Envia uma mensagem da thread do WSGI; roda no event loop"""
+        if state.abandoned:
+            return False
+        if not state.started:
+            state.started = True
+            await send({'type': 'http.response.start', 'status': state.status, 'headers': state.headers})
+        if message is not None:
+            await send(message)
+        return True
+
+    def _run_wsgi(self, environ, state: _ResponseState, send, loop) -> None:
+        """Executa a aplicação WSGI na thread e envia a resposta pelo event loop"""
+
+        def send_message(message) -> bool:
+            # A decisão entre enviar e abandonar é tomada no loop; a thread só espera
+            return asyncio.run_coroutine_threadsafe(self._send_from_worker(state, send, message), loop).result()
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and state.started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            state.status = int(status.split(' ', 1)[0])
+            state.headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+            def write(data):
+                send_message({'type': 'http.response.body', 'body': data, 'more_body': True})
+            return write
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                if chunk and not send_message({'type': 'http.response.body', 'body': chunk, 'more_body': True}):
+                    # Requisição abandonada por timeout: não envia mais nada
+                    return
+            send_message({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    @staticmethod
+    async def _send_error(send, status: int, message: str, retry_after: Optional[int] = None):
+        body = json.dumps({'error': message}).encode('utf-8')
+        headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        if retry_after is not None:
+            headers.append((b'retry-after', str(retry_after).encode()))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'max_in_flight': self.max_in_flight,
+            'waiting': self._waiting,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out
+        }
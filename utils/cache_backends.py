@@ -0,0 +1,477 @@
+import os
+import time
+import uuid
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from utils.cache_format import read_header
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+class CacheBackend:
+    """
+    Interface dos backends de armazenamento usados pelo CacheManager
+
+    Os backends armazenam bytes já serializados. A serialização, a
+    verificação de expiração e o cache em memória ficam no CacheManager.
+    """
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Obtém os bytes armazenados para uma chave"""
+        raise NotImplementedError
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        """Obtém várias chaves de uma vez, omitindo as ausentes"""
+        result = {}
+        for key in keys:
+            data = self.get(key)
+            if data is not None:
+                result[key] = data
+        return result
+
+    def set(self, key: str, data: bytes, expires_at: float) -> bool:
+        """Armazena bytes até o instante (epoch) expires_at"""
+        raise NotImplementedError
+
+    def set_many(self, items: Dict[str, bytes], expires_at: float) -> bool:
+        """Armazena várias chaves com a mesma expiração"""
+        return all([self.set(key, data, expires_at) for key, data in items.items()])
+
+    def delete(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def clear(self) -> bool:
+        raise NotImplementedError
+
+    def cleanup_expired(self, budget: Optional[float] = None) -> int:
+        """
+        Remove entradas expiradas, retornando quantas foram removidas
+
+        Args:
+            budget: Tempo máximo (segundos) da limpeza; None para limpar tudo
+        """
+        return 0
+
+    def stats(self) -> Optional[Tuple[int, int]]:
+        """Retorna (entradas, bytes) armazenados, ou None se o backend não souber"""
+        return None
+
+    supports_locks = False
+
+    def acquire_lock(self, name: str, ttl: float) -> Optional[Any]:
+        """
+        Tenta obter um lock entre processos sem bloquear
+
+        Retorna um token a ser passado para release_lock, ou None se o lock
+        já estiver com outro processo.
+        """
+        raise NotImplementedError
+
+    def release_lock(self, name: str, token: Any) -> None:
+        raise NotImplementedError
+
+class NullBackend(CacheBackend):
+    """Backend que não armazena nada (CACHE_TYPE 'null' e 'simple')"""
+
+    def get(self, key: str) -> Optional[bytes]:
+        return None
+
+    def set(self, key: str, data: bytes, expires_at: float) -> bool:
+        return True
+
+    def delete(self, key: str) -> bool:
+        return True
+
+    def clear(self) -> bool:
+        return True
+
+class FileSystemBackend(CacheBackend):
+    """
+    Backend que grava cada chave em um arquivo no diretório de cache
+
+    Os arquivos ficam em dois níveis de subdiretórios derivados do hash da
+    chave (ab/cd/abcd....cache), evitando diretórios com centenas de
+    milhares de arquivos. Um índice SQLite guarda a expiração de cada
+    arquivo, de modo que a limpeza só toca entradas realmente expiradas.
+
+    As escritas são atômicas (arquivo temporário + rename), então leitores
+    concorrentes nunca veem um arquivo truncado.
+    """
+
+    EXTENSION = '.cache'
+    INDEX_FILE = 'index.sqlite3'
+    # Temporários de escritas interrompidas são removidos após esse tempo
+    TMP_MAX_AGE = 3600
+
+    def __init__(self, cache_dir: str = 'cache', fsync: bool = False):
+        """
+        Args:
+            cache_dir: Diretório do cache
+            fsync: Força fsync antes do rename (mais durável, mais lento)
+        """
+        self.cache_dir = cache_dir
+        self.fsync = fsync
+        self._local = threading.local()
+        self._tmp_sweep_next = 0
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        index_path = os.path.join(cache_dir, self.INDEX_FILE)
+        new_index = not os.path.exists(index_path)
+        self._index_path = index_path
+        with self._index() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'path TEXT PRIMARY KEY, expires_at REAL NOT NULL, size INTEGER NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at)')
+        if new_index:
+            self.reindex()
+
+    def _index(self) -> sqlite3.Connection:
+        """Conexão com o índice de expiração (uma por thread)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._index_path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _get_cache_path(self, key: str) -> str:
+        """Gera o caminho do arquivo de cache para uma chave"""
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest[2:4], f"{digest}{self.EXTENSION}")
+
+    def _shard_dirs(self):
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if len(name) == 2 and os.path.isdir(path) and all(c in '0123456789abcdef' for c in name):
+                yield path
+
+    def get(self, key: str) -> Optional[bytes]:
+        cache_path = self._get_cache_path(key)
+
+        try:
+            with open(cache_path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Erro ao ler cache: {str(e)}")
+            return None
+
+    def set(self, key: str, data: bytes, expires_at: float) -> bool:
+        cache_path = self._get_cache_path(key)
+
+        tmp_path = None
+        try:
+            shard_dir = os.path.dirname(cache_path)
+            os.makedirs(shard_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=shard_dir, prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, cache_path)
+            self._index().execute(
+                'INSERT OR REPLACE INTO entries (path, expires_at, size) VALUES (?, ?, ?)',
+                (cache_path, expires_at, len(data))
+            )
+            return True
+        except Exception as e:
+            print(f"Erro ao escrever cache: {str(e)}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+    def delete(self, key: str) -> bool:
+        cache_path = self._get_cache_path(key)
+
+        try:
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+            self._index().execute('DELETE FROM entries WHERE path = ?', (cache_path,))
+            return True
+        except Exception as e:
+            print(f"Erro ao deletar cache: {str(e)}")
+            return False
+
+    def clear(self) -> bool:
+        try:
+            for shard_dir in list(self._shard_dirs()):
+                shutil.rmtree(shard_dir, ignore_errors=True)
+            self._index().execute('DELETE FROM entries')
+            return True
+        except Exception as e:
+            print(f"Erro ao limpar cache: {str(e)}")
+            return False
+
+    def stats(self) -> Optional[Tuple[int, int]]:
+        try:
+            count, size = self._index().execute('SELECT COUNT(*), SUM(size) FROM entries').fetchone()
+            return count, size or 0
+        except Exception as e:
+            print(f"Erro ao consultar índice do cache: {str(e)}")
+            return None
+
+    @property
+    def supports_locks(self) -> bool:
+        return fcntl is not None
+
+    def acquire_lock(self, name: str, ttl: float) -> Optional[Any]:
+        # flock é liberado pelo sistema se o processo morrer, então o ttl não é necessário
+        lock_dir = os.path.join(self.cache_dir, 'locks')
+        os.makedirs(lock_dir, exist_ok=True)
+        safe_name = "".join(c if c.isalnum() else "_" for c in name)
+        fd = os.open(os.path.join(lock_dir, f"{safe_name}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except OSError:
+            os.close(fd)
+            return None
+
+    def release_lock(self, name: str, token: Any) -> None:
+        try:
+            fcntl.flock(token, fcntl.LOCK_UN)
+        finally:
+            os.close(token)
+
+    def cleanup_expired(self, budget: Optional[float] = None, batch_size: int = 500) -> int:
+        """
+        Remove as entradas expiradas consultando o índice
+
+        Com o tempo que sobrar, remove também os temporários (.tmp-*) de
+        escritas interrompidas, que não estão no índice.
+
+        Args:
+            budget: Tempo máximo (segundos) da limpeza; None para limpar tudo
+            batch_size: Número de entradas removidas por consulta ao índice
+        """
+        removed = 0
+        started = time.time()
+        conn = self._index()
+        try:
+            while budget is None or time.time() - started < budget:
+                now = time.time()
+                rows = conn.execute(
+                    'SELECT path FROM entries WHERE expires_at < ? ORDER BY expires_at LIMIT ?',
+                    (now, batch_size)
+                ).fetchall()
+                if not rows:
+                    break
+
+                for (path,) in rows:
+                    try:
+                        # Confere o cabeçalho: o arquivo pode ter sido regravado depois da consulta
+                        header = read_header(path)
+                        if header is None or now > header.expires_at:
+                            os.remove(path)
+                            removed += 1
+                    except FileNotFoundError:
+                        pass
+                    except Exception as e:
+                        print(f"Erro ao limpar cache expirado: {str(e)}")
+
+                conn.executemany(
+                    'DELETE FROM entries WHERE path = ? AND expires_at < ?',
+                    [(path, now) for (path,) in rows]
+                )
+            removed += self._sweep_temp_files(None if budget is None else started + budget)
+            return removed
+        except Exception as e:
+            print(f"Erro ao limpar cache expirado: {str(e)}")
+            return removed
+
+    def _sweep_temp_files(self, deadline: Optional[float] = None) -> int:
+        """
+        Remove os temporários com mais de TMP_MAX_AGE segundos
+
+        Percorre um diretório de primeiro nível por vez; se o tempo acabar,
+        a próxima limpeza continua de onde esta parou.
+        """
+        shard_dirs = sorted(self._shard_dirs())
+        removed = 0
+        start = self._tmp_sweep_next
+        for i in range(len(shard_dirs)):
+            if deadline is not None and time.time() >= deadline:
+                break
+            position = (start + i) % len(shard_dirs)
+            for dirpath, _, filenames in os.walk(shard_dirs[position]):
+                for filename in filenames:
+                    if not filename.startswith('.tmp-'):
+                        continue
+                    file_path = os.path.join(dirpath, filename)
+                    try:
+                        if time.time() - os.path.getmtime(file_path) > self.TMP_MAX_AGE:
+                            os.remove(file_path)
+                            removed += 1
+                    except FileNotFoundError:
+                        pass
+            self._tmp_sweep_next = position + 1
+        return removed
+
+    def reindex(self) -> int:
+        """
+        Reconstrói o índice percorrendo os arquivos do cache
+
+        Usado quando o índice ainda não existe. Arquivos do layout antigo
+        (na raiz do diretório) são removidos. Retorna o número de entradas indexadas.
+        """
+        for filename in os.listdir(self.cache_dir):
+            file_path = os.path.join(self.cache_dir, filename)
+            if os.path.isfile(file_path) and (filename.endswith(('.json', self.EXTENSION)) or filename.startswith('.tmp-')):
+                os.remove(file_path)
+
+        rows = []
+        for shard_dir in self._shard_dirs():
+            for dirpath, _, filenames in os.walk(shard_dir):
+                for filename in filenames:
+                    file_path = os.path.join(dirpath, filename)
+                    try:
+                        header = read_header(file_path) if filename.endswith(self.EXTENSION) else None
+                        if header is None:
+                            os.remove(file_path)
+                            continue
+                        rows.append((file_path, header.expires_at, os.path.getsize(file_path)))
+                    except OSError:
+                        continue
+
+        self._index().executemany(
+            'INSERT OR REPLACE INTO entries (path, expires_at, size) VALUES (?, ?, ?)', rows
+        )
+        return len(rows)
+
+class RedisBackend(CacheBackend):
+    """
+    Backend Redis compartilhado entre workers e nós
+
+    Usa um pool de conexões, expiração nativa (PEXPIREAT via SET PXAT) e
+    pipelines para leituras e escritas em lote. Um cliente já construído
+    (por exemplo fakeredis.FakeRedis) pode ser passado em `client`.
+    """
+
+    def __init__(self, url: Optional[str] = None, prefix: str = 'ytpy:cache:',
+                 max_connections: int = 50, client=None):
+        if client is None:
+            import redis
+            pool = redis.ConnectionPool.from_url(url, max_connections=max_connections)
+            client = redis.Redis(connection_pool=pool)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self.client.get(self._key(key))
+        except Exception as e:
+            print(f"Erro ao ler cache: {str(e)}")
+            return None
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        try:
+            values = self.client.mget([self._key(k) for k in keys])
+            return {k: v for k, v in zip(keys, values) if v is not None}
+        except Exception as e:
+            print(f"Erro ao ler cache: {str(e)}")
+            return {}
+
+    def set(self, key: str, data: bytes, expires_at: float) -> bool:
+        return self.set_many({key: data}, expires_at)
+
+    def set_many(self, items: Dict[str, bytes], expires_at: float) -> bool:
+        expires_at_ms = int(expires_at * 1000)
+        if expires_at_ms <= int(time.time() * 1000):
+            return True
+
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, data in items.items():
+                pipe.set(self._key(key), data, pxat=expires_at_ms)
+            pipe.execute()
+            return True
+        except Exception as e:
+            print(f"Erro ao escrever cache: {str(e)}")
+            return False
+
+    def delete(self, key: str) -> bool:
+        try:
+            self.client.delete(self._key(key))
+            return True
+        except Exception as e:
+            print(f"Erro ao deletar cache: {str(e)}")
+            return False
+
+    def clear(self) -> bool:
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for i, redis_key in enumerate(self.client.scan_iter(match=f"{self.prefix}*", count=500), 1):
+                pipe.delete(redis_key)
+                if i % 500 == 0:
+                    pipe.execute()
+            pipe.execute()
+            return True
+        except Exception as e:
+            print(f"Erro ao limpar cache: {str(e)}")
+            return False
+
+    def stats(self) -> Optional[Tuple[int, int]]:
+        # Aproximado: conta todo o banco (DBSIZE) e a memória usada pelo servidor
+        try:
+            return self.client.dbsize(), self.client.info('memory').get('used_memory', 0)
+        except Exception as e:
+            print(f"Erro ao consultar Redis: {str(e)}")
+            return None
+
+    supports_locks = True
+
+    # Remove o lock apenas se ele ainda pertencer a quem o obteve
+    _RELEASE_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+
+    def acquire_lock(self, name: str, ttl: float) -> Optional[Any]:
+        token = uuid.uuid4().hex
+        if self.client.set(f"{self.prefix}lock:{name}", token, nx=True, px=int(ttl * 1000)):
+            return token
+        return None
+
+    def release_lock(self, name: str, token: Any) -> None:
+        try:
+            self.client.eval(self._RELEASE_SCRIPT, 1, f"{self.prefix}lock:{name}", token)
+        except Exception as e:
+            print(f"Erro ao liberar lock: {str(e)}")
+
+def create_backend(cache_type: str = 'filesystem', cache_dir: str = 'cache',
+                   redis_url: Optional[str] = None, fsync: bool = False) -> CacheBackend:
+    """
+    Cria o backend correspondente a CACHE_TYPE
+
+    'redis' usa CACHE_REDIS_URL; sem URL configurada cai para o disco.
+    'simple' e 'null' não têm armazenamento persistente.
+    """
+    if cache_type == 'redis':
+        if redis_url:
+            return RedisBackend(redis_url)
+        print("CACHE_REDIS_URL não configurada, usando cache em disco")
+    elif cache_type in ('simple', 'null'):
+        return NullBackend()
+    return FileSystemBackend(cache_dir, fsync)
@@ -0,0 +1,74 @@
+import json
+import struct
+import zlib
+from typing import Any, NamedTuple, Optional, Tuple
+
+# Cabeçalho: magic, versão, codec, fresh_until, expires_at, tamanho do JSON
+HEADER = struct.Struct('>4sBBddI')
+MAGIC = b'YTPC'
+VERSION = 1
+
+CODEC_JSON = 0
+CODEC_JSON_ZLIB = 1
+
+# Valores menores que isso não compensam a compressão
+COMPRESS_MIN_BYTES = 1024
+
+class EntryHeader(NamedTuple):
+    codec: int
+    fresh_until: float
+    expires_at: float
+    raw_size: int
+
+def encode_entry(value: Any, fresh_until: float, expires_at: float,
+                 compress_level: int = 6) -> bytes:
+    """
+    Serializa um valor do cache no formato binário versionado
+
+    O valor é gravado como JSON compacto, comprimido com zlib quando passa
+    de COMPRESS_MIN_BYTES. Os prazos ficam no cabeçalho de tamanho fixo,
+    de modo que podem ser lidos sem decodificar o valor.
+    """
+    raw = json.dumps(value, separators=(',', ':')).encode('utf-8')
+    codec = CODEC_JSON
+    payload = raw
+    if compress_level > 0 and len(raw) >= COMPRESS_MIN_BYTES:
+        codec = CODEC_JSON_ZLIB
+        payload = zlib.compress(raw, compress_level)
+
+    header = HEADER.pack(MAGIC, VERSION, codec, fresh_until, expires_at, len(raw))
+    return header + payload
+
+def decode_header(data: bytes) -> Optional[EntryHeader]:
+    """Lê apenas o cabeçalho; retorna None se os bytes não estiverem no formato"""
+    if len(data) < HEADER.size:
+        return None
+
+    magic, version, codec, fresh_until, expires_at, raw_size = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        return None
+    return EntryHeader(codec, fresh_until, expires_at, raw_size)
+
+def decode_entry(data: bytes) -> Tuple[Any, EntryHeader]:
+    """
+    Decodifica uma entrada completa
+
+    Raises:
+        ValueError: Se os bytes não estiverem no formato ou usarem um codec desconhecido
+    """
+    header = decode_header(data)
+    if header is None:
+        raise ValueError('Formato de cache desconhecido')
+
+    payload = data[HEADER.size:]
+    if header.codec == CODEC_JSON_ZLIB:
+        payload = zlib.decompress(payload)
+    elif header.codec != CODEC_JSON:
+        raise ValueError(f'Codec de cache desconhecido: {header.codec}')
+
+    return json.loads(payload), header
+
+def read_header(path: str) -> Optional[EntryHeader]:
+    """Lê o cabeçalho de um arquivo de cache sem carregar o valor"""
+    with open(path, 'rb') as f:
+        return decode_header(f.read(HEADER.size))
@@ -1,42 +1,280 @@
-import os
-import json
 import time
-from typing import Any, Optional
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from utils.cache_backends import CacheBackend, FileSystemBackend, create_backend
+from utils.cache_format import encode_entry, decode_entry, decode_header
+from utils.metrics import (
+    record_cache_metrics, record_negative_cache_hit, record_cache_stale_hit,
+    record_cache_latency, record_cache_value_size
+)
+
+# Namespaces usados como label nas métricas (o prefixo da chave até o primeiro '_')
+CACHE_NAMESPACES = ('info', 'subs', 'transcript', 'comments', 'metrics', 'channel', 'raw', 'flight')
+
+def cache_namespace(key: str) -> str:
+    """Namespace de uma chave de cache, limitado aos conhecidos para não explodir labels"""
+    namespace = key.split('_', 1)[0]
+    return namespace if namespace in CACHE_NAMESPACES else 'other'
+
+# Chave reservada que marca uma entrada negativa (falha guardada no cache)
+NEGATIVE_MARKER = '__negative__'
+
+class CacheableError(Exception):
+    """
+    Erro que pode ser guardado no cache como entrada negativa
+
+    Quando o loader de get_or_set levanta este erro com ttl > 0, a falha é
+    guardada e as próximas chamadas levantam o mesmo erro (com cached=True)
+    sem executar o loader novamente.
+    """
+
+    def __init__(self, kind: str, message: str, status_code: int = 500,
+                 ttl: int = 0, cached: bool = False):
+        super().__init__(message)
+        self.kind = kind
+        self.message = message
+        self.status_code = status_code
+        self.ttl = ttl
+        self.cached = cached
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Corpo da resposta de erro"""
+        return {'error': self.message, 'reason': self.kind}
+
+def _is_negative(value: Any) -> bool:
+    return isinstance(value, dict) and NEGATIVE_MARKER in value
+
+class MemoryCache:
+    """
+    Cache LRU em memória, limitado por número de entradas e por bytes
+
+    Guarda o valor já desserializado, de modo que um hit custa apenas uma
+    consulta ao dicionário. O tamanho de cada entrada é o tamanho do JSON
+    serializado (antes da compressão usada no backend).
+
+    Cada entrada tem dois prazos: `fresh_until` (TTL suave, depois do qual
+    o valor é considerado velho) e `expires_at` (TTL rígido, depois do qual
+    a entrada é descartada).
+    """
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: 'OrderedDict[str, Tuple[Any, float, float, int]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[bool, Any, float]:
+        """Retorna (encontrado, valor, fresh_until), descartando entradas expiradas"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None, 0
+
+            value, fresh_until, expires_at, _ = entry
+            if time.time() > expires_at:
+                self._pop(key)
+                return False, None, 0
+
+            self._entries.move_to_end(key)
+            return True, value, fresh_until
+
+    def set(self, key: str, value: Any, fresh_until: float, expires_at: float, size: int) -> None:
+        """Armazena um valor, removendo os menos usados se exceder os limites"""
+        with self._lock:
+            self._pop(key)
+
+            # Valores maiores que o limite total não entram na memória
+            if size > self.max_bytes or self.max_entries <= 0:
+                return
+
+            self._entries[key] = (value, fresh_until, expires_at, size)
+            self.total_bytes += size
+
+            while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._pop(oldest_key)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def cleanup_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [k for k, entry in self._entries.items() if now > entry[2]]
+            for key in expired:
+                self._pop(key)
+            return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _pop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[3]
 
 class CacheManager:
-    def __init__(self, cache_dir: str = 'cache'):
-        self.cache_dir = cache_dir
-        if not os.path.exists(cache_dir):
-            os.makedirs(cache_dir)
+    def __init__(self, cache_dir: str = 'cache', memory_max_entries: int = 1000,
+                 memory_max_bytes: int = 64 * 1024 * 1024,
+                 backend: Optional[CacheBackend] = None,
+                 refresh_workers: int = 4, refresh_max_pending: int = 32):
+        """
+        Args:
+            cache_dir: Diretório do cache em disco (usado se backend não for informado)
+            memory_max_entries: Número máximo de entradas no cache em memória
+            memory_max_bytes: Tamanho máximo (em bytes) do cache em memória
+            backend: Backend de armazenamento (padrão: FileSystemBackend)
+            refresh_workers: Threads para revalidação em segundo plano
+            refresh_max_pending: Máximo de revalidações pendentes ao mesmo tempo
+        """
+        self.memory = MemoryCache(memory_max_entries, memory_max_bytes)
+        self.backend = backend if backend is not None else FileSystemBackend(cache_dir)
+        self.compress_level = 6
+        self._init_refresh(refresh_workers, refresh_max_pending)
 
-    def _get_cache_path(self, key: str) -> str:
-        """Gera o caminho do arquivo de cache para uma chave"""
-        # Substitui caracteres inválidos no nome do arquivo
-        safe_key = "".join(c if c.isalnum() else "_" for c in key)
-        return os.path.join(self.cache_dir, f"{safe_key}.json")
+    @classmethod
+    def from_config(cls, config) -> 'CacheManager':
+        """Cria um CacheManager a partir de um objeto ou dict de configuração"""
+        cache = cls.__new__(cls)
+        cache.configure(config)
+        return cache
 
-    def get(self, key: str) -> Optional[Any]:
-        """Obtém um valor do cache"""
-        cache_path = self._get_cache_path(key)
-        
-        if not os.path.exists(cache_path):
-            return None
-            
+    def init_app(self, app) -> None:
+        """Reconfigura o cache com as configurações da aplicação Flask"""
+        self.configure(app.config)
+        if app.config.get('CACHE_SWEEP_INTERVAL', 0) > 0:
+            self.start_sweeper(app.config['CACHE_SWEEP_INTERVAL'], app.config.get('CACHE_SWEEP_BUDGET', 2.0))
+
+    def configure(self, config) -> None:
+        """Seleciona backend e limites da memória a partir da configuração"""
+        if not isinstance(config, dict):
+            config = {k: getattr(config, k) for k in dir(config) if k.isupper()}
+
+        cache_type = config.get('CACHE_TYPE', 'filesystem')
+        max_entries = config.get('CACHE_THRESHOLD', 1000)
+        if cache_type == 'null':
+            # Sem cache: nem disco nem memória
+            max_entries = 0
+
+        self.memory = MemoryCache(max_entries, config.get('CACHE_MEMORY_MAX_BYTES', 64 * 1024 * 1024))
+        self.compress_level = config.get('CACHE_COMPRESS_LEVEL', 6)
+        self.backend = create_backend(
+            cache_type,
+            config.get('CACHE_DIR', 'cache'),
+            config.get('CACHE_REDIS_URL'),
+            config.get('CACHE_FSYNC', False)
+        )
+        self._init_refresh(
+            config.get('CACHE_REFRESH_WORKERS', 4),
+            config.get('CACHE_REFRESH_MAX_PENDING', 32)
+        )
+
+    def _init_refresh(self, workers: int, max_pending: int) -> None:
+        old_executor = getattr(self, '_refresh_executor', None)
+        if old_executor is not None:
+            old_executor.shutdown(wait=False)
+
+        self.refresh_workers = workers
+        self.refresh_max_pending = max_pending
+        self._refresh_executor: Optional[ThreadPoolExecutor] = None
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+
+    def _decode(self, key: str, data: bytes) -> Tuple[bool, Any, float]:
+        """Decodifica bytes do backend e promove a entrada para a memória"""
         try:
-            with open(cache_path, 'r') as f:
-                data = json.load(f)
-                
-            # Verifica se o cache expirou
-            if time.time() > data.get('expires_at', 0):
-                self.delete(key)
-                return None
-                
-            return data.get('value')
+            value, header = decode_entry(data)
         except Exception as e:
             print(f"Erro ao ler cache: {str(e)}")
+            return False, None, 0
+
+        # Verifica se o cache expirou
+        if time.time() > header.expires_at:
+            self.delete(key)
+            return False, None, 0
+
+        # Promove a entrada para a memória com a mesma expiração do backend
+        self.memory.set(key, value, header.fresh_until, header.expires_at, header.raw_size)
+        return True, value, header.fresh_until
+
+    def _lookup(self, key: str) -> Tuple[bool, Any, float]:
+        """Retorna (encontrado, valor, fresh_until) da memória ou do backend"""
+        found, value, fresh_until = self.memory.get(key)
+        if found:
+            return found, value, fresh_until
+
+        data = self.backend.get(key)
+        if data is None:
+            return False, None, 0
+
+        return self._decode(key, data)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Obtém um valor do cache (memória primeiro, depois backend)"""
+        started = time.time()
+        found, value, fresh_until = self._lookup(key)
+        hit = found and time.time() <= fresh_until and not _is_negative(value)
+
+        namespace = cache_namespace(key)
+        record_cache_latency('get', namespace, time.time() - started)
+        record_cache_metrics(hit, namespace)
+        return value if hit else None
+
+    def peek(self, key: str) -> Optional[Any]:
+        """
+        Valor que get_or_set serviria (fresco ou velho), sem carregar,
+        revalidar nem registrar métricas
+
+        Raises:
+            CacheableError: Se houver uma entrada negativa para a chave
+        """
+        found, value, _ = self._lookup(key)
+        if not found:
             return None
+        if _is_negative(value):
+            negative = value[NEGATIVE_MARKER]
+            raise CacheableError(negative['kind'], negative['message'],
+                                 negative['status_code'], cached=True)
+        return value
 
-    def set(self, key: str, value: Any, expires_in: int = 3600) -> bool:
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Obtém várias chaves, consultando o backend uma única vez para as ausentes na memória"""
+        keys = list(keys)
+        started = now = time.time()
+        result = {}
+        missing = []
+        for key in keys:
+            found, value, fresh_until = self.memory.get(key)
+            if found and now <= fresh_until and not _is_negative(value):
+                result[key] = value
+            elif not found:
+                missing.append(key)
+
+        for key, data in self.backend.get_many(missing).items():
+            found, value, fresh_until = self._decode(key, data)
+            if found and now <= fresh_until and not _is_negative(value):
+                result[key] = value
+
+        # Uma observação por chamada (no máximo uma ida ao backend), não por chave
+        if keys:
+            namespaces = {cache_namespace(key) for key in keys}
+            namespace = namespaces.pop() if len(namespaces) == 1 else 'mixed'
+            record_cache_latency('get_many', namespace, time.time() - started)
+        for key in keys:
+            record_cache_metrics(key in result, cache_namespace(key))
+        return result
+
+    def set(self, key: str, value: Any, expires_in: int = 3600, stale_for: int = 0) -> bool:
         """
         Armazena um valor no cache
         
@@ -44,71 +282,200 @@ class CacheManager:
             key: Chave do cache
             value: Valor a ser armazenado
             expires_in: Tempo de expiração em segundos (padrão: 1 hora)
+            stale_for: Tempo adicional (segundos) em que o valor velho ainda
+                pode ser servido por get_or_set enquanto é revalidado
         """
-        cache_path = self._get_cache_path(key)
-        
+        return self.set_many({key: value}, expires_in, stale_for)
+
+    def set_many(self, items: Dict[str, Any], expires_in: int = 3600, stale_for: int = 0) -> bool:
+        """Armazena vários valores com a mesma expiração"""
+        started = time.time()
+        fresh_until = started + expires_in
+        expires_at = fresh_until + stale_for
         try:
-            data = {
-                'value': value,
-                'expires_at': time.time() + expires_in
+            payloads = {
+                key: encode_entry(value, fresh_until, expires_at, self.compress_level)
+                for key, value in items.items()
             }
-            
-            with open(cache_path, 'w') as f:
-                json.dump(data, f)
-            return True
         except Exception as e:
             print(f"Erro ao escrever cache: {str(e)}")
             return False
 
+        if not self.backend.set_many(payloads, expires_at):
+            # Evita que a memória continue servindo valores antigos
+            for key in items:
+                self.memory.delete(key)
+            return False
+
+        # Write-through: a memória só recebe o valor depois do backend
+        elapsed = time.time() - started
+        for key, value in items.items():
+            raw_size = decode_header(payloads[key]).raw_size
+            self.memory.set(key, value, fresh_until, expires_at, raw_size)
+
+            namespace = cache_namespace(key)
+            record_cache_latency('set', namespace, elapsed / len(items))
+            record_cache_value_size(namespace, raw_size)
+        return True
+
+    def get_or_set(self, key: str, loader: Callable[[], Any], expires_in: int = 3600,
+                   stale_for: int = 0) -> Optional[Any]:
+        """
+        Obtém um valor do cache ou o carrega com `loader`
+
+        Entre o TTL suave (expires_in) e o rígido (expires_in + stale_for) o
+        valor velho é retornado imediatamente e uma única revalidação é
+        agendada em segundo plano. O loader deve retornar None em caso de
+        falha e não pode depender do contexto da requisição.
+
+        Raises:
+            CacheableError: Se o loader falhar com um erro cacheável, ou se
+                houver uma entrada negativa para a chave
+        """
+        started = time.time()
+        found, value, fresh_until = self._lookup(key)
+        namespace = cache_namespace(key)
+        record_cache_latency('get', namespace, time.time() - started)
+
+        if found:
+            if _is_negative(value):
+                negative = value[NEGATIVE_MARKER]
+                record_negative_cache_hit(negative['kind'], namespace)
+                raise CacheableError(negative['kind'], negative['message'],
+                                     negative['status_code'], cached=True)
+
+            if time.time() > fresh_until:
+                record_cache_stale_hit(namespace)
+                self._schedule_refresh(key, loader, expires_in, stale_for)
+            else:
+                record_cache_metrics(True, namespace)
+            return value
+
+        record_cache_metrics(False, namespace)
+
+        try:
+            value = loader()
+        except CacheableError as e:
+            if e.ttl > 0:
+                self.set_negative(key, e)
+            raise
+
+        if value is not None:
+            self.set(key, value, expires_in, stale_for)
+        return value
+
+    def set_negative(self, key: str, error: CacheableError) -> bool:
+        """Guarda uma falha como entrada negativa pelo ttl do erro"""
+        return self.set(key, {
+            NEGATIVE_MARKER: {
+                'kind': error.kind,
+                'message': error.message,
+                'status_code': error.status_code
+            }
+        }, error.ttl)
+
+    def _schedule_refresh(self, key: str, loader: Callable[[], Any], expires_in: int,
+                          stale_for: int) -> bool:
+        """Agenda a revalidação de uma chave, se ainda não houver uma em andamento"""
+        with self._refresh_lock:
+            if key in self._refreshing or len(self._refreshing) >= self.refresh_max_pending:
+                return False
+            self._refreshing.add(key)
+            if self._refresh_executor is None:
+                self._refresh_executor = ThreadPoolExecutor(
+                    max_workers=self.refresh_workers,
+                    thread_name_prefix='cache-refresh'
+                )
+
+        def refresh():
+            # Entre processos, apenas quem obtiver o lock revalida
+            lock_token = None
+            if self.backend.supports_locks:
+                lock_token = self.backend.acquire_lock(f'refresh_{key}', 60)
+                if lock_token is None:
+                    return
+            try:
+                value = loader()
+                if value is not None:
+                    self.set(key, value, expires_in, stale_for)
+            except Exception as e:
+                print(f"Erro ao revalidar cache: {str(e)}")
+            finally:
+                if lock_token is not None:
+                    self.backend.release_lock(f'refresh_{key}', lock_token)
+
+        future = self._refresh_executor.submit(refresh)
+        future.add_done_callback(lambda _: self._refresh_done(key))
+        return True
+
+    def _refresh_done(self, key: str) -> None:
+        with self._refresh_lock:
+            self._refreshing.discard(key)
+
+    def backend_stats(self) -> Tuple[int, int]:
+        """
+        Retorna (entradas, bytes) do backend
+
+        O resultado é reaproveitado por alguns segundos para que as
+        coletas de métricas não consultem o backend a cada gauge.
+        """
+        now = time.time()
+        cached = getattr(self, '_backend_stats', None)
+        if cached is None or now - cached[0] > 10:
+            stats = self.backend.stats() or (0, 0)
+            cached = self._backend_stats = (now, stats)
+        return cached[1]
+
     def delete(self, key: str) -> bool:
         """Remove um valor do cache"""
-        cache_path = self._get_cache_path(key)
-        
-        try:
-            if os.path.exists(cache_path):
-                os.remove(cache_path)
-            return True
-        except Exception as e:
-            print(f"Erro ao deletar cache: {str(e)}")
-            return False
+        self.memory.delete(key)
+        return self.backend.delete(key)
 
     def clear(self) -> bool:
         """Limpa todo o cache"""
-        try:
-            for filename in os.listdir(self.cache_dir):
-                file_path = os.path.join(self.cache_dir, filename)
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-            return True
-        except Exception as e:
-            print(f"Erro ao limpar cache: {str(e)}")
-            return False
+        self.memory.clear()
+        return self.backend.clear()
 
-    def cleanup_expired(self) -> int:
+    def cleanup_expired(self, budget: Optional[float] = None) -> int:
         """
         Remove todos os itens expirados do cache
-        Retorna o número de itens removidos
+        Retorna o número de itens removidos do backend
+        
+        Args:
+            budget: Tempo máximo (segundos) gasto no backend; None para limpar tudo
         """
-        removed = 0
-        try:
-            for filename in os.listdir(self.cache_dir):
-                if not filename.endswith('.json'):
+        self.memory.cleanup_expired()
+        return self.backend.cleanup_expired(budget=budget)
+
+    def start_sweeper(self, interval: float = 300, budget: float = 2.0) -> None:
+        """
+        Inicia a limpeza periódica do cache em uma thread de segundo plano,
+        para que nenhuma requisição pague pela limpeza
+        
+        Args:
+            interval: Intervalo (segundos) entre limpezas
+            budget: Tempo máximo (segundos) de cada limpeza no backend
+        """
+        if getattr(self, '_sweeper', None) is not None:
+            return
+
+        def sweep():
+            while True:
+                time.sleep(interval)
+                self.memory.cleanup_expired()
+
+                # Com vários processos, apenas um limpa o backend por vez
+                backend = self.backend
+                token = backend.acquire_lock('sweeper', interval) if backend.supports_locks else None
+                if backend.supports_locks and token is None:
                     continue
-                    
-                file_path = os.path.join(self.cache_dir, filename)
                 try:
-                    with open(file_path, 'r') as f:
-                        data = json.load(f)
-                    
-                    if time.time() > data.get('expires_at', 0):
-                        os.remove(file_path)
-                        removed += 1
-                except:
-                    # Se houver erro ao ler o arquivo, remove-o
-                    os.remove(file_path)
-                    removed += 1
-                    
-            return removed
-        except Exception as e:
-            print(f"Erro ao limpar cache expirado: {str(e)}")
-            return removed
+                    backend.cleanup_expired(budget=budget)
+                except Exception as e:
+                    print(f"Erro ao limpar cache expirado: {str(e)}")
+                finally:
+                    if token is not None:
+                        backend.release_lock('sweeper', token)
+
+        self._sweeper = threading.Thread(target=sweep, name='cache-sweeper', daemon=True)
+        self._sweeper.start()
@@ -0,0 +1,90 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from utils.cache_manager import CacheableError
+
+# Valores permitidos de socket_timeout: poucos valores distintos para não
+# fragmentar o pool de YoutubeDL (as opções fazem parte da chave do perfil)
+SOCKET_TIMEOUT_STEPS = (5, 10, 20, 30)
+
+class DeadlineExceeded(CacheableError):
+    """O prazo da requisição terminou antes da extração"""
+
+    def __init__(self, message: str = 'Tempo limite da requisição excedido'):
+        super().__init__('timeout', message, 504)
+
+class Deadline:
+    """Prazo absoluto de uma requisição, propagado da rota até o yt-dlp"""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self) -> None:
+        """Levanta DeadlineExceeded se o prazo já terminou"""
+        if self.expired():
+            raise DeadlineExceeded()
+
+    def ytdl_options(self) -> Dict[str, Any]:
+        """
+        Opções do yt-dlp compatíveis com o tempo restante
+
+        O socket_timeout deixa margem para pelo menos duas operações de rede
+        e as novas tentativas só são feitas quando há tempo para elas.
+        """
+        remaining = self.remaining()
+        socket_timeout = SOCKET_TIMEOUT_STEPS[0]
+        for step in SOCKET_TIMEOUT_STEPS:
+            if step <= remaining / 2:
+                socket_timeout = step
+
+        if remaining < 10:
+            retries = 0
+        elif remaining < 30:
+            retries = 1
+        else:
+            retries = 3
+
+        return {
+            'socket_timeout': socket_timeout,
+            'retries': retries,
+            'extractor_retries': retries
+        }
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar('deadline', default=None)
+
+def current_deadline() -> Optional[Deadline]:
+    """Prazo da requisição em andamento nesta thread, se houver"""
+    return _current_deadline.get()
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """Define o prazo das extrações feitas dentro do bloco"""
+    deadline = Deadline(seconds) if seconds else None
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+def start_request_deadline(seconds: Optional[float]):
+    """
+    Inicia o prazo da requisição (before_request); devolve o token para reset
+
+    Um prazo já iniciado pelo front end ASGI, contado desde a chegada da
+    requisição, é mantido.
+    """
+    deadline = _current_deadline.get()
+    if deadline is None and seconds:
+        deadline = Deadline(seconds)
+    return _current_deadline.set(deadline)
+
+def end_request_deadline(token) -> None:
+    _current_deadline.reset(token)
@@ -0,0 +1,167 @@
+import heapq
+import itertools
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+# Níveis de prioridade: menor valor sai da fila primeiro
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+DEFAULT_PRIORITY = 'normal'
+
+class QueueFull(Exception):
+    """A fila de downloads atingiu o limite"""
+
+class _Job:
+    def __init__(self, task_id: str, fn: Callable[[], Any], host: str, priority: int, seq: int):
+        self.task_id = task_id
+        self.fn = fn
+        self.host = host
+        self.priority = priority
+        self.seq = seq
+
+    def __lt__(self, other: '_Job') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+def upstream_host(url: str) -> str:
+    """Host de origem do download, sem prefixos como www. e m."""
+    host = (urlparse(url).hostname or '').lower()
+    for prefix in ('www.', 'm.', 'music.'):
+        if host.startswith(prefix):
+            return host[len(prefix):]
+    if host == 'youtu.be':
+        return 'youtube.com'
+    return host
+
+class DownloadScheduler:
+    """
+    Fila de downloads com prioridade e número limitado de workers
+
+    Um número fixo de threads (max_workers) consome uma fila de prioridade;
+    dentro da mesma prioridade vale a ordem de chegada. Opcionalmente, cada
+    host de origem tem um limite próprio de downloads simultâneos: um job
+    cujo host está no limite fica na fila e o próximo job elegível é
+    executado.
+    """
+
+    def __init__(self, max_workers: int = 5, max_queue: int = 100, per_host_limit: Optional[int] = None):
+        """
+        Args:
+            max_workers: Downloads simultâneos
+            max_queue: Jobs aguardando; acima disso submit levanta QueueFull
+            per_host_limit: Downloads simultâneos por host de origem (None: sem
+                limite além de max_workers). As URLs aceitas são todas do
+                YouTube, então o limite vale para todos os downloads juntos
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.per_host_limit = per_host_limit
+        self._queue: List[_Job] = []
+        self._active: Dict[str, int] = defaultdict(int)
+        self._running = set()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._workers: List[threading.Thread] = []
+
+    def init_app(self, app) -> None:
+        """Aplica MAX_DOWNLOADS, DOWNLOAD_QUEUE_SIZE e DOWNLOAD_PER_HOST_LIMIT"""
+        with self._cond:
+            self.max_workers = app.config.get('MAX_DOWNLOADS', self.max_workers)
+            self.max_queue = app.config.get('DOWNLOAD_QUEUE_SIZE', self.max_queue)
+            self.per_host_limit = app.config.get('DOWNLOAD_PER_HOST_LIMIT', self.per_host_limit)
+
+    def _ensure_workers(self) -> None:
+        # Chamado com self._cond adquirido
+        self._workers = [w for w in self._workers if w.is_alive()]
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, name=f'download-{len(self._workers)}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, task_id: str, fn: Callable[[], Any], url: str,
+               priority: str = DEFAULT_PRIORITY) -> int:
+        """
+        Coloca um download na fila
+
+        Returns:
+            int: Posição na fila (1 = próximo a sair)
+
+        Raises:
+            QueueFull: Se a fila estiver cheia
+        """
+        job = _Job(task_id, fn, upstream_host(url), PRIORITIES.get(priority, PRIORITIES[DEFAULT_PRIORITY]),
+                   next(self._seq))
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                raise QueueFull()
+            heapq.heappush(self._queue, job)
+            self._ensure_workers()
+            self._cond.notify()
+            return self._position(task_id)
+
+    def _next_job(self) -> Optional[_Job]:
+        """Retira o job de maior prioridade cujo host está abaixo do limite"""
+        skipped = []
+        job = None
+        while self._queue:
+            candidate = heapq.heappop(self._queue)
+            if self.per_host_limit is None or self._active[candidate.host] < self.per_host_limit:
+                job = candidate
+                break
+            skipped.append(candidate)
+        for candidate in skipped:
+            heapq.heappush(self._queue, candidate)
+        return job
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                self._active[job.host] += 1
+                self._running.add(job.task_id)
+
+            try:
+                job.fn()
+            except Exception as e:
+                print(f"Download job {job.task_id} failed: {str(e)}")
+            finally:
+                with self._cond:
+                    self._active[job.host] -= 1
+                    self._running.discard(job.task_id)
+                    # Um host liberou vaga: jobs que estavam retidos podem sair
+                    self._cond.notify_all()
+
+    def _position(self, task_id: str) -> Optional[int]:
+        for position, job in enumerate(sorted(self._queue), 1):
+            if job.task_id == task_id:
+                return position
+        return None
+
+    def position(self, task_id: str) -> Optional[int]:
+        """Posição do job na fila, ou None se não estiver aguardando"""
+        with self._cond:
+            return self._position(task_id)
+
+    def remove(self, task_id: str) -> bool:
+        """Retira da fila um job que ainda não começou"""
+        with self._cond:
+            for i, job in enumerate(self._queue):
+                if job.task_id == task_id:
+                    self._queue.pop(i)
+                    heapq.heapify(self._queue)
+                    return True
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'queued': len(self._queue),
+                'running': len(self._running),
+                'max_workers': self.max_workers,
+                'per_host': {host: n for host, n in self._active.items() if n}
+            }
+
+download_scheduler = DownloadScheduler()
@@ -0,0 +1,239 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional
+
+from utils.cache_manager import CacheableError
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.ydl_pool import ydl_pool
+from utils.ytdl_cache import collect_lookups, record_lookups
+
+class ExtractionFailed(Exception):
+    """Falha do yt-dlp, com a mensagem original (também quando vem de outro processo)"""
+
+def _extract_in_worker(url: str, profile: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Executa uma extração e devolve apenas tipos simples
+
+    Roda no processo de trabalho (ou em uma thread do pool, no modo 'thread').
+    Exceções do yt-dlp nem sempre são serializáveis, por isso a falha volta
+    como mensagem e é reconstruída no processo da aplicação. As consultas ao
+    cache do player também voltam, para as métricas do processo da aplicação.
+    """
+    with collect_lookups() as lookups:
+        try:
+            with ydl_pool.acquire(profile, options) as ydl:
+                info = ydl.extract_info(url, download=False)
+                result = {'info': ydl.sanitize_info(info) if info else None}
+        except Exception as e:
+            result = {'error': str(e)}
+    result['cache_lookups'] = dict(lookups)
+    return result
+
+class ExtractionService:
+    """
+    Executa as extrações do yt-dlp fora das threads de requisição
+
+    O trabalho do yt-dlp (parse de JSON, decifragem de assinaturas, ordenação
+    de formatos) é em grande parte CPU e fica preso ao GIL dentro do Flask.
+    No modo 'process' as extrações rodam em um ProcessPoolExecutor e os
+    processos são reciclados após um número fixo de trabalhos; no modo
+    'thread' rodam em um pool de threads. Nos dois modos a fila de envio é
+    limitada e cada trabalho tem um prazo (o da requisição ou `timeout`):
+    ao estourar, a requisição é liberada com 504 e o trabalho é abandonado.
+    No modo ASGI, extract_async aguarda o resultado no event loop: a
+    requisição não ocupa uma thread enquanto espera.
+    """
+
+    def __init__(self, backend: str = 'thread', workers: Optional[int] = None,
+                 max_pending: int = 64, max_jobs_per_worker: int = 100, timeout: float = 30):
+        """
+        Args:
+            backend: 'thread' (pool de threads) ou 'process' (pool de processos)
+            workers: Processos (padrão: número de CPUs) ou threads (padrão: 32) de trabalho
+            max_pending: Trabalhos aguardando além dos que estão em execução
+            max_jobs_per_worker: Trabalhos por processo antes de reciclá-lo
+            timeout: Tempo limite (segundos) de cada trabalho
+        """
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._thread_executor: Optional[ThreadPoolExecutor] = None
+        self.configure(backend, workers, max_pending, max_jobs_per_worker, timeout)
+
+    def configure(self, backend: str = 'thread', workers: Optional[int] = None,
+                  max_pending: int = 64, max_jobs_per_worker: int = 100, timeout: float = 30) -> None:
+        self.shutdown()
+        self.backend = backend
+        if backend == 'process':
+            self.workers = workers or os.cpu_count() or 1
+        else:
+            # Extrações em thread passam a maior parte do tempo esperando a rede
+            self.workers = workers or 32
+        self.max_pending = max_pending
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.workers + max_pending)
+        self.submitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def init_app(self, app) -> None:
+        """Aplica EXTRACTION_* e REQUEST_TIMEOUT da aplicação"""
+        self.configure(
+            backend=app.config.get('EXTRACTION_BACKEND', 'thread'),
+            workers=app.config.get('EXTRACTION_WORKERS'),
+            max_pending=app.config.get('EXTRACTION_MAX_PENDING', 64),
+            max_jobs_per_worker=app.config.get('EXTRACTION_MAX_JOBS_PER_WORKER', 100),
+            timeout=app.config.get('REQUEST_TIMEOUT', 30)
+        )
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # max_tasks_per_child não é compatível com fork
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    max_tasks_per_child=self.max_jobs_per_worker
+                )
+            return self._executor
+
+    def _get_thread_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._thread_executor is None:
+                self._thread_executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix='extraction'
+                )
+            return self._thread_executor
+
+    def _reset_executor(self, executor) -> None:
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+            elif self._thread_executor is executor:
+                self._thread_executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def extract(self, url: str, profile: str, options: Dict[str, Any],
+                deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """
+        Extrai as informações de uma URL
+
+        Args:
+            url: URL a extrair
+            profile: Nome do perfil de opções (chave do pool de YoutubeDL)
+            options: Opções do yt-dlp
+            deadline: Prazo da requisição; sem prazo, vale `timeout`
+
+        Returns:
+            dict: Resultado do sanitize_info, ou None se o yt-dlp não retornou nada
+
+        Raises:
+            ExtractionFailed: Se o yt-dlp falhar
+            CacheableError: Se a fila estiver cheia (503)
+            DeadlineExceeded: Se o prazo terminar antes do resultado (504)
+        """
+        timeout = deadline.remaining() if deadline is not None else self.timeout
+        if timeout <= 0:
+            raise DeadlineExceeded()
+        return self._unpack(self._submit(url, profile, options, timeout))
+
+    async def extract_async(self, url: str, profile: str, options: Dict[str, Any],
+                            deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """
+        Como extract, mas aguarda o resultado no event loop, sem ocupar uma thread
+
+        Raises:
+            Os mesmos de extract
+        """
+        timeout = deadline.remaining() if deadline is not None else self.timeout
+        if timeout <= 0:
+            raise DeadlineExceeded()
+
+        executor, future = self._start(url, profile, options)
+        try:
+            done, _ = await asyncio.wait({asyncio.wrap_future(future)}, timeout=timeout)
+            if not done:
+                self._abandon(future)
+                raise DeadlineExceeded('Tempo limite da extração excedido')
+            result = future.result()
+        except BrokenProcessPool:
+            self._reset_executor(executor)
+            raise CacheableError('transient', 'Falha temporária ao obter informações do vídeo', 503)
+        return self._unpack(result)
+
+    @staticmethod
+    def _unpack(result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        record_lookups(result.get('cache_lookups', {}))
+        if 'error' in result:
+            raise ExtractionFailed(result['error'])
+        return result['info']
+
+    def _start(self, url: str, profile: str, options: Dict[str, Any]):
+        """Envia o trabalho ao pool; retorna (executor, future)"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise CacheableError('overloaded', 'Fila de extração cheia, tente novamente', 503)
+
+        if self.backend == 'process':
+            executor = self._get_executor()
+        else:
+            executor = self._get_thread_executor()
+        try:
+            future = executor.submit(_extract_in_worker, url, profile, options)
+        except (BrokenProcessPool, RuntimeError):
+            self._slots.release()
+            self._reset_executor(executor)
+            raise CacheableError('transient', 'Falha temporária ao obter informações do vídeo', 503)
+
+        # A vaga só é liberada quando o trabalho termina, mesmo após um timeout
+        future.add_done_callback(lambda _: self._slots.release())
+        with self._lock:
+            self.submitted += 1
+        return executor, future
+
+    def _abandon(self, future) -> None:
+        """
+        Abandona um trabalho após o prazo: se ainda não começou, sai da fila;
+        se já começou, termina sozinho (limitado pelo socket_timeout)
+        """
+        future.cancel()
+        with self._lock:
+            self.timed_out += 1
+
+    def _submit(self, url: str, profile: str, options: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        executor, future = self._start(url, profile, options)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self._abandon(future)
+            raise DeadlineExceeded('Tempo limite da extração excedido')
+        except BrokenProcessPool:
+            # Um processo morreu (ex: falta de memória): recria o pool
+            self._reset_executor(executor)
+            raise CacheableError('transient', 'Falha temporária ao obter informações do vídeo', 503)
+
+    def shutdown(self) -> None:
+        """Encerra os processos de trabalho"""
+        with self._lock:
+            executors = (self._executor, self._thread_executor)
+            self._executor = self._thread_executor = None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'backend': self.backend,
+                'workers': self.workers,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out
+            }
+
+extraction_service = ExtractionService()
@@ -0,0 +1,378 @@
+import copy
+import re
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Tuple
+from config import Config
+from utils.cache_manager import CacheManager, CacheableError
+from utils.singleflight import SingleFlight
+from utils.deadline import Deadline, DeadlineExceeded, current_deadline
+from utils.validators import extract_video_id, canonical_video_url
+from utils.extraction_service import extraction_service
+
+# Cache e single-flight compartilhados por todas as rotas
+cache = CacheManager.from_config(Config)
+extraction_flight = SingleFlight(cache)
+
+# Tempo de vida da extração bruta (as URLs assinadas dos formatos expiram em algumas horas)
+RAW_INFO_TTL = 3600
+
+# Extração bruta feita no event loop antes da rota (modo ASGI):
+# (chave do cache, perfil, info, erro)
+_prefetched: ContextVar[Optional[Tuple[str, str, Optional[Dict[str, Any]], Optional[CacheableError]]]] = \
+    ContextVar('prefetched_raw_info', default=None)
+
+# Prazo das URLs assinadas: ...?expire=1700000000&... ou .../expire/1700000000/...
+_EXPIRE_RE = re.compile(r'[?&/]expire[=/](\d+)')
+
+# Classes de erro: (trechos da mensagem do yt-dlp, status HTTP, mensagem)
+ERROR_CLASSES = [
+    ('private', ('private video',), 403, 'Vídeo privado'),
+    ('geo_blocked', ('not available in your country', 'geo restrict', 'geo-restrict'), 451,
+     'Vídeo bloqueado na região do servidor'),
+    ('age_restricted', ('confirm your age', 'age-restricted', 'age restricted'), 403,
+     'Vídeo com restrição de idade'),
+    ('unavailable', ('video unavailable', 'has been removed', 'no longer available',
+                     'does not exist', 'account associated with this video has been terminated',
+                     'is not a valid url', 'unsupported url'), 404,
+     'Vídeo indisponível'),
+]
+
+class ExtractionError(CacheableError):
+    """Falha de extração classificada, com o TTL do cache negativo da sua classe"""
+
+def classify_extraction_error(error: Exception) -> ExtractionError:
+    """
+    Converte uma exceção do yt-dlp em ExtractionError
+
+    Erros não reconhecidos (rede, HTTP 429/5xx, timeouts) são tratados
+    como transitórios e ficam pouco tempo no cache negativo.
+    """
+    message = str(error).lower()
+    for kind, patterns, status_code, description in ERROR_CLASSES:
+        if any(p in message for p in patterns):
+            break
+    else:
+        kind, status_code, description = 'transient', 503, 'Falha temporária ao obter informações do vídeo'
+
+    ttl = Config.NEGATIVE_CACHE_TTLS.get(kind, 0)
+    return ExtractionError(kind, description, status_code, ttl)
+
+# Perfis de extração, do mais leve ao mais completo. Cada perfil só liga as
+# opções caras do yt-dlp quando o cliente precisa desses dados. Com
+# download=False as opções write* não têm efeito, então não são usadas aqui.
+# Comentários não fazem parte de nenhum perfil: são paginados em /api/comments.
+EXTRACTION_PROFILES = {
+    # Metadados e formatos; sem comentários e sem traduções automáticas de legendas
+    'minimal': {
+        'getcomments': False,
+        'extractor_args': {'youtube': {'skip': ['translated_subs']}},
+    },
+    # Inclui todas as legendas e legendas automáticas (traduções incluídas)
+    'standard': {
+        'getcomments': False,
+    },
+}
+PROFILE_RANK = {name: rank for rank, name in enumerate(EXTRACTION_PROFILES)}
+DEFAULT_PROFILE = 'standard'
+# Nomes antigos aceitos nas rotas. 'full' incluía os comentários, que agora
+# vêm de get_video_comments: a extração é a mesma de 'standard' e
+# compartilha a entrada do cache com ela
+PROFILE_ALIASES = {'full': 'standard'}
+
+def resolve_profile(name: str):
+    """Perfil de extração para o nome pedido (aliases incluídos), ou None se inválido"""
+    name = PROFILE_ALIASES.get(name, name)
+    return name if name in EXTRACTION_PROFILES else None
+
+def profile_satisfies(available: str, requested: str) -> bool:
+    """Indica se uma extração feita com `available` atende a um pedido com `requested`"""
+    return PROFILE_RANK.get(available, -1) >= PROFILE_RANK[requested]
+
+def get_yt_info(url, profile=DEFAULT_PROFILE):
+    """
+    Extrai as informações do vídeo, agrupando chamadas concorrentes para a
+    mesma URL e perfil em uma única extração
+
+    O prazo da requisição em andamento (current_deadline) limita tanto a
+    extração quanto a espera por uma extração concorrente.
+
+    Raises:
+        ExtractionError: Se o vídeo estiver indisponível ou a extração falhar
+        DeadlineExceeded: Se o prazo da requisição terminar antes
+    """
+    key = f'{url}_{profile}'
+    deadline = current_deadline()
+
+    def extract():
+        info = _extract_info(url, profile, deadline)
+        if info and extraction_flight.process_lock:
+            # Disponibiliza o resultado para os processos que aguardam o lock
+            cache.set(f'flight_{key}', info, 30)
+        return info
+
+    try:
+        return extraction_flight.do(
+            key, extract, recheck=lambda: cache.get(f'flight_{key}'),
+            timeout=deadline.remaining() if deadline else None
+        )
+    except TimeoutError:
+        raise DeadlineExceeded()
+
+async def get_yt_info_async(url, profile=DEFAULT_PROFILE):
+    """
+    Como get_yt_info, mas aguarda a extração no event loop (modo ASGI):
+    nem o líder nem as chamadas agrupadas ocupam uma thread enquanto esperam
+    """
+    key = f'{url}_{profile}'
+    deadline = current_deadline()
+
+    async def extract():
+        info = await _extract_info_async(url, profile, deadline)
+        if info and extraction_flight.process_lock:
+            cache.set(f'flight_{key}', info, 30)
+        return info
+
+    try:
+        return await extraction_flight.do_async(
+            key, extract, recheck=lambda: cache.get(f'flight_{key}'),
+            timeout=deadline.remaining() if deadline else None
+        )
+    except TimeoutError:
+        raise DeadlineExceeded()
+
+def _extraction_options(profile, deadline: Optional[Deadline]) -> Dict[str, Any]:
+    ydl_opts = Config.YTDL_OPTIONS.copy()
+    ydl_opts.update(EXTRACTION_PROFILES[profile])
+    ydl_opts.update({
+        'extract_flat': False,  # Mudado para False para obter todos os dados
+        # Sem ignoreerrors para que a falha chegue aqui e possa ser classificada
+        'ignoreerrors': False,
+    })
+    if deadline is not None:
+        # socket_timeout e novas tentativas cabem no tempo restante
+        ydl_opts.update(deadline.ytdl_options())
+    return ydl_opts
+
+def _extract_info(url, profile=DEFAULT_PROFILE, deadline: Optional[Deadline] = None):
+    # O resultado já vem do sanitize_info: dict serializável em JSON
+    # (para o cache e entre processos)
+    try:
+        info = extraction_service.extract(url, profile, _extraction_options(profile, deadline), deadline)
+    except CacheableError:
+        # Fila cheia ou prazo excedido: não é uma falha do vídeo
+        raise
+    except Exception as e:
+        print(f"Error extracting info: {str(e)}")
+        raise classify_extraction_error(e)
+    return _require_info(info)
+
+async def _extract_info_async(url, profile=DEFAULT_PROFILE, deadline: Optional[Deadline] = None):
+    try:
+        info = await extraction_service.extract_async(
+            url, profile, _extraction_options(profile, deadline), deadline)
+    except CacheableError:
+        raise
+    except Exception as e:
+        print(f"Error extracting info: {str(e)}")
+        raise classify_extraction_error(e)
+    return _require_info(info)
+
+def _require_info(info):
+    if not info:
+        raise ExtractionError('unavailable', 'Vídeo indisponível', 404,
+                              Config.NEGATIVE_CACHE_TTLS.get('unavailable', 0))
+    return info
+
+def resolve_cache_id(url_or_id: str) -> str:
+    """
+    Resolve a chave canônica de cache de uma URL
+
+    Qualquer grafia de URL de vídeo vira o ID do vídeo; URLs que não
+    apontam para um vídeo (canais, playlists) são usadas como estão.
+    """
+    return extract_video_id(url_or_id) or url_or_id
+
+def get_raw_video_info(url_or_id: str, profile: str = DEFAULT_PROFILE) -> Optional[Dict[str, Any]]:
+    """
+    Obtém a extração bruta de um vídeo, compartilhada por todas as rotas
+
+    A extração é guardada uma única vez por ID de vídeo (chave `raw_{id}`),
+    de modo que /info, /formats, /subtitles, /transcript e as métricas
+    fazem no máximo uma chamada ao YouTube por vídeo. A entrada registra o
+    perfil que a produziu: uma extração mais completa atende pedidos mais
+    leves, e um pedido mais completo refaz a extração e substitui a entrada.
+    Falhas ficam no cache negativo pelo TTL da sua classe de erro.
+
+    Raises:
+        ExtractionError: Se o vídeo estiver indisponível (inclusive via cache negativo)
+    """
+    video_id = extract_video_id(url_or_id)
+    url = canonical_video_url(video_id) if video_id else url_or_id
+    cache_key = f'raw_{video_id or url_or_id}'
+
+    prefetched = _prefetched.get()
+    if prefetched and prefetched[0] == cache_key and profile_satisfies(prefetched[1], profile):
+        if prefetched[3] is not None:
+            raise prefetched[3]
+        return prefetched[2]
+
+    def load():
+        return {'profile': profile, 'info': get_yt_info(url, profile)}
+
+    entry = cache.get_or_set(cache_key, load, RAW_INFO_TTL)
+    if not profile_satisfies(entry.get('profile'), profile):
+        entry = load()
+        cache.set(cache_key, entry, RAW_INFO_TTL)
+    return entry['info']
+
+async def prefetch_raw_video_info(url_or_id: str, profile: str = DEFAULT_PROFILE) -> None:
+    """
+    Faz no event loop a extração que get_raw_video_info faria (modo ASGI)
+
+    Chamada pelo front end ASGI antes de a rota rodar em uma thread: a
+    espera pelo yt-dlp não ocupa thread, e a rota recebe o resultado (ou o
+    erro) pelo contexto da requisição, mesmo com o cache desligado. Com uma
+    entrada em cache que atenda ao perfil (inclusive negativa), não faz nada.
+    """
+    video_id = extract_video_id(url_or_id)
+    url = canonical_video_url(video_id) if video_id else url_or_id
+    cache_key = f'raw_{video_id or url_or_id}'
+
+    try:
+        entry = cache.peek(cache_key)
+    except CacheableError:
+        # Cache negativo: a rota levanta o mesmo erro
+        return
+    if entry and profile_satisfies(entry.get('profile'), profile):
+        return
+
+    try:
+        info = await get_yt_info_async(url, profile)
+    except CacheableError as e:
+        if e.ttl > 0:
+            cache.set_negative(cache_key, e)
+        _prefetched.set((cache_key, profile, None, e))
+        return
+    cache.set(cache_key, {'profile': profile, 'info': info}, RAW_INFO_TTL)
+    _prefetched.set((cache_key, profile, info, None))
+
+def format_urls_expire_at(info: Dict[str, Any]) -> Optional[float]:
+    """Menor prazo de expiração entre as URLs assinadas dos formatos, se houver"""
+    expires = []
+    for f in info.get('formats') or []:
+        for key in ('url', 'manifest_url'):
+            match = _EXPIRE_RE.search(f.get(key) or '')
+            if match:
+                expires.append(int(match.group(1)))
+    return min(expires) if expires else None
+
+def get_cached_raw_info(url_or_id: str, min_valid: float = 0) -> Optional[Dict[str, Any]]:
+    """
+    Retorna uma cópia da extração bruta em cache, sem extrair
+
+    Usada pelo download para ir direto à seleção de formato. Retorna None
+    se não houver entrada fresca ou se as URLs assinadas dos formatos
+    expirarem em menos de `min_valid` segundos.
+    """
+    video_id = extract_video_id(url_or_id)
+    if not video_id:
+        return None
+
+    entry = cache.get(f'raw_{video_id}')
+    info = entry.get('info') if entry else None
+    if not info:
+        return None
+
+    expires_at = format_urls_expire_at(info)
+    if expires_at is not None and expires_at - time.time() < min_valid:
+        return None
+
+    # process_ie_result altera o dict, que é compartilhado com o cache em memória
+    return copy.deepcopy(info)
+
+def warm_up_player_cache(video_id: str) -> bool:
+    """
+    Faz uma extração leve para carregar o player atual no cache do yt-dlp
+
+    Chamada na inicialização (em segundo plano): as funções de assinatura
+    e nsig ficam no YTDL_CACHE_DIR, compartilhado pelos demais workers.
+    """
+    start = time.time()
+    try:
+        _extract_info(canonical_video_url(video_id), 'minimal')
+    except Exception as e:
+        print(f"Player cache warm-up failed: {str(e)}")
+        return False
+    print(f"Player cache warm-up done in {time.time() - start:.1f}s")
+    return True
+
+COMMENT_SORTS = ('top', 'new')
+
+# Campos de cada comentário devolvidos pela API
+COMMENT_FIELDS = (
+    'id', 'parent', 'text', 'author', 'author_id', 'author_thumbnail',
+    'author_is_uploader', 'like_count', 'is_favorited', 'is_pinned', 'timestamp'
+)
+
+def get_video_comments(url_or_id: str, sort: str, count: int) -> Dict[str, Any]:
+    """
+    Extrai os primeiros `count` comentários de um vídeo na ordem `sort`
+
+    O yt-dlp não retoma a paginação do YouTube a partir de um ponto, então
+    cada extração traz os comentários desde o início; o chamador aumenta
+    `count` aos poucos e guarda o resultado no cache. A extração pula os
+    manifestos DASH/HLS e as traduções de legendas, que não são usados aqui.
+
+    Returns:
+        dict: {'comments': [...], 'complete': bool, 'comment_count': int}
+
+    Raises:
+        ExtractionError: Se o vídeo estiver indisponível ou a extração falhar
+        DeadlineExceeded: Se o prazo da requisição terminar antes
+    """
+    video_id = extract_video_id(url_or_id)
+    url = canonical_video_url(video_id) if video_id else url_or_id
+    deadline = current_deadline()
+
+    ydl_opts = Config.YTDL_OPTIONS.copy()
+    ydl_opts.update({
+        'getcomments': True,
+        'ignoreerrors': False,
+        'extractor_args': {'youtube': {
+            'max_comments': [str(count)],
+            'comment_sort': [sort],
+            'skip': ['dash', 'hls', 'translated_subs'],
+        }},
+    })
+    if deadline is not None:
+        ydl_opts.update(deadline.ytdl_options())
+
+    def extract():
+        try:
+            info = extraction_service.extract(url, 'comments', ydl_opts, deadline)
+        except CacheableError:
+            raise
+        except Exception as e:
+            print(f"Error extracting comments: {str(e)}")
+            raise classify_extraction_error(e)
+        if not info:
+            raise ExtractionError('unavailable', 'Vídeo indisponível', 404,
+                                  Config.NEGATIVE_CACHE_TTLS.get('unavailable', 0))
+
+        comments = [{field: c.get(field) for field in COMMENT_FIELDS}
+                    for c in info.get('comments') or []]
+        return {
+            'comments': comments,
+            # Menos comentários que o pedido: não há mais o que buscar
+            'complete': len(comments) < count,
+            'comment_count': info.get('comment_count')
+        }
+
+    try:
+        return extraction_flight.do(
+            f'comments_{video_id or url}_{sort}_{count}', extract,
+            timeout=deadline.remaining() if deadline else None
+        )
+    except TimeoutError:
+        raise DeadlineExceeded()
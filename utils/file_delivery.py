@@ -0,0 +1,118 @@
+import os
+import unicodedata
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from werkzeug.datastructures import ContentRange
+from werkzeug.wrappers import Request, Response
+
+# Content-Type dos formatos em SUPPORTED_FORMATS
+MIME_TYPES = {
+    '.mp4': 'video/mp4',
+    '.webm': 'video/webm',
+    '.mp3': 'audio/mpeg',
+    '.m4a': 'audio/mp4'
+}
+
+CHUNK_SIZE = 64 * 1024
+
+def mimetype_for(path: str) -> str:
+    return MIME_TYPES.get(os.path.splitext(path)[1].lower(), 'application/octet-stream')
+
+def content_disposition(name: str) -> str:
+    """Content-Disposition de anexo, com filename* (RFC 5987) para nomes não ASCII"""
+    try:
+        name.encode('ascii')
+        return f'attachment; filename="{name}"'
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+        return f"attachment; filename=\"{simple}\"; filename*=UTF-8''{quote(name, safe='!#$&+^`|~')}"
+
+def requested_ranges(request: Request, etag: str, length: int, mtime: float,
+                     max_ranges: int = 16) -> Optional[List[Tuple[int, int]]]:
+    """
+    Intervalos do cabeçalho Range a atender, como (início, fim) com fim exclusivo
+
+    Returns:
+        None se a resposta deve ser o arquivo inteiro (sem Range, If-Range
+        desatualizado, If-None-Match satisfeito, unidade desconhecida ou
+        intervalos demais); lista vazia se nenhum intervalo é satisfazível (416)
+    """
+    rng = request.range
+    if rng is None or rng.units != 'bytes' or len(rng.ranges) > max_ranges:
+        return None
+    if request.if_none_match.contains(etag):
+        return None
+    if_range = request.if_range
+    if if_range.etag is not None and if_range.etag != etag:
+        return None
+    if if_range.date is not None and int(mtime) > if_range.date.timestamp():
+        return None
+
+    ranges = []
+    for start, stop in rng.ranges:
+        if start < 0:
+            # Sufixo: os últimos N bytes
+            start, stop = max(0, length + start), length
+        else:
+            stop = length if stop is None else min(stop, length)
+        if start < stop:
+            ranges.append((start, stop))
+    return ranges
+
+def _iter_range(path: str, start: int, stop: int) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def single_range_response(environ: Dict[str, Any], path: str, start: int, stop: int,
+                          length: int, mimetype: str) -> Response:
+    """
+    Resposta 206 com um intervalo do arquivo
+
+    Com wsgi.file_wrapper (gunicorn), o arquivo posicionado em `start` e o
+    Content-Length fazem o servidor enviar só o intervalo via sendfile, sem
+    passar os bytes pelo Python.
+    """
+    file_wrapper = environ.get('wsgi.file_wrapper')
+    if file_wrapper is not None:
+        f = open(path, 'rb')
+        f.seek(start)
+        body = file_wrapper(f, CHUNK_SIZE)
+    else:
+        body = _iter_range(path, start, stop)
+    response = Response(body, status=206, mimetype=mimetype, direct_passthrough=True)
+    response.content_length = stop - start
+    response.content_range = ContentRange('bytes', start, stop, length)
+    return response
+
+def multipart_range_response(path: str, ranges: List[Tuple[int, int]], length: int,
+                             mimetype: str) -> Response:
+    """Resposta 206 multipart/byteranges com vários intervalos do arquivo"""
+    boundary = uuid.uuid4().hex
+    headers = [
+        (f'--{boundary}\r\nContent-Type: {mimetype}\r\n'
+         f'Content-Range: bytes {start}-{stop - 1}/{length}\r\n\r\n').encode('ascii')
+        for start, stop in ranges
+    ]
+    closing = f'--{boundary}--\r\n'.encode('ascii')
+
+    def generate():
+        for header, (start, stop) in zip(headers, ranges):
+            yield header
+            yield from _iter_range(path, start, stop)
+            yield b'\r\n'
+        yield closing
+
+    response = Response(generate(), status=206, direct_passthrough=True,
+                        content_type=f'multipart/byteranges; boundary={boundary}')
+    response.content_length = (sum(len(h) + stop - start + 2 for h, (start, stop) in zip(headers, ranges))
+                               + len(closing))
+    return response
@@ -0,0 +1,188 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+class FileStore:
+    """
+    Armazenamento endereçado por conteúdo dos arquivos baixados
+
+    Cada arquivo fica em store/ab/<sha256>.<ext>, de modo que downloads com
+    o mesmo conteúdo ocupam um único arquivo. Um índice SQLite associa
+    (video_id, formato) ao arquivo e guarda as referências: cada tarefa que
+    recebeu o arquivo o referencia até ser descartada. A limpeza só remove
+    arquivos sem nenhuma referência e sem acesso há mais de `max_age`.
+    """
+
+    INDEX_FILE = 'index.sqlite3'
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = None
+        self._local = threading.local()
+        if root is not None:
+            self.open(root)
+
+    def init_app(self, app) -> None:
+        """Abre o armazenamento em DOWNLOAD_DIR/store"""
+        self.open(os.path.join(app.config['DOWNLOAD_DIR'], 'store'))
+
+    def open(self, root: str) -> None:
+        """Cria (se preciso) o diretório e o índice e passa a usá-los"""
+        os.makedirs(root, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(root, self.INDEX_FILE), timeout=5, isolation_level=None)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS blobs ('
+                'digest TEXT PRIMARY KEY, path TEXT NOT NULL, name TEXT, '
+                'size INTEGER NOT NULL, last_access REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS keys ('
+                'video_id TEXT NOT NULL, format TEXT NOT NULL, digest TEXT NOT NULL, '
+                'PRIMARY KEY (video_id, format))'
+            )
+            conn.execute('CREATE TABLE IF NOT EXISTS refs (task_id TEXT PRIMARY KEY, digest TEXT NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS refs_digest ON refs (digest)')
+        finally:
+            conn.close()
+        # Só troca de diretório com o índice pronto
+        self.root = root
+
+    def _index(self) -> sqlite3.Connection:
+        """Conexão com o índice (uma por thread)"""
+        conn = getattr(self._local, 'conn', None)
+        # Reabre se open apontou para outro diretório
+        if conn is None or self._local.root != self.root:
+            conn = sqlite3.connect(os.path.join(self.root, self.INDEX_FILE), timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.root = self.root
+        return conn
+
+    @staticmethod
+    def _hash_file(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def lookup(self, video_id: str, fmt: str) -> Optional[Dict[str, Any]]:
+        """
+        Arquivo já baixado para (video_id, formato), se ainda existir
+
+        Returns:
+            dict: {'digest', 'path', 'name', 'size'} ou None
+        """
+        conn = self._index()
+        row = conn.execute(
+            'SELECT b.digest, b.path, b.name, b.size FROM keys k JOIN blobs b ON b.digest = k.digest '
+            'WHERE k.video_id = ? AND k.format = ?', (video_id, fmt)
+        ).fetchone()
+        if row is None:
+            return None
+        if not os.path.exists(row[1]):
+            # Removido por fora: descarta a entrada
+            conn.execute('DELETE FROM keys WHERE digest = ?', (row[0],))
+            conn.execute('DELETE FROM blobs WHERE digest = ?', (row[0],))
+            return None
+        self.touch(row[0])
+        return {'digest': row[0], 'path': row[1], 'name': row[2], 'size': row[3]}
+
+    def put(self, video_id: str, fmt: str, src_path: str, name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Move um arquivo baixado para o armazenamento
+
+        Se já houver um arquivo com o mesmo conteúdo, o novo é descartado.
+
+        Args:
+            video_id: ID do vídeo
+            fmt: Seletor de formato pedido
+            src_path: Arquivo baixado (será movido ou removido)
+            name: Nome original do arquivo, para o download pelo cliente
+        """
+        digest = self._hash_file(src_path)
+        ext = os.path.splitext(src_path)[1]
+        path = os.path.join(self.root, digest[:2], f'{digest}{ext}')
+        name = name or os.path.basename(src_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(src_path)
+        else:
+            try:
+                os.replace(src_path, path)
+            except OSError:
+                # Outro sistema de arquivos
+                shutil.move(src_path, path)
+
+        size = os.path.getsize(path)
+        conn = self._index()
+        conn.execute(
+            'INSERT INTO blobs (digest, path, name, size, last_access) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(digest) DO UPDATE SET last_access = excluded.last_access',
+            (digest, path, name, size, time.time())
+        )
+        conn.execute(
+            'INSERT OR REPLACE INTO keys (video_id, format, digest) VALUES (?, ?, ?)',
+            (video_id, fmt, digest)
+        )
+        return {'digest': digest, 'path': path, 'name': name, 'size': size}
+
+    def touch(self, digest: str) -> None:
+        self._index().execute('UPDATE blobs SET last_access = ? WHERE digest = ?', (time.time(), digest))
+
+    def add_ref(self, task_id: str, digest: str) -> None:
+        """Registra que a tarefa usa o arquivo"""
+        self._index().execute('INSERT OR REPLACE INTO refs (task_id, digest) VALUES (?, ?)', (task_id, digest))
+
+    def release(self, task_id: str) -> None:
+        """Remove a referência da tarefa (o arquivo fica até a limpeza)"""
+        self._index().execute('DELETE FROM refs WHERE task_id = ?', (task_id,))
+
+    def refcount(self, digest: str) -> int:
+        return self._index().execute('SELECT COUNT(*) FROM refs WHERE digest = ?', (digest,)).fetchone()[0]
+
+    def cleanup(self, max_age: float) -> List[str]:
+        """
+        Remove arquivos sem referências e sem acesso há mais de `max_age` segundos
+
+        Returns:
+            list: Caminhos removidos
+        """
+        conn = self._index()
+        rows = conn.execute(
+            'SELECT digest, path FROM blobs WHERE last_access < ? '
+            'AND NOT EXISTS (SELECT 1 FROM refs WHERE refs.digest = blobs.digest)',
+            (time.time() - max_age,)
+        ).fetchall()
+
+        removed = []
+        for digest, path in rows:
+            # Revalida: uma tarefa pode ter referenciado o arquivo nesse meio tempo
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                in_use = conn.execute(
+                    'SELECT 1 FROM refs WHERE digest = ? UNION ALL '
+                    'SELECT 1 FROM blobs WHERE digest = ? AND last_access >= ?',
+                    (digest, digest, time.time() - max_age)
+                ).fetchone()
+                if in_use:
+                    conn.execute('ROLLBACK')
+                    continue
+                conn.execute('DELETE FROM keys WHERE digest = ?', (digest,))
+                conn.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            removed.append(path)
+        return removed
@@ -1,4 +1,4 @@
-from prometheus_client import Counter, Histogram, Info
+from prometheus_client import Counter, Gauge, Histogram, Info
 from flask import request
 import time
 
@@ -39,6 +39,62 @@ CACHE_MISSES = Counter(
     ['cache_type']
 )
 
+CACHE_STALE_HITS = Counter(
+    'cache_stale_hits_total',
+    'Total de hits em valores velhos servidos durante a revalidação',
+    ['cache_type']
+)
+
+CACHE_NEGATIVE_HITS = Counter(
+    'cache_negative_hits_total',
+    'Total de hits em entradas negativas do cache (falhas de extração)',
+    ['cache_type', 'kind']
+)
+
+CACHE_LATENCY = Histogram(
+    'cache_operation_duration_seconds',
+    'Latência das operações de cache',
+    ['operation', 'cache_type'],
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+
+CACHE_VALUE_SIZE = Histogram(
+    'cache_value_size_bytes',
+    'Tamanho dos valores gravados no cache (JSON serializado)',
+    ['cache_type'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+)
+
+CACHE_BYTES = Gauge(
+    'cache_size_bytes',
+    'Tamanho total do cache por camada',
+    ['tier']
+)
+
+CACHE_ENTRIES = Gauge(
+    'cache_entries',
+    'Número de entradas do cache por camada',
+    ['tier']
+)
+
+SINGLEFLIGHT_REQUESTS = Counter(
+    'singleflight_requests_total',
+    'Total de extrações executadas ou agrupadas pelo single-flight',
+    ['result']
+)
+
+YTDL_PLAYER_CACHE = Counter(
+    'ytdl_player_cache_total',
+    'Consultas ao cache do yt-dlp (funções do player); miss = busca fria do player',
+    ['section', 'result']
+)
+
+DEADLINE_EXCEEDED = Counter(
+    'deadline_exceeded_total',
+    'Total de requisições encerradas por prazo excedido (504)',
+    ['route']
+)
+
 API_INFO = Info('youtube_api', 'Informações da API do YouTube')
 
 def setup_metrics(app):
@@ -98,3 +154,38 @@ def record_cache_metrics(hit, cache_type='default'):
         CACHE_HITS.labels(cache_type=cache_type).inc()
     else:
         CACHE_MISSES.labels(cache_type=cache_type).inc()
+
+def record_singleflight_metrics(result):
+    """Registra extrações executadas ('executed') ou agrupadas ('coalesced', 'coalesced_process')"""
+    SINGLEFLIGHT_REQUESTS.labels(result=result).inc()
+
+def record_ytdl_cache_lookup(section, hit, count=1):
+    """Registra consultas ao cachedir do yt-dlp (ex: section='youtube-nsig')"""
+    YTDL_PLAYER_CACHE.labels(section=section, result='hit' if hit else 'miss').inc(count)
+
+def record_deadline_exceeded(route):
+    """Registra uma requisição encerrada com 504 na rota (endpoint do Flask)"""
+    DEADLINE_EXCEEDED.labels(route=route).inc()
+
+def record_negative_cache_hit(kind, cache_type='default'):
+    """Registra um hit em entrada negativa do cache"""
+    CACHE_NEGATIVE_HITS.labels(cache_type=cache_type, kind=kind).inc()
+
+def record_cache_stale_hit(cache_type='default'):
+    """Registra um valor velho servido enquanto é revalidado"""
+    CACHE_STALE_HITS.labels(cache_type=cache_type).inc()
+
+def record_cache_latency(operation, cache_type, seconds):
+    """Registra a latência de uma operação de cache ('get', 'get_many' ou 'set')"""
+    CACHE_LATENCY.labels(operation=operation, cache_type=cache_type).observe(seconds)
+
+def record_cache_value_size(cache_type, size):
+    """Registra o tamanho serializado de um valor gravado no cache"""
+    CACHE_VALUE_SIZE.labels(cache_type=cache_type).observe(size)
+
+def setup_cache_metrics(cache):
+    """Expõe o tamanho e o número de entradas do cache, calculados a cada coleta"""
+    CACHE_BYTES.labels(tier='memory').set_function(lambda: cache.memory.total_bytes)
+    CACHE_ENTRIES.labels(tier='memory').set_function(lambda: len(cache.memory))
+    CACHE_BYTES.labels(tier='backend').set_function(lambda: cache.backend_stats()[1])
+    CACHE_ENTRIES.labels(tier='backend').set_function(lambda: cache.backend_stats()[0])
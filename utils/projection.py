@@ -0,0 +1,75 @@
+from typing import Any, Dict, Optional
+
+# Árvore de campos: {'channel': {'name': {}}, 'title': {}}; {} seleciona a subárvore inteira
+FieldTree = Dict[str, 'FieldTree']
+
+def parse_fields(spec: Optional[str]) -> Optional[FieldTree]:
+    """
+    Converte uma lista de caminhos separados por vírgula em uma árvore
+
+    Exemplo: "id,title,channel.name,formats.format_id"
+
+    Args:
+        spec (str): Caminhos no formato campo.subcampo
+
+    Returns:
+        dict: Árvore de campos, ou None se spec estiver vazio
+    """
+    if not spec:
+        return None
+
+    tree: FieldTree = {}
+    for path in spec.split(','):
+        parts = [p.strip() for p in path.split('.') if p.strip()]
+        if not parts:
+            continue
+
+        node = tree
+        for i, part in enumerate(parts):
+            if part in node and not node[part] and i < len(parts) - 1:
+                # Um caminho mais curto já seleciona a subárvore inteira
+                break
+            node = node.setdefault(part, {})
+            if i == len(parts) - 1:
+                node.clear()
+    return tree or None
+
+def project(value: Any, fields: Optional[FieldTree] = None,
+            exclude: Optional[FieldTree] = None) -> Any:
+    """
+    Aplica uma projeção (fields) e/ou exclusão (exclude) a um valor
+
+    Listas são projetadas elemento a elemento, de modo que
+    "formats.format_id" seleciona format_id de cada formato. Apenas os
+    dicts no caminho são copiados; o valor original não é alterado.
+    """
+    if fields:
+        value = _include(value, fields)
+    if exclude:
+        value = _exclude(value, exclude)
+    return value
+
+def _include(value: Any, tree: FieldTree) -> Any:
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [_include(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {key: _include(value[key], subtree) for key, subtree in tree.items() if key in value}
+
+def _exclude(value: Any, tree: FieldTree) -> Any:
+    if isinstance(value, list):
+        return [_exclude(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+
+    result = dict(value)
+    for key, subtree in tree.items():
+        if key not in result:
+            continue
+        if subtree:
+            result[key] = _exclude(result[key], subtree)
+        else:
+            del result[key]
+    return result
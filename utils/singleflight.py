@@ -0,0 +1,259 @@
+import time
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from utils.deadline import DeadlineExceeded
+from utils.metrics import record_singleflight_metrics
+
+# Falhas causadas pelo prazo de quem executou, não pela chave: quem aguardava
+# e ainda tem tempo executa de novo em vez de recebê-las
+_CALLER_DEADLINE_ERRORS = (DeadlineExceeded, TimeoutError)
+
+class _Call:
+    """Extração em andamento para uma chave"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+class _AsyncCall:
+    """Extração em andamento para uma chave, aguardada no event loop"""
+
+    def __init__(self):
+        self.event = asyncio.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """
+    Agrupa chamadas concorrentes para a mesma chave em uma única execução
+
+    Dentro do processo, as threads que chegam enquanto uma extração está em
+    andamento esperam por ela e recebem o mesmo resultado. Com o lock entre
+    processos habilitado, o líder também obtém um lock no backend do cache;
+    os demais processos aguardam o resultado aparecer no cache (via
+    `recheck`) em vez de repetir a extração.
+
+    `do_async` faz o mesmo para corrotinas no event loop (modo ASGI): quem
+    aguarda não ocupa uma thread. Chamadas síncronas e assíncronas são
+    agrupadas separadamente, mas o lock entre processos vale para as duas.
+    """
+
+    def __init__(self, cache=None, process_lock: bool = False,
+                 lock_timeout: float = 60, poll_interval: float = 0.1):
+        """
+        Args:
+            cache: CacheManager cujo backend fornece o lock entre processos
+            process_lock: Habilita o lock entre processos
+            lock_timeout: Tempo máximo (segundos) de espera/posse do lock
+            poll_interval: Intervalo entre verificações enquanto outro processo extrai
+        """
+        self.cache = cache
+        self.process_lock = process_lock
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.executions = 0
+        self.coalesced = 0
+        self.coalesced_process = 0
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[str, _AsyncCall] = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app) -> None:
+        """Aplica SINGLEFLIGHT_PROCESS_LOCK e SINGLEFLIGHT_LOCK_TIMEOUT da aplicação"""
+        self.process_lock = app.config.get('SINGLEFLIGHT_PROCESS_LOCK', False)
+        self.lock_timeout = app.config.get('SINGLEFLIGHT_LOCK_TIMEOUT', self.lock_timeout)
+
+    def do(self, key: str, fn: Callable[[], Any],
+           recheck: Optional[Callable[[], Any]] = None,
+           timeout: Optional[float] = None) -> Any:
+        """
+        Executa fn uma única vez por chave entre chamadas concorrentes
+
+        Args:
+            key: Chave que identifica a extração
+            fn: Função que produz o resultado
+            recheck: Função que consulta o cache compartilhado; usada quando
+                outro processo detém o lock. Deve retornar None se o
+                resultado ainda não estiver disponível.
+            timeout: Prazo (segundos) de quem chama: limita a espera por outra
+                execução, neste ou em outro processo
+
+        Raises:
+            TimeoutError: Se a execução em andamento não terminar em `timeout`
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            record_singleflight_metrics('coalesced')
+            started = time.monotonic()
+            if not call.event.wait(timeout):
+                raise TimeoutError(f'Extração em andamento não terminou em {timeout}s')
+            if call.error is not None:
+                remaining = None if timeout is None else timeout - (time.monotonic() - started)
+                if isinstance(call.error, _CALLER_DEADLINE_ERRORS) and (remaining is None or remaining > 0):
+                    # Terminou o prazo do líder, não o desta chamada: tenta de novo
+                    return self.do(key, fn, recheck, remaining)
+                raise call.error
+            return call.result
+
+        record_singleflight_metrics('executed')
+        try:
+            call.result = self._run(key, fn, recheck, timeout)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def _run(self, key: str, fn: Callable[[], Any], recheck: Optional[Callable[[], Any]],
+             timeout: Optional[float] = None) -> Any:
+        backend = self.cache.backend if self.cache is not None else None
+        if not self.process_lock or backend is None or not backend.supports_locks:
+            return fn()
+
+        # A espera pelo outro processo não passa do prazo de quem chama
+        caller_bound = timeout is not None and timeout < self.lock_timeout
+        deadline = time.monotonic() + (timeout if caller_bound else self.lock_timeout)
+        waited = False
+        while True:
+            token = backend.acquire_lock(key, self.lock_timeout)
+            if token is not None:
+                try:
+                    # Outro processo pode ter concluído a extração enquanto esperávamos
+                    if waited and recheck is not None:
+                        result = recheck()
+                        if result is not None:
+                            return result
+                    return fn()
+                finally:
+                    backend.release_lock(key, token)
+
+            if not waited:
+                waited = True
+                with self._lock:
+                    self.coalesced_process += 1
+                record_singleflight_metrics('coalesced_process')
+
+            if recheck is not None:
+                result = recheck()
+                if result is not None:
+                    return result
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                if caller_bound:
+                    raise TimeoutError(f'Extração em outro processo não terminou em {timeout}s')
+                # O dono do lock travou: extrai sem o lock
+                return fn()
+            time.sleep(min(self.poll_interval, remaining))
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[Any]],
+                       recheck: Optional[Callable[[], Any]] = None,
+                       timeout: Optional[float] = None) -> Any:
+        """
+        Como do, para uma corrotina: as chamadas que aguardam não ocupam thread
+
+        Deve ser chamada sempre do mesmo event loop.
+        """
+        call = self._async_calls.get(key)
+        leader = call is None
+        with self._lock:
+            if leader:
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            record_singleflight_metrics('coalesced')
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(call.event.wait(), timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f'Extração em andamento não terminou em {timeout}s')
+            if call.error is not None:
+                remaining = None if timeout is None else timeout - (time.monotonic() - started)
+                retry = isinstance(call.error, (*_CALLER_DEADLINE_ERRORS, asyncio.CancelledError))
+                if retry and (remaining is None or remaining > 0):
+                    # Terminou o prazo do líder (ou o cliente dele desistiu): tenta de novo
+                    return await self.do_async(key, fn, recheck, remaining)
+                if isinstance(call.error, asyncio.CancelledError):
+                    raise TimeoutError(f'Extração em andamento não terminou em {timeout}s')
+                raise call.error
+            return call.result
+
+        call = _AsyncCall()
+        self._async_calls[key] = call
+        record_singleflight_metrics('executed')
+        try:
+            call.result = await self._run_async(key, fn, recheck, timeout)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            del self._async_calls[key]
+            call.event.set()
+
+    async def _run_async(self, key: str, fn: Callable[[], Awaitable[Any]],
+                         recheck: Optional[Callable[[], Any]], timeout: Optional[float] = None) -> Any:
+        """Como _run, esperando o lock entre processos com asyncio.sleep"""
+        backend = self.cache.backend if self.cache is not None else None
+        if not self.process_lock or backend is None or not backend.supports_locks:
+            return await fn()
+
+        caller_bound = timeout is not None and timeout < self.lock_timeout
+        deadline = time.monotonic() + (timeout if caller_bound else self.lock_timeout)
+        waited = False
+        while True:
+            token = backend.acquire_lock(key, self.lock_timeout)
+            if token is not None:
+                try:
+                    if waited and recheck is not None:
+                        result = recheck()
+                        if result is not None:
+                            return result
+                    return await fn()
+                finally:
+                    backend.release_lock(key, token)
+
+            if not waited:
+                waited = True
+                with self._lock:
+                    self.coalesced_process += 1
+                record_singleflight_metrics('coalesced_process')
+
+            if recheck is not None:
+                result = recheck()
+                if result is not None:
+                    return result
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                if caller_bound:
+                    raise TimeoutError(f'Extração em outro processo não terminou em {timeout}s')
+                return await fn()
+            await asyncio.sleep(min(self.poll_interval, remaining))
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores de execuções e de requisições agrupadas"""
+        with self._lock:
+            return {
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'coalesced_process': self.coalesced_process,
+                'in_flight': len(self._calls) + len(self._async_calls)
+            }
@@ -0,0 +1,377 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Jobs que ainda não terminaram (na fila, baixando ou sendo cancelados)
+ACTIVE_STATUSES = ('queued', 'downloading', 'cancelling')
+
+# Heartbeats perdidos antes de um dono ser considerado morto
+MISSED_HEARTBEATS = 5
+
+_JOB_FIELDS = ('url', 'video_id', 'format', 'format_id', 'quality', 'priority',
+               'status', 'filename', 'download_name', 'error', 'start_time')
+
+class TaskStore:
+    """
+    Registro persistente dos downloads, compartilhado entre os workers
+
+    Jobs (um por download real) e tarefas (um por pedido de cliente) ficam
+    em um SQLite em modo WAL: qualquer worker do gunicorn responde ao status
+    de qualquer tarefa, e as leituras não esperam pelas escritas. Mudanças de
+    status são gravadas na hora; o progresso, atualizado a cada bloco, fica
+    em memória e é gravado em lote a cada `flush_interval` segundos.
+
+    Cada processo tem um dono (host:pid:nonce) com heartbeat. Jobs ativos
+    cujo dono parou de dar sinal (reinício, worker morto) por
+    `orphan_timeout` segundos, e por no mínimo MISSED_HEARTBEATS
+    intervalos, são assumidos por outro processo e retomados.
+    """
+
+    def __init__(self, path: Optional[str] = None, flush_interval: float = 1.0,
+                 orphan_timeout: float = 30):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.orphan_timeout = orphan_timeout
+        self._local = threading.local()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._on_tick: Optional[Callable[[], None]] = None
+        self._owner = None
+        self._owner_pid = None
+
+    def init_app(self, app) -> None:
+        """Aplica DOWNLOAD_TASK_DB, DOWNLOAD_PROGRESS_FLUSH_INTERVAL e DOWNLOAD_ORPHAN_TIMEOUT"""
+        path = app.config.get('DOWNLOAD_TASK_DB') or os.path.join(
+            app.config['DOWNLOAD_DIR'], 'tasks.sqlite3')
+        self.flush_interval = app.config.get('DOWNLOAD_PROGRESS_FLUSH_INTERVAL', self.flush_interval)
+        self.orphan_timeout = app.config.get('DOWNLOAD_ORPHAN_TIMEOUT', self.orphan_timeout)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('BEGIN IMMEDIATE')
+            self._create_schema(conn)
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        # Só troca de arquivo com o esquema pronto: a thread de sincronização
+        # pode já estar rodando
+        self.path = path
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection) -> None:
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'job_id TEXT PRIMARY KEY, url TEXT NOT NULL, video_id TEXT NOT NULL, '
+            'format TEXT NOT NULL, format_id TEXT, quality TEXT, priority TEXT NOT NULL, '
+            'status TEXT NOT NULL, progress TEXT, filename TEXT, download_name TEXT, '
+            'error TEXT, start_time REAL NOT NULL, queue_position INTEGER, owner TEXT, '
+            'cancel_requested INTEGER NOT NULL DEFAULT 0)'
+        )
+        # Deduplicação entre workers: um único job ativo por (vídeo, formato)
+        conn.execute(
+            'CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_key ON jobs (video_id, format) '
+            "WHERE status IN ('queued', 'downloading') AND cancel_requested = 0"
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, status)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS tasks ('
+            'task_id TEXT PRIMARY KEY, job_id TEXT NOT NULL, start_time REAL NOT NULL, status TEXT)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS tasks_job ON tasks (job_id)')
+        conn.execute('CREATE TABLE IF NOT EXISTS workers (owner TEXT PRIMARY KEY, last_seen REAL NOT NULL)')
+
+    @property
+    def owner(self) -> str:
+        """Identificador deste processo (muda após um fork)"""
+        pid = os.getpid()
+        if self._owner_pid != pid:
+            self._owner = f'{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:8]}'
+            self._owner_pid = pid
+        return self._owner
+
+    def _conn(self) -> sqlite3.Connection:
+        """Conexão com o banco (uma por thread e por processo)"""
+        conn = getattr(self._local, 'conn', None)
+        # Reabre após um fork ou se init_app apontou para outro arquivo
+        if conn is None or self._local.pid != os.getpid() or self._local.path != self.path:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.path = self.path
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    @staticmethod
+    def _job_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job['progress'] = json.loads(job['progress']) if job.get('progress') else {}
+        return job
+
+    # Thread de sincronização
+
+    def start(self, on_tick: Optional[Callable[[], None]] = None) -> None:
+        """
+        Inicia a thread que grava o progresso, o heartbeat e chama `on_tick`
+
+        Também é chamada pelas rotas: após um fork a thread não existe no
+        processo filho e é recriada no primeiro uso.
+        """
+        if on_tick is not None:
+            self._on_tick = on_tick
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='task-store', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            # O heartbeat vem primeiro e não depende do flush: sem ele, outro
+            # processo assumiria (e baixaria de novo) jobs que ainda rodam aqui
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print(f"Error writing download worker heartbeat: {str(e)}")
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing download progress: {str(e)}")
+            try:
+                if self._on_tick is not None:
+                    self._on_tick()
+            except Exception as e:
+                print(f"Error syncing download tasks: {str(e)}")
+            time.sleep(self.flush_interval)
+
+    def heartbeat(self) -> None:
+        now = time.time()
+        conn = self._conn()
+        self._touch(conn, now)
+        conn.execute('DELETE FROM workers WHERE last_seen < ?', (now - 24 * 3600,))
+
+    def _touch(self, conn: sqlite3.Connection, now: float) -> None:
+        # Também na mesma transação em que o processo assume um job: antes do
+        # primeiro heartbeat, outro processo o tomaria por órfão
+        conn.execute('INSERT OR REPLACE INTO workers (owner, last_seen) VALUES (?, ?)', (self.owner, now))
+
+    # Progresso em lote
+
+    def set_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        """
+        Registra o progresso de um job (gravado no próximo flush)
+
+        Chamado a cada bloco baixado: não acessa o banco nem usa lock. Uma
+        atualização que chegue durante a troca do buffer pode se perder, mas
+        a seguinte a substitui.
+        """
+        self._pending[job_id] = progress
+
+    def flush(self) -> None:
+        """Grava de uma vez o progresso acumulado"""
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            with self._transaction() as conn:
+                conn.executemany(
+                    'UPDATE jobs SET progress = ? WHERE job_id = ?',
+                    [(json.dumps(progress), job_id) for job_id, progress in pending.items()]
+                )
+        except Exception:
+            # Banco ocupado: devolve ao buffer o que não foi substituído
+            for job_id, progress in pending.items():
+                self._pending.setdefault(job_id, progress)
+            raise
+
+    def set_queue_positions(self, positions: Dict[str, int]) -> None:
+        """Publica a posição na fila dos jobs deste processo para os demais workers"""
+        if not positions:
+            return
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE jobs SET queue_position = ? WHERE job_id = ? AND status = 'queued'",
+                [(position, job_id) for job_id, position in positions.items()]
+            )
+
+    # Jobs e tarefas
+
+    def open_task(self, task_id: str, job: Dict[str, Any]) -> Tuple[str, bool]:
+        """
+        Registra uma tarefa, ligando-a ao job ativo do mesmo vídeo e formato
+
+        Se não houver job ativo, `job` (com 'job_id') é criado com este
+        processo como dono.
+
+        Returns:
+            tuple: (job_id, True se o job foi criado)
+        """
+        self.start()
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT job_id FROM jobs WHERE video_id = ? AND format = ? "
+                "AND status IN ('queued', 'downloading') AND cancel_requested = 0",
+                (job['video_id'], job['format'])
+            ).fetchone()
+            created = row is None
+            job_id = job['job_id'] if created else row['job_id']
+            if created:
+                conn.execute(
+                    f"INSERT INTO jobs (job_id, {', '.join(_JOB_FIELDS)}, owner) "
+                    f"VALUES (?, {', '.join('?' for _ in _JOB_FIELDS)}, ?)",
+                    (job_id, *(job.get(field) for field in _JOB_FIELDS), self.owner)
+                )
+                self._touch(conn, now)
+            conn.execute('INSERT INTO tasks (task_id, job_id, start_time) VALUES (?, ?, ?)',
+                         (task_id, job_id, now))
+        return job_id, created
+
+    def delete_job(self, job_id: str) -> None:
+        """Desfaz um job que não chegou a entrar na fila"""
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM tasks WHERE job_id = ?', (job_id,))
+            conn.execute('DELETE FROM jobs WHERE job_id = ?', (job_id,))
+
+    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Tarefa com os dados do seu job, ou None"""
+        self.start()
+        row = self._conn().execute(
+            'SELECT j.*, t.task_id, t.status AS task_status, '
+            '(SELECT COUNT(*) FROM tasks s WHERE s.job_id = j.job_id AND s.status IS NULL) AS shared_by '
+            'FROM tasks t JOIN jobs j ON j.job_id = t.job_id WHERE t.task_id = ?', (task_id,)
+        ).fetchone()
+        return self._job_dict(row) if row else None
+
+    def set_status(self, job_id: str, status: str, from_statuses: Tuple[str, ...] = ACTIVE_STATUSES) -> bool:
+        """Muda o status de um job que ainda está em um de `from_statuses`"""
+        cursor = self._conn().execute(
+            f"UPDATE jobs SET status = ? WHERE job_id = ? "
+            f"AND status IN ({', '.join('?' for _ in from_statuses)})",
+            (status, job_id, *from_statuses)
+        )
+        return cursor.rowcount > 0
+
+    def finish_job(self, job_id: str, status: str, error: Optional[str] = None,
+                   stored: Optional[Dict[str, Any]] = None) -> List[str]:
+        """
+        Encerra um job
+
+        Returns:
+            list: Tarefas ligadas ao job no encerramento (recebem o arquivo)
+        """
+        progress = self._pending.pop(job_id, None)
+        with self._transaction() as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, error = ?, filename = COALESCE(?, filename), '
+                'download_name = COALESCE(?, download_name), progress = COALESCE(?, progress), '
+                'queue_position = NULL WHERE job_id = ?',
+                (status, error, stored and stored['path'], stored and stored['name'],
+                 json.dumps(progress) if progress else None, job_id)
+            )
+            rows = conn.execute('SELECT task_id FROM tasks WHERE job_id = ? AND status IS NULL',
+                                (job_id,)).fetchall()
+        return [row['task_id'] for row in rows]
+
+    def detach_task(self, task_id: str) -> Optional[int]:
+        """
+        Cancela uma tarefa, desligando-a do seu job
+
+        Se era a última tarefa do job, o job é marcado para cancelamento
+        (o dono o interrompe).
+
+        Returns:
+            int: Tarefas que continuam no job, ou None se não pode ser cancelada
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT t.job_id, t.status AS task_status, j.status FROM tasks t '
+                'JOIN jobs j ON j.job_id = t.job_id WHERE t.task_id = ?', (task_id,)
+            ).fetchone()
+            if row is None or row['task_status'] or row['status'] not in ('queued', 'downloading'):
+                return None
+            conn.execute("UPDATE tasks SET status = 'cancelled' WHERE task_id = ?", (task_id,))
+            remaining = conn.execute('SELECT COUNT(*) FROM tasks WHERE job_id = ? AND status IS NULL',
+                                     (row['job_id'],)).fetchone()[0]
+            if remaining == 0:
+                conn.execute('UPDATE jobs SET cancel_requested = 1 WHERE job_id = ?', (row['job_id'],))
+        return remaining
+
+    def cancel_requests(self) -> List[str]:
+        """Jobs deste processo com cancelamento pedido (por qualquer worker)"""
+        rows = self._conn().execute(
+            "SELECT job_id FROM jobs WHERE owner = ? AND cancel_requested = 1 "
+            "AND status IN ('queued', 'downloading')", (self.owner,)
+        ).fetchall()
+        return [row['job_id'] for row in rows]
+
+    def claim_orphans(self) -> List[Dict[str, Any]]:
+        """
+        Assume os jobs ativos cujo dono parou de dar sinal
+
+        Returns:
+            list: Jobs assumidos, a retomar ou encerrar
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                f"SELECT * FROM jobs WHERE status IN ({', '.join('?' for _ in ACTIVE_STATUSES)}) "
+                'AND (owner IS NULL OR owner NOT IN (SELECT owner FROM workers WHERE last_seen >= ?))',
+                (*ACTIVE_STATUSES, now - self.orphan_after())
+            ).fetchall()
+            conn.executemany('UPDATE jobs SET owner = ? WHERE job_id = ?',
+                             [(self.owner, row['job_id']) for row in rows])
+            if rows:
+                self._touch(conn, now)
+        return [self._job_dict(row) for row in rows]
+
+    def orphan_after(self) -> float:
+        """Segundos sem heartbeat para um dono ser considerado morto"""
+        return max(self.orphan_timeout, MISSED_HEARTBEATS * self.flush_interval)
+
+    def release_job(self, job_id: str) -> None:
+        """Devolve um job assumido para ser retomado depois (ex: fila cheia)"""
+        self._conn().execute('UPDATE jobs SET owner = NULL WHERE job_id = ?', (job_id,))
+
+    def expire_tasks(self, max_age: float) -> List[str]:
+        """
+        Remove tarefas de jobs encerrados com mais de `max_age` segundos e os
+        jobs que ficaram sem tarefas
+
+        Returns:
+            list: Tarefas removidas
+        """
+        with self._transaction() as conn:
+            rows = conn.execute(
+                f"SELECT t.task_id FROM tasks t JOIN jobs j ON j.job_id = t.job_id "
+                f"WHERE t.start_time < ? AND j.status NOT IN ({', '.join('?' for _ in ACTIVE_STATUSES)})",
+                (time.time() - max_age, *ACTIVE_STATUSES)
+            ).fetchall()
+            conn.executemany('DELETE FROM tasks WHERE task_id = ?', [(row['task_id'],) for row in rows])
+            conn.execute(
+                f"DELETE FROM jobs WHERE status NOT IN ({', '.join('?' for _ in ACTIVE_STATUSES)}) "
+                'AND NOT EXISTS (SELECT 1 FROM tasks WHERE tasks.job_id = jobs.job_id)',
+                ACTIVE_STATUSES
+            )
+        return [row['task_id'] for row in rows]
+
+task_store = TaskStore()
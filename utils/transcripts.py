@@ -0,0 +1,207 @@
+import json
+import re
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import requests
+
+from utils.cache_manager import CacheableError
+
+# Formatos de legenda que sabemos interpretar, em ordem de preferência
+TRACK_FORMATS = ('json3', 'vtt')
+
+_VTT_TIMING_RE = re.compile(r'((?:\d+:)?\d{1,2}:\d{2}\.\d{3})\s+-->\s+((?:\d+:)?\d{1,2}:\d{2}\.\d{3})')
+_VTT_TAG_RE = re.compile(r'<[^>]*>')
+
+def choose_track(tracks: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Escolhe a faixa de legenda (entrada de subtitles[lang]) no formato preferido"""
+    by_ext = {t.get('ext'): t for t in tracks if t.get('url')}
+    for ext in TRACK_FORMATS:
+        if ext in by_ext:
+            return by_ext[ext]
+    return None
+
+def _iter_lines(chunks: Iterable[str]) -> Iterator[str]:
+    buffer = ''
+    for chunk in chunks:
+        buffer += chunk
+        lines = buffer.split('\n')
+        buffer = lines.pop()
+        for line in lines:
+            yield line.rstrip('\r')
+    if buffer:
+        yield buffer.rstrip('\r')
+
+def _vtt_time_ms(value: str) -> int:
+    parts = value.split(':')
+    seconds = float(parts[-1])
+    minutes = int(parts[-2])
+    hours = int(parts[-3]) if len(parts) == 3 else 0
+    return int(round((hours * 3600 + minutes * 60 + seconds) * 1000))
+
+def parse_vtt(chunks: Iterable[str]) -> Iterator[Tuple[int, int, str]]:
+    """
+    Interpreta um WebVTT à medida que os dados chegam
+
+    As legendas automáticas do YouTube repetem a linha anterior em cada
+    cue (texto "rolante"); linhas repetidas são descartadas.
+    """
+    start = end = None
+    text_lines: List[str] = []
+    last_line = None
+
+    def flush():
+        nonlocal last_line
+        new_lines = []
+        for line in text_lines:
+            if line and line != last_line:
+                new_lines.append(line)
+                last_line = line
+        return ' '.join(new_lines)
+
+    for line in _iter_lines(chunks):
+        match = _VTT_TIMING_RE.search(line)
+        if match:
+            start, end = _vtt_time_ms(match.group(1)), _vtt_time_ms(match.group(2))
+            text_lines = []
+        elif start is not None:
+            if line.strip():
+                text_lines.append(_VTT_TAG_RE.sub('', line).strip())
+            else:
+                text = flush()
+                if text:
+                    yield start, end, text
+                start = None
+    if start is not None:
+        text = flush()
+        if text:
+            yield start, end, text
+
+def _iter_json3_events(chunks: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Percorre o array "events" de um json3 sem carregar o documento inteiro"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    in_events = False
+    for chunk in chunks:
+        buffer += chunk
+        if not in_events:
+            key = buffer.find('"events"')
+            bracket = buffer.find('[', key) if key >= 0 else -1
+            if bracket < 0:
+                continue
+            buffer = buffer[bracket + 1:]
+            in_events = True
+
+        while True:
+            buffer = buffer.lstrip(' \t\r\n,')
+            if not buffer:
+                break
+            if buffer[0] == ']':
+                return
+            try:
+                event, end = decoder.raw_decode(buffer)
+            except ValueError:
+                # Evento incompleto: espera o próximo bloco
+                break
+            yield event
+            buffer = buffer[end:]
+
+def parse_json3(chunks: Iterable[str]) -> Iterator[Tuple[int, int, str]]:
+    """Interpreta o formato json3 do YouTube à medida que os dados chegam"""
+    for event in _iter_json3_events(chunks):
+        segs = event.get('segs')
+        if not segs or 'tStartMs' not in event:
+            continue
+        text = ''.join(seg.get('utf8', '') for seg in segs).replace('\n', ' ').strip()
+        if not text:
+            continue
+        start = int(event['tStartMs'])
+        yield start, start + int(event.get('dDurationMs', 0)), text
+
+PARSERS = {'json3': parse_json3, 'vtt': parse_vtt}
+
+def build_index(segments: Iterable[Tuple[int, int, str]]) -> Dict[str, Any]:
+    """
+    Monta o índice compacto de uma transcrição
+
+    Em vez de uma lista de objetos, guarda arrays paralelos (início e fim em
+    milissegundos) e um único texto; o texto do segmento i é
+    text[offsets[i]:offsets[i + 1]]. Os segmentos ficam ordenados pelo
+    início, para as buscas por intervalo. Como os segmentos podem se
+    sobrepor (legendas automáticas), reach[i] guarda o maior fim entre os
+    segmentos 0..i: é crescente e permite a busca binária pelo primeiro
+    segmento que ainda pode estar em andamento.
+    """
+    ordered = sorted(segments, key=lambda s: s[0])
+    starts, ends, reach, offsets, parts = [], [], [], [0], []
+    for start, end, text in ordered:
+        end = max(start, end)
+        starts.append(start)
+        ends.append(end)
+        reach.append(max(end, reach[-1]) if reach else end)
+        parts.append(text)
+        offsets.append(offsets[-1] + len(text))
+    return {'starts': starts, 'ends': ends, 'reach': reach, 'offsets': offsets, 'text': ''.join(parts)}
+
+def fetch_transcript(track: Dict[str, Any], timeout: float = 30) -> Dict[str, Any]:
+    """
+    Baixa e interpreta uma faixa de legenda em streaming
+
+    Raises:
+        CacheableError: Se o download da faixa falhar (502)
+    """
+    parser = PARSERS[track['ext']]
+    try:
+        with requests.get(track['url'], stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            response.encoding = 'utf-8'
+            return build_index(parser(response.iter_content(chunk_size=16384, decode_unicode=True)))
+    except requests.RequestException as e:
+        print(f"Error fetching transcript track: {str(e)}")
+        raise CacheableError('transient', 'Falha ao obter a faixa de legenda', 502)
+
+def select_range(index: Dict[str, Any], start: Optional[float] = None,
+                 end: Optional[float] = None) -> List[int]:
+    """
+    Segmentos que se sobrepõem a [start, end) (em segundos), por busca binária
+
+    Retorna as posições no índice, em ordem.
+    """
+    starts, ends = index['starts'], index['ends']
+    last = len(starts)
+    if end is not None:
+        last = bisect_left(starts, round(end * 1000))
+    if start is None:
+        return list(range(last))
+
+    start_ms = round(start * 1000)
+    # Antes de `first`, todos os segmentos terminam até `start`
+    first = bisect_right(index['reach'], start_ms)
+    # Entre first e last, um segmento curto pode ter terminado antes de `start`
+    return [i for i in range(first, last) if ends[i] > start_ms or starts[i] >= start_ms]
+
+def segment_text(index: Dict[str, Any], i: int) -> str:
+    return index['text'][index['offsets'][i]:index['offsets'][i + 1]]
+
+def to_segments(index: Dict[str, Any], positions: List[int]) -> List[Dict[str, Any]]:
+    return [{
+        'start': index['starts'][i] / 1000,
+        'end': index['ends'][i] / 1000,
+        'text': segment_text(index, i)
+    } for i in positions]
+
+def to_text(index: Dict[str, Any], positions: List[int]) -> str:
+    return '\n'.join(segment_text(index, i) for i in positions)
+
+def _srt_time(ms: int) -> str:
+    hours, ms = divmod(ms, 3600000)
+    minutes, ms = divmod(ms, 60000)
+    seconds, ms = divmod(ms, 1000)
+    return f'{hours:02d}:{minutes:02d}:{seconds:02d},{ms:03d}'
+
+def to_srt(index: Dict[str, Any], positions: List[int]) -> str:
+    blocks = []
+    for number, i in enumerate(positions, 1):
+        blocks.append(f"{number}\n{_srt_time(index['starts'][i])} --> {_srt_time(index['ends'][i])}\n"
+                      f"{segment_text(index, i)}\n")
+    return '\n'.join(blocks)
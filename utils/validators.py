@@ -1,5 +1,12 @@
 import re
-from urllib.parse import urlparse
+from urllib.parse import urlparse, parse_qs
+
+VIDEO_ID_REGEX = re.compile(r'[A-Za-z0-9_-]{11}')
+
+YOUTUBE_HOSTS = (
+    'youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com',
+    'youtube-nocookie.com', 'www.youtube-nocookie.com'
+)
 
 def validate_url(url):
     """
@@ -19,7 +26,7 @@ def validate_url(url):
             
         # Verifica se é uma URL do YouTube
         youtube_regex = (
-            r'(https?://)?(www\.)?'
+            r'(https?://)?(www\.|m\.|music\.)?'
             r'(youtube|youtu|youtube-nocookie)\.(com|be)/'
             r'(watch\?v=|embed/|v/|.+\?v=)?([^&=%\?]{11})'
         )
@@ -60,3 +67,57 @@ def validate_quality(quality):
         return height in [144, 240, 360, 480, 720, 1080, 1440, 2160]
     except:
         return False
+
+def validate_video_id(video_id):
+    """
+    Valida se o texto é um ID de vídeo do YouTube (11 caracteres)
+    
+    Args:
+        video_id (str): ID para validar
+        
+    Returns:
+        bool: True se o ID é válido, False caso contrário
+    """
+    # fullmatch: com match e '$', um ID seguido de '\n' seria aceito
+    return bool(video_id) and VIDEO_ID_REGEX.fullmatch(video_id) is not None
+
+def extract_video_id(url):
+    """
+    Resolve qualquer URL de vídeo aceita (ou um ID puro) para o ID do vídeo
+    
+    Reconhece watch?v=, youtu.be/, embed/, v/, shorts/ e live/, com ou sem
+    www/m/music e parâmetros extras como t= ou list=.
+    
+    Args:
+        url (str): URL ou ID do vídeo
+        
+    Returns:
+        str: ID do vídeo, ou None se a URL não apontar para um vídeo
+    """
+    if not url:
+        return None
+    if validate_video_id(url):
+        return url
+
+    try:
+        result = urlparse(url if '://' in url else f'https://{url}')
+    except ValueError:
+        return None
+
+    host = (result.hostname or '').lower()
+    path_parts = [p for p in result.path.split('/') if p]
+
+    candidate = None
+    if host in ('youtu.be', 'www.youtu.be'):
+        candidate = path_parts[0] if path_parts else None
+    elif host in YOUTUBE_HOSTS:
+        if result.path == '/watch':
+            candidate = parse_qs(result.query).get('v', [None])[0]
+        elif len(path_parts) >= 2 and path_parts[0] in ('embed', 'v', 'shorts', 'live', 'e'):
+            candidate = path_parts[1]
+
+    return candidate if validate_video_id(candidate) else None
+
+def canonical_video_url(video_id):
+    """Retorna a URL canônica de um vídeo a partir do seu ID"""
+    return f'https://www.youtube.com/watch?v={video_id}'
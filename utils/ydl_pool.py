@@ -0,0 +1,220 @@
+import copy
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+import yt_dlp
+from config import Config
+from utils.ytdl_cache import InstrumentedCache
+
+# Opções que variam por chamada (formato, destino, User-Agent): ficam fora da
+# chave do pool e são aplicadas à instância no checkout
+PER_CALL_OPTIONS = ('format', 'outtmpl', 'paths', 'http_headers')
+
+class _PooledYDL:
+    """YoutubeDL reutilizável com o estado inicial necessário para o reset"""
+
+    def __init__(self, options: Dict[str, Any]):
+        self.ydl = yt_dlp.YoutubeDL(options)
+        self.ydl.cache = InstrumentedCache(self.ydl)
+        self.uses = 0
+        self.last_used = time.monotonic()
+        self._base_params = dict(self.ydl.params)
+        self._base_format_selector = self.ydl.format_selector
+        self._base_progress_hooks = list(self.ydl._progress_hooks)
+        self._base_postprocessor_hooks = list(self.ydl._postprocessor_hooks)
+        self._base_post_hooks = list(self.ydl._post_hooks)
+
+    def reset(self) -> None:
+        """Desfaz o que um uso pode ter alterado (hooks, params e contadores)"""
+        ydl = self.ydl
+        # Mantém a identidade do dict: extratores e downloaders leem ydl.params
+        ydl.params.clear()
+        ydl.params.update(self._base_params)
+        ydl._progress_hooks[:] = self._base_progress_hooks
+        ydl._postprocessor_hooks[:] = self._base_postprocessor_hooks
+        ydl._post_hooks[:] = self._base_post_hooks
+        ydl.format_selector = self._base_format_selector
+        ydl._download_retcode = 0
+        ydl._num_downloads = 0
+        ydl._printed_messages.clear()
+
+    def apply(self, options: Dict[str, Any]) -> None:
+        """Aplica as opções por chamada (PER_CALL_OPTIONS); o reset as desfaz"""
+        params = self.ydl.params
+        if options.get('format'):
+            params['format'] = options['format']
+            # O seletor é compilado no construtor do YoutubeDL
+            self.ydl.format_selector = self.ydl.build_format_selector(options['format'])
+        if options.get('outtmpl'):
+            outtmpl = options['outtmpl']
+            params['outtmpl'] = dict(params['outtmpl'], **(outtmpl if isinstance(outtmpl, dict) else {'default': outtmpl}))
+        if options.get('paths'):
+            params['paths'] = dict(options['paths'])
+        if options.get('http_headers'):
+            # Cópia: os cabeçalhos padrão da instância continuam valendo
+            headers = copy.copy(params['http_headers'])
+            headers.update(options['http_headers'])
+            params['http_headers'] = headers
+
+    def close(self) -> None:
+        try:
+            self.ydl.close()
+        except Exception as e:
+            print(f"Erro ao fechar YoutubeDL: {str(e)}")
+
+class YoutubeDLPool:
+    """
+    Pool de instâncias yt_dlp.YoutubeDL pré-construídas, por perfil de opções
+
+    Construir um YoutubeDL inicializa extratores, cookie jar, opener e
+    conexões HTTP; reutilizar a instância evita esse custo por requisição.
+    Cada instância é usada por uma thread de cada vez (checkout/devolução),
+    tem o estado resetado ao voltar para o pool e é descartada se o uso
+    falhar ou após `max_uses` usos. Com o pool cheio, a instância ociosa
+    usada há mais tempo (de outro perfil) dá lugar ao novo perfil.
+    """
+
+    def __init__(self, max_idle_per_profile: int = 4, max_total: int = 32, max_uses: int = 200):
+        """
+        Args:
+            max_idle_per_profile: Instâncias ociosas mantidas por perfil
+            max_total: Instâncias vivas (ociosas + em uso) no pool; se todas
+                estiverem em uso, as instâncias extras são temporárias
+            max_uses: Usos antes de descartar a instância
+        """
+        self.max_idle_per_profile = max_idle_per_profile
+        self.max_total = max_total
+        self.max_uses = max_uses
+        self._idle: Dict[str, List[_PooledYDL]] = defaultdict(list)
+        self._total = 0
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    @staticmethod
+    def _profile_key(profile: str, options: Dict[str, Any]) -> str:
+        # Opções diferentes sob o mesmo nome não podem compartilhar instâncias
+        return f"{profile}:{json.dumps(options, sort_keys=True, default=repr)}"
+
+    def _evict_lru(self) -> _PooledYDL:
+        # Chamado com self._lock adquirido e ao menos uma instância ociosa
+        key = min((k for k, instances in self._idle.items() if instances),
+                  key=lambda k: self._idle[k][0].last_used)
+        victim = self._idle[key].pop(0)
+        if not self._idle[key]:
+            del self._idle[key]
+        self.evicted += 1
+        return victim
+
+    @contextmanager
+    def acquire(self, profile: str, options: Dict[str, Any]) -> Iterator[yt_dlp.YoutubeDL]:
+        """
+        Empresta um YoutubeDL construído com `options`
+
+        Hooks de progresso devem ser adicionados com ydl.add_progress_hook
+        depois do checkout, e não em `options`, para que a instância possa
+        ser reutilizada; o reset os remove na devolução. As opções em
+        PER_CALL_OPTIONS não entram na chave do perfil.
+
+        Args:
+            profile: Nome do perfil (ex: 'minimal', 'download')
+            options: Opções do yt-dlp para o perfil
+        """
+        base_options = {k: v for k, v in options.items() if k not in PER_CALL_OPTIONS}
+        key = self._profile_key(profile, base_options)
+        pooled = None
+        pooled_member = False
+        victim = None
+        with self._lock:
+            if self._idle.get(key):
+                pooled = self._idle[key].pop()
+                if not self._idle[key]:
+                    del self._idle[key]
+                pooled_member = True
+                self.reused += 1
+            elif self._total < self.max_total:
+                self._total += 1
+                pooled_member = True
+            elif self._idle:
+                # Pool cheio: a vaga da instância ociosa mais antiga passa a este perfil
+                victim = self._evict_lru()
+                pooled_member = True
+
+        if victim is not None:
+            victim.close()
+
+        if pooled is None:
+            try:
+                pooled = _PooledYDL(base_options)
+            except Exception:
+                if pooled_member:
+                    with self._lock:
+                        self._total -= 1
+                raise
+            with self._lock:
+                self.created += 1
+
+        healthy = False
+        try:
+            pooled.uses += 1
+            pooled.apply(options)
+            yield pooled.ydl
+            healthy = True
+        except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError,
+                yt_dlp.utils.DownloadCancelled):
+            # Vídeo indisponível, download cancelado etc.: a instância continua utilizável
+            healthy = True
+            raise
+        finally:
+            self._release(key, pooled, pooled_member and healthy)
+            if pooled_member and not healthy:
+                with self._lock:
+                    self._total -= 1
+
+    def _release(self, key: str, pooled: _PooledYDL, reusable: bool) -> None:
+        if reusable and pooled.uses < self.max_uses:
+            try:
+                pooled.reset()
+                pooled.last_used = time.monotonic()
+                with self._lock:
+                    if len(self._idle[key]) < self.max_idle_per_profile:
+                        self._idle[key].append(pooled)
+                        return
+            except Exception as e:
+                print(f"Erro ao resetar YoutubeDL: {str(e)}")
+
+        # Descartada: fecha conexões e libera a vaga no pool
+        if reusable:
+            with self._lock:
+                self._total -= 1
+        pooled.close()
+
+    def clear(self) -> None:
+        """Fecha todas as instâncias ociosas"""
+        with self._lock:
+            idle = [p for instances in self._idle.values() for p in instances]
+            self._idle.clear()
+            self._total -= len(idle)
+        for pooled in idle:
+            pooled.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'evicted': self.evicted,
+                'live': self._total,
+                'idle': sum(len(instances) for instances in self._idle.values())
+            }
+
+ydl_pool = YoutubeDLPool(
+    Config.YTDL_POOL_MAX_IDLE,
+    Config.YTDL_POOL_MAX_TOTAL,
+    Config.YTDL_POOL_MAX_USES
+)
@@ -0,0 +1,53 @@
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+from yt_dlp.cache import Cache
+
+from utils.metrics import record_ytdl_cache_lookup
+
+_MISS = object()
+_collector = threading.local()
+
+@contextmanager
+def collect_lookups() -> Iterator[Counter]:
+    """
+    Acumula as consultas ao cache feitas nesta thread, em vez de registrá-las
+
+    Usado no trabalho de extração: no modo 'process' ele roda em outro
+    processo, cujo registro Prometheus não é exportado. As contagens voltam
+    com o resultado e são registradas no processo da aplicação
+    (record_lookups).
+    """
+    lookups = Counter()
+    previous = getattr(_collector, 'lookups', None)
+    _collector.lookups = lookups
+    try:
+        yield lookups
+    finally:
+        _collector.lookups = previous
+
+def record_lookups(lookups: Dict[Tuple[str, bool], int]) -> None:
+    """Registra as contagens devolvidas por collect_lookups"""
+    for (section, hit), count in lookups.items():
+        record_ytdl_cache_lookup(section, hit, count)
+
+class InstrumentedCache(Cache):
+    """
+    Cache do yt-dlp que conta acertos e faltas por seção
+
+    O yt-dlp guarda no cachedir as funções de assinatura e nsig extraídas
+    do player; uma falta significa que o player será baixado e interpretado
+    novamente (busca fria). O armazenamento continua o do yt-dlp.
+    """
+
+    def load(self, section, key, dtype='json', default=None, **kwargs):
+        result = super().load(section, key, dtype, _MISS, **kwargs)
+        hit = result is not _MISS
+        lookups = getattr(_collector, 'lookups', None)
+        if lookups is not None:
+            lookups[(section, hit)] += 1
+        else:
+            record_ytdl_cache_lookup(section, hit)
+        return default if result is _MISS else result